@@ -16,6 +16,11 @@ import glob
 import pytesseract
 from PIL import Image, ImageEnhance
 import re
+import os
+import sys
+
+# この枚数を超える場合は、1ファイルのレポートの代わりにページ分割のレポートを生成
+PAGED_REPORT_THRESHOLD = 50
 
 # 日本語フォント設定
 if platform.system() == 'Darwin':  # macOS
@@ -478,6 +483,9 @@ class ProfessionalGraphReport:
     
     def generate_ultimate_professional_report(self):
         """究極のプロフェッショナルレポート生成"""
+        if len(self.results) > PAGED_REPORT_THRESHOLD:
+            return self.generate_paged_report()
+
         successful_results = [r for r in self.results if r['data_points_count'] > 0]
         
         html_content = f"""<!DOCTYPE html>
@@ -1798,6 +1806,65 @@ class ProfessionalGraphReport:
         print(f"🎨 プロフェッショナルレポート生成: {output_file}")
         return output_file
 
+    def generate_paged_report(self):
+        """ページ分割のレポート生成（枚数が多い場合向け、web_app の paged_report を使用）
+
+        結果は index_data.js に、画像は thumbs/ のサムネイルにして、ブラウザで1ページ分ずつ描画する。
+        """
+        sys.path.append(str(Path(__file__).resolve().parent.parent / 'web_app'))
+        from paged_report import write_paged_report
+
+        output_dir = f"reports/{self.report_timestamp}/html"
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        output_file = f"{output_dir}/index.html"
+
+        cards = []
+        for result in self.results:
+            stats = result['statistics']
+            machine_info = result['machine_info']
+            success = result['data_points_count'] > 0
+            card = {
+                'title': Path(result['image_path']).stem.replace('_graph_only', ''),
+                'image': os.path.relpath(result['output_path'], output_dir),
+                'image_file': result['output_path'],
+                'error': None if success else 'データ抽出に失敗しました',
+                'fields': [
+                    ('機種', machine_info.get('machine_name', '機種名不明'), ''),
+                    ('台番号', machine_info.get('machine_number', '') or '-', ''),
+                    ('検出色', result['detected_color'], ''),
+                ],
+                'sort': {},
+            }
+            if success:
+                card['fields'] += [
+                    ('最高値', f"{stats['max_value']:+,.0f}", 'positive'),
+                    ('最低値', f"{stats['min_value']:+,.0f}", 'negative'),
+                    ('最終値', f"{stats['current_value']:+,.0f}", 'positive' if stats['current_value'] > 0 else 'negative'),
+                ]
+                if 'first_hit_value' in stats:
+                    card['fields'].append(('初当たり', f"{stats['first_hit_value']:+,.0f}", ''))
+                card['sort'] = {'max_value': stats['max_value'], 'min_value': stats['min_value'],
+                                'final_value': stats['current_value']}
+            cards.append(card)
+
+        successful_results = [r for r in self.results if r['data_points_count'] > 0]
+        summary = [('分析画像数', f"{len(self.results)}", ''), ('データ抽出成功', f"{len(successful_results)}", '')]
+        if successful_results:
+            final_values = [r['statistics']['current_value'] for r in successful_results]
+            total = sum(final_values)
+            summary += [
+                ('最終収支合計', f"{total:+,.0f}", 'positive' if total > 0 else 'negative'),
+                ('プラス台数', f"{sum(1 for v in final_values if v > 0)}", 'positive'),
+                ('最高値', f"{max(r['statistics']['max_value'] for r in successful_results):+,.0f}", 'positive'),
+                ('最低値', f"{min(r['statistics']['min_value'] for r in successful_results):+,.0f}", 'negative'),
+            ]
+
+        write_paged_report(output_file, cards, summary,
+                           title='パチンコグラフ分析レポート - Professional Edition',
+                           subtitle=datetime.now().strftime('%Y年%m月%d日 %H:%M'))
+        print(f"🎨 プロフェッショナルレポート生成（ページ分割）: {output_file}")
+        return output_file
+
 if __name__ == "__main__":
     analyzer = ProfessionalGraphReport()
     
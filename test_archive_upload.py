@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+アーカイブのアップロード（archive_upload.py）のテスト
+ZIP・tar.gzの画像を1枚ずつ取り出すこと、読めない画像・アーカイブが
+例外ではなく読み込めないファイルとして扱われることを確認する
+"""
+
+import sys
+import os
+import io
+import gzip
+import tarfile
+import zipfile
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from archive_upload import is_archive, count_uploads, iter_uploads, load_upload_array
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'graphs', 'original')
+SAMPLES = ['IMG_0162.PNG', 'S__78209160.jpg']
+
+
+def named_bytes(name, data):
+    """st.file_uploader の UploadedFile の代わり（name と getvalue() を持つ）"""
+    upload = io.BytesIO(data)
+    upload.name = name
+    return upload
+
+
+def sample_bytes(name):
+    with open(os.path.join(SAMPLE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def test_zip_and_tar_gz():
+    """ZIP・tar.gzから画像だけを取り出し、元のファイルと同じ画素に読み込むこと"""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w') as zf:
+        for name in SAMPLES:
+            zf.writestr(f"shots/{name}", sample_bytes(name))
+        zf.writestr('shots/memo.txt', 'メモ')
+        zf.writestr('__MACOSX/shots/._IMG_0162.PNG', b'\0' * 10)
+
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode='w:gz') as tf:
+        for name in SAMPLES:
+            data = sample_bytes(name)
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+    uploads = [named_bytes('shots.zip', zip_buffer.getvalue()), named_bytes('shots.tar.gz', tar_buffer.getvalue())]
+    assert all(is_archive(upload.name) for upload in uploads)
+    assert count_uploads(uploads) == 4
+
+    unreadable_files = []
+    images = list(iter_uploads(uploads, unreadable_files))
+    assert [os.path.basename(image.name) for image in images] == SAMPLES * 2
+    assert not unreadable_files
+    for image in images:
+        expected = cv2.cvtColor(cv2.imread(os.path.join(SAMPLE_DIR, os.path.basename(image.name))),
+                                cv2.COLOR_BGR2RGB)
+        assert np.array_equal(load_upload_array(image), expected)
+
+
+def test_unreadable_uploads():
+    """tarでない .gz と壊れた画像は例外にせず、読み込めないファイルとして扱うこと"""
+    bare_gz = named_bytes('shots.gz', gzip.compress(sample_bytes('IMG_0162.PNG')))
+    broken = named_bytes('broken.png', b'not an image')
+    assert is_archive(bare_gz.name) and not is_archive(broken.name)
+    assert count_uploads([bare_gz]) == 0
+
+    unreadable_files = []
+    images = list(iter_uploads([bare_gz, broken], unreadable_files))
+    assert images == [broken]
+    assert unreadable_files == ['shots.gz']
+    assert load_upload_array(broken) is None
+
+
+if __name__ == "__main__":
+    test_zip_and_tar_gz()
+    test_unreadable_uploads()
+    print("✅ アーカイブのアップロードのテスト完了")
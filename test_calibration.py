@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+バッチ自動キャリブレーション（calibration.py）のテスト
+既知の±30,000ラインの間隔から作った計測結果で調整値が求まること、
+1回の計測からの予測が調整値ごとの抽出と一致することを確認する
+"""
+
+import sys
+import os
+
+import cv2
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from calibration import measure_calibration_sample, predict_max, solve_calibration, apply_calibration
+from graph_detection import detect_graph_layout, linear_scale
+from web_analyzer import WebCompatibleAnalyzer
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'graphs', 'original')
+
+# calibration.py の main と同じ既定の設定
+SETTINGS = {
+    'search_start_offset': 50,
+    'search_end_offset': 500,
+    'crop_top': 246,
+    'crop_bottom': 280,
+    'left_margin': 120,
+    'right_margin': 120,
+    'grid_30k_offset': 5,
+    'grid_minus_30k_offset': -20,
+}
+
+# 合成する計測結果の切り抜き高さと、正しい±30,000ラインの間隔（grid_minus_30k_offset - grid_30k_offset）
+CROP_HEIGHT = 526
+TRUE_SPREAD = -35
+
+
+def synthetic_sample(name, actual, zero_in_crop=250, true_spread=TRUE_SPREAD):
+    """正しい間隔のスケールで最大値が actual になる計測結果"""
+    scale = 60000 / (CROP_HEIGHT - 1 + true_spread)
+    return {
+        'image_name': name,
+        'zero_in_crop': zero_in_crop,
+        'crop_height': CROP_HEIGHT,
+        'max_x': 100,
+        'max_y_pixel': zero_in_crop - actual / scale,
+        'color': 'pink',
+        'override_zero': None,
+        'override_scale': None,
+    }
+
+
+def test_solve_recovers_grid_spread():
+    """正しい間隔が求まり（中心は現在の設定を保つ）、補正係数1.0で誤差が丸めの範囲に収まること"""
+    actual = [2400, 5130, 8800, 12050, 19990]
+    samples = [synthetic_sample(f"img{i}", value, zero_in_crop=240 + 5 * i) for i, value in enumerate(actual)]
+    solution = solve_calibration(samples, actual, SETTINGS)
+
+    assert solution['grid_minus_30k_offset'] - solution['grid_30k_offset'] == TRUE_SPREAD
+    center = (SETTINGS['grid_30k_offset'] + SETTINGS['grid_minus_30k_offset']) / 2
+    assert abs((solution['grid_30k_offset'] + solution['grid_minus_30k_offset']) / 2 - center) <= 0.5
+    assert solution['correction_factor'] == 1.0
+    assert solution['max_abs_error'] <= 1
+    assert solution['samples_used'] == len(actual)
+    assert [row['actual'] for row in solution['per_image']] == actual
+
+    calibrated = apply_calibration(SETTINGS, solution)
+    assert calibrated['grid_30k_offset'] == solution['grid_30k_offset']
+    assert calibrated['correction_factor'] == solution['correction_factor']
+    assert SETTINGS['grid_30k_offset'] == 5
+
+
+def test_solve_skips_unusable_samples():
+    """未入力（0以下）・計測できない画像は使わず、上限に張り付いた画像とゼロライン再検出の画像はスケールの推定に使わないこと"""
+    actual = [3000, 9000, 15000]
+    samples = [synthetic_sample(f"img{i}", value) for i, value in enumerate(actual)]
+    # 上限（30,000玉）に張り付いた画像: ピクセル距離は上限より大きいが値は30,000
+    saturated = synthetic_sample('saturated', 36000)
+    # ゼロラインが再検出された画像: 別のスケールで値が決まる
+    overridden = dict(synthetic_sample('overridden', 7000), override_zero=260.0, override_scale=100.0)
+    overridden['max_y_pixel'] = 260.0 - 7000 / 100.0
+
+    solution = solve_calibration(samples + [saturated, overridden, None, synthetic_sample('blank', 5000)],
+                                 actual + [30000, 7000, 4000, 0], SETTINGS)
+    assert solution['grid_minus_30k_offset'] - solution['grid_30k_offset'] == TRUE_SPREAD
+    assert solution['samples_used'] == 5
+    predicted = {row['image_name']: row['predicted'] for row in solution['per_image']}
+    assert predicted['saturated'] == 30000
+    assert predicted['overridden'] == 7000
+
+    assert solve_calibration([None, synthetic_sample('blank', 5000)], [1000, 0], SETTINGS) is None
+
+
+def test_predict_max_clamps():
+    """予測値は±30,000で頭打ちにしてから補正係数を掛け、マイナスは0にすること"""
+    assert predict_max(synthetic_sample('high', 45000), 1, -34) == 30000
+    assert predict_max(synthetic_sample('high', 45000), 1, -34, correction_factor=1.1) == 33000
+    assert predict_max(synthetic_sample('low', -8000), 1, -34) == 0
+
+
+def test_measured_prediction_matches_extraction():
+    """1回の計測からの予測が、調整値ごとにスケールを変えて抽出した最大値と一致すること"""
+    for name in ['IMG_0173.PNG', 'IMG_0175.PNG', 'S__78209160.jpg']:
+        img_rgb = cv2.cvtColor(cv2.imread(os.path.join(SAMPLE_DIR, name)), cv2.COLOR_BGR2RGB)
+        layout = detect_graph_layout(img_rgb, SETTINGS)
+        sample = measure_calibration_sample(img_rgb, SETTINGS, name=name, layout=layout)
+        assert sample is not None, name
+        cropped = cv2.cvtColor(img_rgb[layout['top']:layout['bottom'], layout['left']:layout['right']],
+                               cv2.COLOR_RGB2BGR)
+
+        for grid_30k_offset, grid_minus_30k_offset in [(1, -34), (5, -20), (-3, -40)]:
+            analyzer = WebCompatibleAnalyzer()
+            analyzer.zero_y = layout['zero_in_crop']
+            analyzer.scale = linear_scale(layout['zero_in_crop'], sample['crop_height'],
+                                          grid_30k_offset, grid_minus_30k_offset)
+            data_points, _, _ = analyzer.extract_graph_data(cropped)
+            expected = analyzer.analyze_values(data_points)['max_value']
+            assert predict_max(sample, grid_30k_offset, grid_minus_30k_offset) == expected, \
+                f"{name} ({grid_30k_offset}, {grid_minus_30k_offset})"
+
+
+if __name__ == "__main__":
+    test_solve_recovers_grid_spread()
+    test_solve_skips_unusable_samples()
+    test_predict_max_clamps()
+    test_measured_prediction_matches_extraction()
+    print("✅ キャリブレーションのテスト完了")
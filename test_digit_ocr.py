@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+site7の数字のテンプレート認識（digit_ocr.py）のテスト
+テンプレートの作成に使っていない画像を正しく読むこと、信頼度の低い項目をTesseractに任せること、
+文字の分割、テンプレートがない・表がない画像で項目がNoneになることを確認する
+"""
+
+import sys
+import os
+import json
+import tempfile
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from digit_ocr import (DigitTemplateReader, segment_glyphs, split_groups, format_site7_text,
+                       DIGIT_LABELS_PATH, DIGIT_HOLDOUT_LABELS_PATH, DIGIT_CORPUS_DIR, FIELD_PATTERNS,
+                       SITE7_TABLE_FIELDS, TABLE_FIRST_ROW_OFFSET, TABLE_ROW_PITCH)
+from graph_detection import CANONICAL_WIDTH, DETECTION_REDUCTION, detect_orange_bottom_multires
+
+
+def expected_fields(labels):
+    """正解ラベル（表示どおりの文字列）を read_site7 の値の形式にする"""
+    expected = {}
+    for field, text in labels.items():
+        if field == 'machine_number':
+            expected[field] = f"{text}番台"
+        else:
+            match = FIELD_PATTERNS[field].match(text)
+            expected[field] = match.group(1) if match else None
+    return expected
+
+
+def load_labels(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_holdout_samples():
+    """テンプレートの作成に使っていない画像の全項目を、十分な信頼度で正しく読むこと"""
+    holdout = load_labels(DIGIT_HOLDOUT_LABELS_PATH)
+    assert not set(holdout) & set(load_labels(DIGIT_LABELS_PATH)), "評価用の画像がテンプレートの作成に含まれています"
+
+    reader = DigitTemplateReader()
+    for file_name, file_labels in holdout.items():
+        fields, confidence = reader.read_site7(cv2.imread(os.path.join(DIGIT_CORPUS_DIR, file_name)), bgr=True)
+        assert fields == expected_fields(file_labels), file_name
+        assert reader.is_confident(confidence), file_name
+
+
+def erase_table_value(img, row):
+    """データ表の row 行目の右の値（基準幅の x=900〜1080）を背景色で消す"""
+    scale = CANONICAL_WIDTH / img.shape[1]
+    small = np.ascontiguousarray(img[::DETECTION_REDUCTION, ::DETECTION_REDUCTION])
+    top = detect_orange_bottom_multires(img, small, bgr=True) * scale + TABLE_FIRST_ROW_OFFSET + row * TABLE_ROW_PITCH
+    erased = img.copy()
+    erased[int(top / scale):int((top + TABLE_ROW_PITCH) / scale), int(900 / scale):int(1080 / scale)] = 250
+    return erased
+
+
+def test_low_confidence_falls_back_to_tesseract():
+    """信頼度の低い項目はテンプレートの結果を使わず、Tesseractの結果のままにすること
+    （extract_site7_data と同じく、Tesseractの結果に confident_fields を上書きする）"""
+    reader = DigitTemplateReader()
+    tesseract = {field: 'Tesseract' for field in SITE7_TABLE_FIELDS}
+
+    # 表がメニューで隠れている画像: 表の全項目をTesseractで読む（台番号はバーから読める）
+    fields, confidence = reader.read_site7(cv2.imread(os.path.join(DIGIT_CORPUS_DIR, 'S__78209162.jpg')), bgr=True)
+    assert not reader.is_confident(confidence)
+    assert reader.confident_fields(fields, confidence) == {}
+    assert fields['machine_number'] == '1104番台'
+
+    # 最高出玉の値を消した画像: 値が2つにしか分かれない行（初当り回数・最高出玉）だけをTesseractで読む
+    name = 'S__79781899.jpg'
+    fields, confidence = reader.read_site7(erase_table_value(cv2.imread(os.path.join(DIGIT_CORPUS_DIR, name)), 2),
+                                           bgr=True)
+    assert not reader.is_confident(confidence)
+    assert confidence['max_payout'] < reader.min_confidence
+    expected = expected_fields(load_labels(DIGIT_HOLDOUT_LABELS_PATH)[name])
+    merged = {**tesseract, **reader.confident_fields(fields, confidence)}
+    assert merged == {**{field: expected[field] for field in SITE7_TABLE_FIELDS},
+                      'first_hit_count': 'Tesseract', 'max_payout': 'Tesseract'}
+
+
+def test_labelled_samples():
+    """テンプレートを作成した画像と、それを再圧縮・リサイズした画像の全項目を正しく読むこと"""
+    reader = DigitTemplateReader()
+    assert reader.available, "テンプレートがありません"
+    labels = load_labels(DIGIT_LABELS_PATH)
+
+    failures = []
+    for file_name, file_labels in labels.items():
+        img = cv2.imread(os.path.join(DIGIT_CORPUS_DIR, file_name))
+        _, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        variants = {
+            '元画像': img,
+            'JPEG品質80': cv2.imdecode(encoded, cv2.IMREAD_COLOR),
+            'x0.9': cv2.resize(img, None, fx=0.9, fy=0.9, interpolation=cv2.INTER_AREA),
+        }
+        expected = expected_fields(file_labels)
+        for label, variant in variants.items():
+            fields, confidence = reader.read_site7(variant, bgr=True)
+            for field, value in expected.items():
+                if fields[field] != value:
+                    failures.append(f"{file_name} {label} {field}: {fields[field]} != {value}"
+                                    f"（信頼度 {confidence[field]:.2f}）")
+    assert not failures, "\n".join(failures)
+
+
+def test_segment_glyphs_and_groups():
+    """x方向に重なる成分は1文字にまとめ、広い間隔で値を区切ること"""
+    ink = np.zeros((30, 200), dtype=np.uint8)
+    # 「回」: 外側の枠と内側の四角（x方向に重なる2成分）
+    cv2.rectangle(ink, (10, 5), (30, 25), 255, 1)
+    cv2.rectangle(ink, (16, 11), (24, 19), 255, 1)
+    # 間隔の狭い2文字と、間隔の広い1文字
+    cv2.rectangle(ink, (40, 5), (48, 25), 255, -1)
+    cv2.rectangle(ink, (52, 5), (60, 25), 255, -1)
+    cv2.rectangle(ink, (120, 5), (128, 25), 255, -1)
+    # ノイズ（面積が小さい成分）
+    ink[2, 100] = 255
+
+    boxes = segment_glyphs(ink)
+    assert boxes == [(10, 5, 31, 26), (40, 5, 49, 26), (52, 5, 61, 26), (120, 5, 129, 26)]
+    assert split_groups(boxes) == [boxes[:3], boxes[3:]]
+
+
+def test_unreadable_images():
+    """テンプレートがない場合と、site7の画面でない画像は全項目がNoneになること"""
+    img = cv2.imread(os.path.join(DIGIT_CORPUS_DIR, 'IMG_0162.PNG'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        reader = DigitTemplateReader(template_path=os.path.join(temp_dir, 'missing.npz'))
+    assert not reader.available
+    fields, confidence = reader.read_site7(img, bgr=True)
+    assert all(value is None for value in fields.values())
+    assert not reader.is_confident(confidence)
+
+    reader = DigitTemplateReader()
+    for blank in (np.full((2556, 1179, 3), 255, dtype=np.uint8), np.zeros((10, 10), dtype=np.uint8)):
+        fields, confidence = reader.read_site7(blank, bgr=True)
+        assert set(fields) == set(SITE7_TABLE_FIELDS) | {'machine_number'}
+        assert all(value is None for value in fields.values())
+
+
+def test_format_site7_text():
+    """読めなかった項目は「--」で表示すること"""
+    fields = {'machine_number': '720番台', 'total_start': '979', 'current_start': None, 'jackpot_count': '1',
+              'jackpot_probability': '1/979', 'first_hit_count': '1', 'max_payout': None}
+    assert format_site7_text(fields) == ("720番台\n累計スタート 979 スタート --\n"
+                                         "大当り回数 1回 大当り確率 1/979\n初当り回数 1回 最高出玉 --")
+
+
+if __name__ == "__main__":
+    test_holdout_samples()
+    test_low_confidence_falls_back_to_tesseract()
+    test_labelled_samples()
+    test_segment_glyphs_and_groups()
+    test_unreadable_images()
+    test_format_site7_text()
+    print("✅ 数字のテンプレート認識のテスト完了")
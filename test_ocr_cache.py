@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+OCR結果のキャッシュ（ocr_cache.py）のテスト
+キーが領域の内容・形・型・言語・設定・Tesseractのバージョンで決まること、
+メモリ（LRU）とディスクのキャッシュでTesseractを呼ぶ回数が減ることを確認する
+（Tesseractの呼び出しは、呼ばれた回数を数える関数に置き換える）
+"""
+
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+import ocr_cache as ocr_cache_module
+from ocr_cache import OcrCache
+
+
+def _cache(**kwargs):
+    cache = OcrCache(**kwargs)
+    # Tesseractのバージョンを固定（実行環境のTesseractに依存しない）
+    cache._tesseract_version = '5.3.0'
+    return cache
+
+
+class CountingTesseract:
+    """pytesseract.image_to_string の代わり（呼ばれた回数を数え、画素の合計をテキストとして返す）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, image, lang=None, config=''):
+        self.calls += 1
+        return f"{int(np.asarray(image).sum())}|{lang}|{config}"
+
+    def __enter__(self):
+        self._original = ocr_cache_module.pytesseract.image_to_string
+        ocr_cache_module.pytesseract.image_to_string = self
+        return self
+
+    def __exit__(self, *exc_info):
+        ocr_cache_module.pytesseract.image_to_string = self._original
+
+
+def test_cache_key():
+    """同じ内容の領域は同じキー、内容・形・型・言語・設定・バージョンが違えば別のキーになること"""
+    cache = _cache()
+    rng = np.random.default_rng(0)
+    image = (rng.random((24, 60)) > 0.5).astype(np.uint8) * 255
+    key = cache.cache_key(image, 'jpn', '--psm 7')
+
+    # 別の配列でも内容が同じなら同じキー（スライスなどの連続でない配列を含む）
+    padded = np.zeros((30, 80), dtype=np.uint8)
+    padded[3:27, 10:70] = image
+    assert cache.cache_key(padded[3:27, 10:70], 'jpn', '--psm 7') == key
+    assert cache.cache_key(image.copy(), 'jpn', '--psm 7') == key
+
+    changed = image.copy()
+    changed[0, 0] ^= 255
+    variants = [
+        cache.cache_key(changed, 'jpn', '--psm 7'),
+        cache.cache_key(image.reshape(48, 30), 'jpn', '--psm 7'),
+        cache.cache_key(image.astype(np.int16), 'jpn', '--psm 7'),
+        cache.cache_key(image, 'eng', '--psm 7'),
+        cache.cache_key(image, 'jpn', '--psm 6'),
+    ]
+    other_version = _cache()
+    other_version._tesseract_version = '4.1.1'
+    variants.append(other_version.cache_key(image, 'jpn', '--psm 7'))
+    assert len(set(variants + [key])) == len(variants) + 1
+
+
+def test_memory_cache_hits_and_lru():
+    """同じ領域の2回目以降はTesseractを呼ばず、上限を超えると古いものから消えること"""
+    images = [np.full((10, 10), value, dtype=np.uint8) for value in range(3)]
+    with CountingTesseract() as tesseract:
+        cache = _cache(max_entries=2)
+        first = cache.image_to_string(images[0], lang='jpn', config='--psm 7')
+        assert cache.image_to_string(images[0].copy(), lang='jpn', config='--psm 7') == first
+        assert tesseract.calls == 1
+
+        # 設定が違えば別の結果として読み直す
+        cache.image_to_string(images[0], lang='jpn', config='--psm 6')
+        assert tesseract.calls == 2
+
+        # 上限2件: images[1] を入れると、最も使われていない images[0]（--psm 7）が消える
+        cache.image_to_string(images[1], lang='jpn', config='--psm 7')
+        cache.image_to_string(images[0], lang='jpn', config='--psm 7')
+        assert tesseract.calls == 4
+
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['lookups'], stats['entries']) == (1, 4, 5, 2)
+        assert stats['hit_rate'] == 1 / 5
+
+
+def test_disk_cache_shared_between_instances():
+    """ディスクのキャッシュは別のインスタンス（再起動後）でも使え、clear で消えること"""
+    image = np.arange(100, dtype=np.uint8).reshape(10, 10)
+    with tempfile.TemporaryDirectory() as temp_dir, CountingTesseract() as tesseract:
+        disk_path = os.path.join(temp_dir, 'ocr_cache.db')
+        text = _cache(disk_path=disk_path).image_to_string(image, lang='jpn')
+
+        restarted = _cache(disk_path=disk_path)
+        assert restarted.image_to_string(image, lang='jpn') == text
+        assert restarted.image_to_string(image, lang='jpn') == text
+        assert tesseract.calls == 1
+        stats = restarted.stats()
+        assert (stats['disk_hits'], stats['hits'], stats['misses']) == (1, 1, 0)
+
+        # Tesseractのバージョンが変わった場合は引き継がない
+        upgraded = _cache(disk_path=disk_path)
+        upgraded._tesseract_version = '5.4.0'
+        upgraded.image_to_string(image, lang='jpn')
+        assert tesseract.calls == 2
+
+        restarted.clear()
+        _cache(disk_path=disk_path).image_to_string(image, lang='jpn')
+        assert tesseract.calls == 3
+
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_memory_cache_hits_and_lru()
+    test_disk_cache_shared_between_instances()
+    print("✅ OCRキャッシュのテスト完了")
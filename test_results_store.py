@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+解析結果データベース（results_store.py）の集計テーブルのテスト
+保存のたびに差分で更新した machine_daily・hall_daily が、解析結果から作り直した集計と一致すること、
+週ごとの集計が手計算と一致することを確認する
+"""
+
+import sys
+import os
+import random
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from results_store import ResultsStore
+
+DATES = ['2026-03-01', '2026-03-02', '2026-03-03', '2026-03-08', '2026-03-09', '2026-03-15']
+# 店舗の未入力（None と ''）は同じ店舗 '' として集計される
+HALLS = [None, '', '本店', '駅前店']
+MACHINES = ['720', '721番台', '0722', '1104', None]
+
+
+def random_record(rng, n):
+    success = rng.random() < 0.75
+    record = {
+        'file_name': f"IMG_{n:04d}.PNG",
+        'machine_number': rng.choice(MACHINES),
+        'hall': rng.choice(HALLS),
+        'graph_date': rng.choice(DATES),
+        'source': 'test',
+        'success': success,
+    }
+    if success:
+        max_value = rng.randrange(0, 30000, 10)
+        record.update({
+            'max_value': max_value,
+            'min_value': -rng.randrange(0, 30000, 10),
+            'final_value': rng.randrange(-20000, max_value + 1, 10),
+            'first_hit_value': rng.choice([None, -rng.randrange(0, 5000, 10)]),
+            'total_jackpot_balls': rng.randrange(0, 40000, 10),
+            'rotation_rate': rng.choice([None, round(rng.uniform(14, 24), 2)]),
+        })
+    return record
+
+
+def snapshot(store):
+    """集計テーブルから読む全ての結果"""
+    return {
+        'daily': store.hall_summary(),
+        'weekly': store.hall_summary(weekly=True),
+        'halls': [store.hall_summary(hall=hall, weekly=True) for hall in ('', '本店', '駅前店')],
+        'days': [store.daily_summary(date) for date in DATES],
+        'day_halls': [store.daily_summary(date, hall='本店') for date in DATES],
+        'trends': [store.machine_trend(machine) for machine in MACHINES if machine],
+        'machines': store.machines(),
+    }
+
+
+def test_incremental_rollups_match_rebuild():
+    """ランダムな60回の保存（日付・店舗・失敗・台番号なしを含む）の差分の集計が、作り直した集計と一致すること"""
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = ResultsStore(os.path.join(temp_dir, 'results.db'))
+        n = 0
+        for _ in range(60):
+            records = []
+            for _ in range(rng.randint(1, 8)):
+                records.append(random_record(rng, n))
+                n += 1
+            store.record_batch(records)
+
+        incremental = snapshot(store)
+        assert sum(row['analyses'] for row in incremental['daily']) == n
+        assert any(row['hall'] is None for row in incremental['daily'])
+        store.rebuild_rollups()
+        assert snapshot(store) == incremental
+
+
+def test_weekly_bucket():
+    """週ごと（月曜始まり）の集計が手計算と一致すること"""
+    def record(date, machine, success=True, max_value=None, final_value=None, jackpot=None, rotation=None,
+               hall='本店'):
+        return {'file_name': f"{date}_{machine}.PNG", 'machine_number': machine, 'hall': hall, 'graph_date': date,
+                'success': success, 'max_value': max_value, 'final_value': final_value,
+                'total_jackpot_balls': jackpot, 'rotation_rate': rotation}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = ResultsStore(os.path.join(temp_dir, 'results.db'))
+        # 3/2（月）: 720番台は後の解析、721番台は後の解析が失敗のため最初の解析がその日の結果
+        store.record_batch([
+            record('2026-03-02', '720', max_value=5000, final_value=1000, jackpot=8000, rotation=18.0),
+            record('2026-03-02', '721', max_value=3000, final_value=-500, jackpot=2000),
+        ])
+        store.record_batch([
+            record('2026-03-02', '720', max_value=6000, final_value=2000, jackpot=9000, rotation=20.0),
+            record('2026-03-02', '721', success=False),
+            record('2026-03-02', None, max_value=7000, final_value=7000, jackpot=7000),  # 台番号なし
+        ])
+        # 3/8（日）は同じ週、3/9（月）は次の週
+        store.record_batch([
+            record('2026-03-08', '720', max_value=4000, final_value=1500, jackpot=4500, rotation=19.0),
+            record('2026-03-09', '720', max_value=9990, final_value=9990, jackpot=9990, rotation=30.0),
+            # 店舗の未入力（None と ''）は同じ店舗として集計
+            record('2026-03-03', '800', max_value=100, final_value=100, jackpot=100, hall=None),
+            record('2026-03-03', '801', success=False, hall=''),
+        ])
+
+        weeks = {(row['period'], row['hall']): row for row in store.hall_summary(weekly=True)}
+        assert weeks[('2026-03-02', '本店')] == {
+            'period': '2026-03-02', 'hall': '本店',
+            'analyses': 6, 'successes': 5,
+            'machines': 3,  # 3/2 の2台 + 3/8 の1台（延べ台数）
+            'final_sum': 2000 - 500 + 1500,
+            'max_value': 6000,
+            'jackpot_sum': 9000 + 2000 + 4500,
+            'avg_rotation_rate': (20.0 + 19.0) / 2,
+        }
+        assert weeks[('2026-03-09', '本店')]['final_sum'] == 9990
+        unnamed = weeks[('2026-03-02', None)]
+        assert (unnamed['analyses'], unnamed['successes'], unnamed['machines']) == (2, 1, 1)
+
+        day = {row['machine_number']: row for row in store.daily_summary('2026-03-02')}
+        assert (day['721']['screenshots'], day['721']['successes'], day['721']['final_value']) == (2, 1, -500)
+        assert day['720']['final_value'] == 2000
+
+
+if __name__ == "__main__":
+    test_incremental_rollups_match_rebuild()
+    test_weekly_bucket()
+    print("✅ 解析結果データベースの集計のテスト完了")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+サンプル画像（graphs/original）による回帰テスト
+解析の変更で、サンプル画像の解析が失敗・変化していないことを確認する
+"""
+
+import sys
+import os
+import glob
+import tempfile
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from web_analyzer import WebCompatibleAnalyzer
+from color_lut import class_mask
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'graphs', 'original')
+
+
+def sample_images(pattern='*'):
+    """サンプル画像のパス（ファイル名順）"""
+    return sorted(glob.glob(os.path.join(SAMPLE_DIR, pattern)))
+
+
+def test_process_single_image_samples():
+    """全サンプル画像の解析が成功すること（JPEGは基準幅そのままで解析されること）"""
+    images = sample_images()
+    assert images, "テスト画像が見つかりません"
+
+    failures = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        analyzer = WebCompatibleAnalyzer(work_dir=temp_dir)
+        for image_path in images:
+            result = analyzer.process_single_image(image_path, temp_dir)
+            name = os.path.basename(image_path)
+            if result.get('error'):
+                failures.append(f"{name}: {result['error']}")
+            elif name.endswith('.jpg') and result['scale_factor'] != 1.0:
+                failures.append(f"{name}: JPEGが拡大縮小されました（x{result['scale_factor']:.3f}）")
+
+    print(f"✅ {len(images) - len(failures)}/{len(images)}枚 成功")
+    assert not failures, "\n".join(failures)
+
+
+def test_color_lut_matches_inrange():
+    """色分類テーブルの判定が、色ごとの cv2.inRange と全ピクセルで一致すること（切り抜き画像）"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        analyzer = WebCompatibleAnalyzer(work_dir=temp_dir)
+        for image_path in sample_images('*.jpg'):
+            cropped = analyzer.crop_graph_area(image_path)
+            assert cropped is not None, os.path.basename(image_path)
+            membership = analyzer.classify_colors(cropped)
+            hsv = cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV)
+            for class_id, (color_name, color_range) in enumerate(analyzer.color_ranges.items(), start=1):
+                expected = cv2.inRange(hsv, color_range['lower'], color_range['upper']) > 0
+                mismatched = int(np.count_nonzero(class_mask(membership, class_id) != expected))
+                assert mismatched == 0, f"{os.path.basename(image_path)} {color_name}: {mismatched}ピクセル不一致"
+
+
+# 色範囲の境界付近の色で結果が変わりやすいサンプル（ファイル名 → 検出色・データ点数・最高値・最終値）
+KNOWN_SAMPLE_VALUES = {
+    'S__78848010.jpg': ('cyan', 159, 7800, 3420),
+    'S__78209160.jpg': ('cyan', 192, 6840, 3060),
+    'S__78209130.jpg': ('pink', 205, 8640, -6120),
+}
+
+
+def test_known_sample_values():
+    """高速モードの解析結果が既知の値と一致すること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        analyzer = WebCompatibleAnalyzer(work_dir=temp_dir)
+        for name, expected in KNOWN_SAMPLE_VALUES.items():
+            result = analyzer.process_single_image(os.path.join(SAMPLE_DIR, name), temp_dir)
+            actual = (result['detected_color'], result['data_points'],
+                      result['analysis']['max_value'], result['analysis']['final_value'])
+            assert actual == expected, f"{name}: {actual} != {expected}"
+
+
+def test_detect_graph_color_matches_extraction():
+    """detect_graph_color と extract_graph_data の色の優先順位が同じ（カラム数の多い色）であること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        analyzer = WebCompatibleAnalyzer(work_dir=temp_dir)
+        # 先に定義された色（ピンク）が10ピクセルを超えても、カラム数の多い色（シアン）を採用する
+        image = np.full((60, 12, 3), 255, dtype=np.uint8)
+        image[10:25, 6] = (180, 105, 255)  # ピンク: 1カラムに15ピクセル
+        image[30:34, 4:9] = (255, 255, 0)  # シアン: 5カラムに4ピクセルずつ
+        color, mask = analyzer.detect_graph_color(image, 6)
+        assert color == 'cyan' and np.count_nonzero(mask) == 20
+        assert analyzer.extract_graph_data(image)[1] == 'cyan'
+
+        # カラム数が同じ場合は先に定義された色
+        image[10:25, 4:9] = (180, 105, 255)
+        assert analyzer.detect_graph_color(image, 6)[0] == 'pink'
+        assert analyzer.extract_graph_data(image)[1] == 'pink'
+        assert analyzer.detect_graph_color(np.full((60, 5, 3), 255, dtype=np.uint8), 2) == ('unknown', None)
+
+
+def _older_screenshot(analyzer, cropped, ratio):
+    """系列の途中（ratio の位置）から右を背景色で消した、同じ台の古いスクリーンショットの代わり"""
+    zero_y, scale = analyzer.zero_y, analyzer.scale
+    analyzer.extract_graph_data(cropped)
+    xs = [x for x, _ in analyzer.last_extraction['points']]
+    analyzer.zero_y, analyzer.scale = zero_y, scale
+    older = cropped.copy()
+    older[:, int(xs[int(len(xs) * ratio)]):] = 255
+    return older
+
+
+def test_incremental_rejects_older_screenshot():
+    """差分抽出: 新しい系列を古い（短い）画像に使わず、古い系列からは新しい画像と同じ結果になること"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in KNOWN_SAMPLE_VALUES:
+            analyzer = WebCompatibleAnalyzer(work_dir=temp_dir)
+            cropped = analyzer.crop_graph_area(os.path.join(SAMPLE_DIR, name))
+            zero_y, scale = analyzer.zero_y, analyzer.scale
+            # 照合カラムが1本だけ外れる程度に短い画像（一致率 15/16 でも再利用しない）
+            older = _older_screenshot(analyzer, cropped, 0.96)
+
+            full, _, _ = analyzer.extract_graph_data(cropped)
+            newer_extraction = analyzer.last_extraction
+            analyzer.zero_y, analyzer.scale = zero_y, scale
+            assert analyzer.extract_graph_data_incremental(older, newer_extraction) is None, name
+            assert (analyzer.zero_y, analyzer.scale) == (zero_y, scale), name
+
+            analyzer.extract_graph_data(older)
+            older_extraction = analyzer.last_extraction
+            analyzer.zero_y, analyzer.scale = zero_y, scale
+            result = analyzer.extract_graph_data_incremental(cropped, older_extraction)
+            assert result is not None, name
+            assert result[3]['new_points'] > 0, name
+            assert result[0] == full, name
+
+
+if __name__ == "__main__":
+    test_process_single_image_samples()
+    test_color_lut_matches_inrange()
+    test_known_sample_values()
+    test_detect_graph_color_matches_extraction()
+    test_incremental_rejects_older_screenshot()
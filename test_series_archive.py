@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+系列アーカイブ（series_archive.py）のテスト
+レコードの変換と、アーカイブへの追記・読み込みで系列とメタデータが元に戻ることを確認する
+"""
+
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from series_archive import SeriesArchive, encode_record, decode_record, FLAG_WIDE_DELTAS, SERIES_HEADER
+
+
+def _decode_points(record):
+    series_id, x, values, meta, end = decode_record(record)
+    assert end == len(record)
+    return series_id, list(zip(x.tolist(), values.tolist())), meta
+
+
+def test_record_round_trip():
+    """通常の系列（int16の差分）・空の系列・1点だけの系列が元に戻ること"""
+    rng = np.random.default_rng(0)
+    x = np.arange(0, 600, 2)
+    values = np.cumsum(rng.integers(-120, 121, len(x))) - 3000
+    points = list(zip(x.tolist(), values.tolist()))
+    meta = {'color': 'pink', 'zero_y': np.float32(250.5), 'scale': np.float64(120.0)}
+
+    record = encode_record(42, points, meta)
+    series_id, decoded, decoded_meta = _decode_points(record)
+    assert series_id == 42
+    assert decoded == points
+    assert decoded_meta == {'color': 'pink', 'zero_y': 250.5, 'scale': 120.0}
+    assert not SERIES_HEADER.unpack_from(record)[3] & FLAG_WIDE_DELTAS
+
+    assert _decode_points(encode_record(1, [])) == (1, [], {})
+    assert _decode_points(encode_record(2, [(5, -30000)])) == (2, [(5, -30000)], {})
+
+
+def test_record_round_trip_wide_deltas():
+    """int16 に収まらない差分がある系列は int32 で保存され、元に戻ること"""
+    points = [(0, 0), (1, 40000), (2, -40000), (70000, -40001)]
+    record = encode_record(7, points)
+    assert SERIES_HEADER.unpack_from(record)[3] & FLAG_WIDE_DELTAS
+    assert _decode_points(record) == (7, points, {})
+
+
+def test_record_rounds_subpixel_points():
+    """サブピクセルの座標・値は整数に丸めて保存されること"""
+    points = [(0.4, 10.6), (2.6, -0.4), (4.5, 20.5)]
+    _, decoded, _ = _decode_points(encode_record(3, points))
+    assert decoded == [(0, 11), (3, 0), (4, 20)]
+
+
+def test_archive_append_read_and_load_day():
+    """アーカイブに追記した系列を1件ずつ・1日分まとめて読み込めること（同じIDは最後のレコード）"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive = SeriesArchive(temp_dir)
+        first = [(0, 0), (2, 40), (4, -80)]
+        second = [(0, 0), (2, 100000)]
+        archive.append('2026-10-18', [(1, first, {'color': 'blue'}), (2, second, None)])
+        resaved = [(0, 0), (2, 50)]
+        archive.append('2026-10-18', [(1, resaved, {'color': 'cyan'})])
+
+        assert archive.read('2026-10-18', 1) == (resaved, {'color': 'cyan'})
+        assert archive.read('2026-10-18', 2) == (second, {})
+        assert archive.read('2026-10-18', 3) == ([], None)
+        assert archive.read('2026-10-19', 1) == ([], None)
+        assert archive.dates() == ['2026-10-18']
+
+        day = archive.load_day('2026-10-18')
+        assert day['series_id'].tolist() == [1, 2, 1]
+        assert day['offsets'].tolist() == [0, 3, 5, 7]
+        assert day['meta'] == [{'color': 'blue'}, {}, {'color': 'cyan'}]
+        for i, points in enumerate([first, second, resaved]):
+            start, end = day['offsets'][i], day['offsets'][i + 1]
+            assert list(zip(day['x'][start:end].tolist(), day['values'][start:end].tolist())) == points
+
+
+if __name__ == "__main__":
+    test_record_round_trip()
+    test_record_round_trip_wide_deltas()
+    test_record_rounds_subpixel_points()
+    test_archive_append_read_and_load_day()
+    print("✅ 系列アーカイブのテスト完了")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+共有メモリによる画像の受け渡し（shared_frames.py）のテスト
+入力と結果の画像がそのまま受け渡されること、ブロックに入らない画像・解析関数の例外の扱い、
+ブロックの再利用と解放を確認する
+"""
+
+import sys
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from shared_frames import SharedFrameExecutor, SharedFramePool, _run_frame_task
+
+
+def analyze_frame(frame, offset, fail=False):
+    """解析関数の代わり（解析プロセスで呼ばれるためトップレベルに置く）
+
+    入力の画像の合計を結果にし、入力のコピー・offset を足した画像・入力より大きい画像を返す。
+    """
+    if fail:
+        raise ValueError(f"解析失敗 {offset}")
+    return {'sum': int(frame.sum(dtype=np.int64)), 'shape': frame.shape}, {
+        'copy': frame.copy(),
+        'shifted': (frame.astype(np.int16) + offset).astype(np.int16),
+        'large': np.tile(frame, (2, 1, 1)),
+    }
+
+
+def make_frames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(120 + 10 * i, 90, 3), dtype=np.uint8) for i in range(count)]
+
+
+def test_round_trip_and_reuse():
+    """入力と結果の画像がそのまま受け渡され、2回目のバッチでブロックが再利用され、終了後に残らないこと"""
+    frames = make_frames(4)
+    executor = SharedFrameExecutor(max_workers=2)
+    pool = executor.pool
+    try:
+        names = set()
+        for batch in range(2):
+            reused_before = pool.reused
+            futures = [executor.submit(analyze_frame, frame, batch + 1, outputs=('copy', 'shifted'),
+                                       output_bytes={'shifted': frame.size * 2})
+                       for frame in frames]
+            for frame, future in zip(frames, futures):
+                result, images = future.result(timeout=60)
+                assert result == {'sum': int(frame.sum(dtype=np.int64)), 'shape': frame.shape}
+                assert images['copy'].dtype == np.uint8 and np.array_equal(images['copy'], frame)
+                assert images['shifted'].dtype == np.int16
+                assert np.array_equal(images['shifted'], frame.astype(np.int16) + batch + 1)
+                # 'large' は受け取る画像に指定していないため、配列のまま返る
+                assert np.array_equal(images['large'], np.tile(frame, (2, 1, 1)))
+            # 結果を受け取った時点で全てのブロックが返却されている
+            assert not pool._used
+            names.update(block.name for block in pool._free)
+            if batch == 1:
+                assert pool.reused > reused_before
+    finally:
+        executor.shutdown()
+
+    assert not pool._used and not pool._free
+    for name in names:
+        try:
+            shared_memory.SharedMemory(name=name).close()
+        except FileNotFoundError:
+            continue
+        raise AssertionError(f"共有メモリが解放されていません: {name}")
+
+
+def test_oversized_output_returned_inline():
+    """用意したブロックに入らない結果の画像は、共有メモリを使わず配列のまま返ること"""
+    frame = make_frames(1)[0]
+    pool = SharedFramePool()
+    try:
+        frame_ref = pool.put(frame)
+        small_block = pool.allocate(16)
+        fitting_block = pool.allocate(frame.nbytes)
+        result, refs, inline = _run_frame_task(
+            analyze_frame, frame_ref, {'large': (small_block.name, 16), 'copy': (fitting_block.name, frame.nbytes)},
+            (0,), {})
+        assert set(refs) == {'copy'} and 'large' in inline
+        assert np.array_equal(pool.view(refs['copy']), frame)
+        assert np.array_equal(inline['large'], np.tile(frame, (2, 1, 1)))
+    finally:
+        pool.close()
+
+    with SharedFrameExecutor(max_workers=1) as executor:
+        _, images = executor.submit(analyze_frame, frame, 0, outputs=('large',), output_bytes=16).result(timeout=60)
+        assert np.array_equal(images['large'], np.tile(frame, (2, 1, 1)))
+        assert not executor.pool._used
+
+
+def test_worker_exception_reaches_future():
+    """解析関数の例外が Future に伝わり、ブロックが返却されること"""
+    frame = make_frames(1)[0]
+    with SharedFrameExecutor(max_workers=1) as executor:
+        future = executor.submit(analyze_frame, frame, 7, fail=True, outputs=('copy',))
+        try:
+            future.result(timeout=60)
+        except ValueError as e:
+            assert str(e) == "解析失敗 7"
+        else:
+            raise AssertionError("例外が送出されませんでした")
+        assert not executor.pool._used
+
+        # 例外の後も同じプロセスプールで解析できる
+        result, images = executor.submit(analyze_frame, frame, 1, outputs=('copy',)).result(timeout=60)
+        assert np.array_equal(images['copy'], frame)
+
+
+if __name__ == "__main__":
+    test_round_trip_and_reuse()
+    test_oversized_output_returned_inline()
+    test_worker_exception_reaches_future()
+    print("✅ 共有メモリの受け渡しのテスト完了")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+段階的な並行パイプライン（staged_pipeline.py）のテスト
+投入した順に返すこと、段階の依存関係、段階の例外の伝わり方、ワーカーの終了を確認する
+"""
+
+import sys
+import os
+import random
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from staged_pipeline import StagedPipeline
+
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('pipeline-')]
+
+
+def _build(log, fail_at=None):
+    """ocr と extract を並行に、両方を終えた項目を metrics で処理するパイプライン（処理時間はばらつかせる）"""
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 0.01) for _ in range(200)]
+
+    def run_ocr(item):
+        time.sleep(delays[item.data['n'] % len(delays)])
+        item.data['ocr'] = item.data['n'] * 10
+        log.append(('ocr', item.data['n']))
+
+    def run_extract(item):
+        time.sleep(delays[-1 - item.data['n'] % len(delays)])
+        if item.data['n'] == fail_at:
+            raise ValueError(f"抽出失敗 {item.data['n']}")
+        item.data['extract'] = item.data['n'] * 100
+        log.append(('extract', item.data['n']))
+
+    def run_metrics(item):
+        # 前の段階の結果が揃っていること
+        item.data['total'] = item.data['ocr'] + item.data['extract']
+        log.append(('metrics', item.data['n']))
+
+    pipeline = StagedPipeline()
+    pipeline.add_stage('ocr', run_ocr, workers=3)
+    pipeline.add_stage('extract', run_extract, workers=2, queue_size=2)
+    pipeline.add_stage('metrics', run_metrics, after=('ocr', 'extract'))
+    return pipeline
+
+
+def test_results_in_submission_order():
+    """処理時間がばらついても投入した順に返り、すべての段階を通ること"""
+    log = []
+    pipeline = _build(log)
+    results = [item.data for item in pipeline.run({'n': n} for n in range(40))]
+
+    assert [data['n'] for data in results] == list(range(40))
+    assert all(data['total'] == data['n'] * 110 for data in results)
+    assert sorted(n for stage, n in log if stage == 'metrics') == list(range(40))
+    assert not _pipeline_threads()
+
+    stats = {row['name']: row for row in pipeline.stats()}
+    assert [row['name'] for row in pipeline.stats()] == ['decode', 'ocr', 'extract', 'metrics']
+    assert all(stats[name]['items'] == 40 for name in stats)
+    assert stats['extract']['max_queue'] <= 2
+
+
+def test_passthrough_items_keep_order():
+    """段階を通さない項目も、他の項目と同じく投入した順に返ること"""
+    log = []
+    pipeline = _build(log)
+    items = pipeline.run(({'n': n, 'skip': n % 3 == 0} for n in range(20)), passthrough=lambda data: data['skip'])
+    results = [item.data for item in items]
+
+    assert [data['n'] for data in results] == list(range(20))
+    assert all('total' not in data for data in results if data['skip'])
+    assert all(data['total'] == data['n'] * 110 for data in results if not data['skip'])
+    assert not any(n % 3 == 0 for _, n in log)
+
+
+def test_stage_error_raised_in_order():
+    """段階で起きた例外は、その項目を返す順番で送出され、以降の段階はその項目を処理しないこと"""
+    log = []
+    pipeline = _build(log, fail_at=7)
+    received = []
+    try:
+        for item in pipeline.run({'n': n} for n in range(30)):
+            received.append(item.data['n'])
+    except ValueError as e:
+        assert str(e) == "抽出失敗 7"
+    else:
+        raise AssertionError("例外が送出されませんでした")
+
+    assert received == list(range(7))
+    assert ('metrics', 7) not in log
+    # 例外の後もワーカーは終了している
+    assert not _pipeline_threads()
+
+
+def test_item_wait_for_other_stage():
+    """item.wait で別の段階の結果を待てること（待った時間は稼働時間に含めない）"""
+    def run_slow(item):
+        time.sleep(0.02)
+        item.data['slow'] = True
+
+    def run_waiting(item):
+        item.wait('slow')
+        item.data['seen_slow'] = item.data.get('slow', False)
+
+    pipeline = StagedPipeline()
+    pipeline.add_stage('slow', run_slow)
+    pipeline.add_stage('waiting', run_waiting, workers=2)
+    results = [item.data for item in pipeline.run({'n': n} for n in range(5))]
+
+    assert all(data['seen_slow'] for data in results)
+    stats = {row['name']: row for row in pipeline.stats()}
+    assert stats['waiting']['wait_seconds'] > stats['waiting']['busy_seconds']
+
+
+def test_add_stage_validation():
+    """段階名の重複と、追加されていない前の段階の指定はエラーになること"""
+    pipeline = StagedPipeline()
+    pipeline.add_stage('ocr', lambda item: None)
+    for name, after in [('ocr', ()), ('metrics', ('extract',))]:
+        try:
+            pipeline.add_stage(name, lambda item: None, after=after)
+        except ValueError:
+            continue
+        raise AssertionError(f"{name} の追加がエラーになりませんでした")
+
+
+if __name__ == "__main__":
+    test_results_in_submission_order()
+    test_passthrough_items_keep_order()
+    test_stage_error_raised_in_order()
+    test_item_wait_for_other_stage()
+    test_add_stage_validation()
+    print("✅ パイプラインのテスト完了")
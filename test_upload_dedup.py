@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+アップロード画像の重複判定（upload_dedup.py）のテスト
+サンプル画像（graphs/original）を再圧縮・リサイズ・スクロールした画像が重複と判定され、
+別の画像・古いスクリーンショットが重複と判定されないことを確認する
+"""
+
+import sys
+import os
+import glob
+import itertools
+
+import cv2
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT_DIR, 'web_app'))
+
+from web_analyzer import WebCompatibleAnalyzer
+from preflight import preflight_check
+from graph_detection import reduce_image, CANONICAL_WIDTH
+from upload_dedup import upload_fingerprint, compare_fingerprints, find_duplicate
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, 'graphs', 'original')
+
+COLOR_RANGES = WebCompatibleAnalyzer().color_ranges
+
+# リサイズ・スクロールを確認するサンプル（LINEで転送されたJPEGと元のPNG）
+RESIZE_SAMPLES = ['S__78209160.jpg', 'S__78848008.jpg', 'S__78209130.jpg', 'IMG_0162.PNG', 'IMG_0166.PNG']
+
+
+def fingerprint(img):
+    """streamlit_app_full.py と同じ手順で指紋を作成（事前チェックの結果と縮小画像を使う）"""
+    small = reduce_image(img)
+    preflight = preflight_check(img, COLOR_RANGES, bgr=True, small=small)
+    return upload_fingerprint(img, preflight, small, bgr=True), preflight
+
+
+def load_samples():
+    images = {}
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, '*'))):
+        images[os.path.basename(path)] = cv2.imread(path)
+    return images
+
+
+def test_recompressed_copies_are_duplicates():
+    """再圧縮（JPEG品質60〜85）した画像が重複と判定されること"""
+    failures = []
+    for name, img in load_samples().items():
+        original, _ = fingerprint(img)
+        assert original is not None, name
+        for quality in (85, 60):
+            _, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            kind, detail = compare_fingerprints(original, fingerprint(cv2.imdecode(encoded, cv2.IMREAD_COLOR))[0])
+            if kind != 'duplicate':
+                failures.append(f"{name} 品質{quality}: {kind} {detail}")
+    assert not failures, "\n".join(failures)
+
+
+def test_resized_and_scrolled_copies_are_duplicates():
+    """リサイズ・数十ピクセルのスクロールをした画像が重複と判定されること"""
+    failures = []
+    for name in RESIZE_SAMPLES:
+        img = cv2.imread(os.path.join(SAMPLE_DIR, name))
+        original, _ = fingerprint(img)
+        copies = {
+            'x1.25': cv2.resize(img, None, fx=1.25, fy=1.25, interpolation=cv2.INTER_CUBIC),
+            'x0.9': cv2.resize(img, None, fx=0.9, fy=0.9, interpolation=cv2.INTER_AREA),
+            'スクロール30px': np.roll(img, 30, axis=0),
+        }
+        for label, copy in copies.items():
+            kind, detail = compare_fingerprints(original, fingerprint(copy)[0])
+            if kind != 'duplicate':
+                failures.append(f"{name} {label}: {kind} {detail}")
+    assert not failures, "\n".join(failures)
+
+
+def test_distinct_samples_are_not_duplicates():
+    """別のサンプル画像どうしが重複と判定されないこと"""
+    fingerprints = {name: fingerprint(img)[0] for name, img in load_samples().items()}
+    duplicates = [(a, b) for (a, fa), (b, fb) in itertools.combinations(fingerprints.items(), 2)
+                  if compare_fingerprints(fa, fb)[0] == 'duplicate']
+    assert not duplicates, duplicates
+
+
+def _older_screenshot(img, preflight, ratio):
+    """グラフ領域の ratio の位置から右のラインを背景色で消した、同じ台の古いスクリーンショットの代わり"""
+    older = img.copy()
+    scale = img.shape[1] / CANONICAL_WIDTH
+    zero_y = preflight['zero_line_y']
+    area = older[int(zero_y - 246 * scale):int(zero_y + 280 * scale),
+                 int(120 * scale):img.shape[1] - int(120 * scale)]
+    cut = int(area.shape[1] * ratio)
+    saturation = cv2.cvtColor(area, cv2.COLOR_BGR2HSV)[:, :, 1]
+    background = np.median(area.reshape(-1, 3), axis=0)
+    area[:, cut:][saturation[:, cut:] >= 40] = background
+    return older
+
+
+def test_older_screenshot_is_revision():
+    """ラインが途中までの古いスクリーンショットは、重複ではなく更新版と判定されること"""
+    for name in ['S__78209160.jpg', 'S__78848008.jpg', 'IMG_0173.PNG']:
+        img = cv2.imread(os.path.join(SAMPLE_DIR, name))
+        newer, preflight = fingerprint(img)
+        older, _ = fingerprint(_older_screenshot(img, preflight, newer['line_extent'] / 2))
+
+        kind, detail = compare_fingerprints(newer, older)
+        assert kind == 'revision' and detail['newer'] == 'a', f"{name}: {kind} {detail}"
+        kind, detail = compare_fingerprints(older, newer)
+        assert kind == 'revision' and detail['newer'] == 'b', f"{name}: {kind} {detail}"
+
+
+def test_find_duplicate_returns_key():
+    """find_duplicate が重複した画像のキー（アップロード順の番号）を返し、重複を更新版より優先すること"""
+    img = cv2.imread(os.path.join(SAMPLE_DIR, 'S__78209160.jpg'))
+    newer, preflight = fingerprint(img)
+    older, _ = fingerprint(_older_screenshot(img, preflight, newer['line_extent'] / 2))
+    other, _ = fingerprint(cv2.imread(os.path.join(SAMPLE_DIR, 'S__78848008.jpg')))
+
+    assert find_duplicate(newer, [(0, other)]) == (None, None, {})
+    kind, key, _ = find_duplicate(newer, [(0, other), (1, older), (2, newer)])
+    assert (kind, key) == ('duplicate', 2)
+    kind, key, _ = find_duplicate(newer, [(0, other), (1, older)])
+    assert (kind, key) == ('revision', 1)
+
+
+if __name__ == "__main__":
+    test_recompressed_copies_are_duplicates()
+    test_resized_and_scrolled_copies_are_duplicates()
+    test_distinct_samples_are_not_duplicates()
+    test_older_screenshot_is_revision()
+    test_find_duplicate_returns_key()
+    print("✅ 重複判定のテスト完了")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+アーカイブのアップロード
+スクリーンショットをまとめたZIP・tarを1ファイルでアップロードし、画像を1枚ずつ取り出して解析する
+
+アーカイブの中身は展開せず、解析ループが次の画像を要求したときに1メンバーだけ読み込む。
+そのため、同時にメモリに置く画像はアーカイブの大きさに関係なく数枚で済む。
+画像以外のメンバー（フォルダ・macOSのメタデータ・テキストなど）は名前だけで読み飛ばす。
+"""
+
+import io
+import os
+import tarfile
+import zipfile
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+# アップロードを受け付けるアーカイブの拡張子（st.file_uploader の type に追加）
+# st.file_uploader は最後の拡張子で判定するため、.tar.gz は 'gz' で受け付け、.gz はすべてtarとして読む
+ARCHIVE_TYPES = ['zip', 'tar', 'tgz', 'gz']
+
+# アーカイブから取り出す画像の拡張子
+ARCHIVE_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 1メンバーの上限（これより大きいものはスクリーンショットではないとみなして読まない）
+ARCHIVE_MAX_MEMBER_BYTES = 50 * 1024 * 1024
+
+
+def is_archive(name):
+    """ファイル名がアーカイブか"""
+    name = name.lower()
+    return name.endswith(('.zip', '.tar', '.tgz', '.gz'))
+
+
+def _is_image_member(name, size):
+    """取り出す画像のメンバーか（フォルダ・隠しファイル・macOSのリソースフォークを除外）"""
+    base_name = os.path.basename(name)
+    if not base_name or base_name.startswith('.') or name.startswith('__MACOSX/') or '/__MACOSX/' in name:
+        return False
+    if size > ARCHIVE_MAX_MEMBER_BYTES:
+        print(f"Warning: アーカイブ内の大きすぎるファイルをスキップ: {name}（{size:,}バイト）")
+        return False
+    return base_name.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS)
+
+
+class ArchiveImage(io.BytesIO):
+    """アーカイブから取り出した1枚の画像
+
+    アップロードファイル（UploadedFile）と同じく name と getvalue() を持ち、
+    Image.open にもそのまま渡せる。
+    """
+
+    def __init__(self, name, data, archive_name=None):
+        super().__init__(data)
+        self.name = name
+        self.archive_name = archive_name
+
+    def decode(self):
+        """画像をRGBの配列に変換（バイト列から直接 cv2.imdecode、失敗した場合はNone）"""
+        img = cv2.imdecode(np.frombuffer(self.getbuffer(), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def count_archive_images(archive_file):
+    """アーカイブ内の画像の枚数（進捗表示用）
+
+    ZIPは末尾の一覧だけを読む。tarは各メンバーのヘッダーを順に読む（本体は読み飛ばす）。
+    """
+    archive_file.seek(0)
+    try:
+        if zipfile.is_zipfile(archive_file):
+            archive_file.seek(0)
+            with zipfile.ZipFile(archive_file) as zf:
+                return sum(1 for info in zf.infolist()
+                           if not info.is_dir() and _is_image_member(info.filename, info.file_size))
+        archive_file.seek(0)
+        with tarfile.open(fileobj=archive_file, mode='r:*') as tf:
+            return sum(1 for member in tf if member.isfile() and _is_image_member(member.name, member.size))
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        print(f"Warning: アーカイブを読み込めません: {getattr(archive_file, 'name', '')}: {e}")
+        return 0
+    finally:
+        archive_file.seek(0)
+
+
+def iter_archive_images(archive_file, unreadable_files=None):
+    """アーカイブ内の画像を1枚ずつ ArchiveImage として返す
+
+    tarはストリームとして先頭から順に読む（圧縮されていても全体を展開しない）。
+    アーカイブとして読めない場合（tarでない .gz など）は unreadable_files にアーカイブの名前を追加する。
+    """
+    archive_name = getattr(archive_file, 'name', None)
+    archive_file.seek(0)
+    try:
+        if zipfile.is_zipfile(archive_file):
+            archive_file.seek(0)
+            with zipfile.ZipFile(archive_file) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not _is_image_member(info.filename, info.file_size):
+                        continue
+                    with zf.open(info) as member:
+                        yield ArchiveImage(info.filename, member.read(), archive_name)
+            return
+
+        archive_file.seek(0)
+        with tarfile.open(fileobj=archive_file, mode='r|*') as tf:
+            for member in tf:
+                if not member.isfile() or not _is_image_member(member.name, member.size):
+                    continue
+                member_file = tf.extractfile(member)
+                if member_file is not None:
+                    yield ArchiveImage(member.name, member_file.read(), archive_name)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        print(f"Warning: アーカイブを読み込めません: {archive_name}: {e}")
+        if unreadable_files is not None:
+            unreadable_files.append(archive_name)
+
+
+def count_uploads(uploaded_files):
+    """アップロードの画像の枚数（アーカイブは中の画像の枚数）"""
+    return sum(count_archive_images(f) if is_archive(f.name) else 1 for f in uploaded_files)
+
+
+def iter_uploads(uploaded_files, unreadable_files=None):
+    """アップロードファイルを画像1枚ずつに展開（アーカイブは読み込みながら1枚ずつ返す）"""
+    for uploaded_file in uploaded_files:
+        if is_archive(uploaded_file.name):
+            yield from iter_archive_images(uploaded_file, unreadable_files)
+        else:
+            yield uploaded_file
+
+
+def load_upload_array(uploaded_file):
+    """アップロード画像を配列に変換（アーカイブの画像は cv2.imdecode、それ以外は従来どおりPIL、失敗した場合はNone）"""
+    if isinstance(uploaded_file, ArchiveImage):
+        return uploaded_file.decode()
+    try:
+        return np.array(Image.open(uploaded_file))
+    except (UnidentifiedImageError, OSError):
+        return None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+バッチ自動キャリブレーション
+実際の最大値がわかっている複数画像から、±30,000ラインの調整値と補正係数を求める
+
+各画像の検出結果（ゼロライン・最大値のY座標・切り抜き高さ）を1回だけ計測し、
+以降の調整値の計算は計測済みの数値に対する最小二乗法だけで行う。
+"""
+
+import os
+import sys
+import json
+import argparse
+import sqlite3
+
+import cv2
+import numpy as np
+
+from web_analyzer import WebCompatibleAnalyzer
+from graph_detection import detect_graph_layout, linear_scale
+
+# 計測結果に影響する設定項目（グリッド調整値は含まない）
+DETECTION_SETTING_KEYS = (
+    'search_start_offset',
+    'search_end_offset',
+    'crop_top',
+    'crop_bottom',
+    'left_margin',
+    'right_margin',
+)
+
+
+def detection_settings_key(settings):
+    """計測結果のキャッシュキーに使う設定値のタプル"""
+    return tuple(int(settings[k]) for k in DETECTION_SETTING_KEYS)
+
+
+def measure_calibration_sample(img_rgb, settings, name=None, layout=None):
+    """1枚の画像から調整値の計算に必要な中間結果を計測
+
+    グリッド調整値に依存しないピクセル単位の値だけを記録する。
+
+    Returns:
+        dict: 計測結果（グラフデータが検出できない場合はNone）
+    """
+    if layout is None:
+        layout = detect_graph_layout(img_rgb, settings)
+
+    top, bottom = layout['top'], layout['bottom']
+    left, right = layout['left'], layout['right']
+    cropped = img_rgb[top:bottom, left:right]
+    if cropped.size == 0:
+        return None
+
+    zero_in_crop = layout['zero_in_crop']
+    crop_height = cropped.shape[0]
+
+    # ピクセル単位で抽出（スケール1.0 = 値がゼロラインからのピクセル距離）
+    analyzer = WebCompatibleAnalyzer()
+    analyzer.zero_y = zero_in_crop
+    analyzer.scale = 1.0
+    data_points, color, _ = analyzer.extract_graph_data(cv2.cvtColor(cropped, cv2.COLOR_RGB2BGR))
+    if not data_points:
+        return None
+
+    analysis = analyzer.analyze_values(data_points)
+    max_index = analysis['max_index']
+    if max_index >= len(data_points):
+        return None
+    max_x, max_value = data_points[max_index]
+
+    # 抽出時にゼロラインが再検出された場合は、そのゼロラインとスケールで値が決まる
+    zero_overridden = analyzer.zero_y != zero_in_crop
+    max_y_pixel = analyzer.zero_y - max_value / analyzer.scale
+
+    return {
+        'image_name': name,
+        'zero_in_crop': zero_in_crop,
+        'crop_height': crop_height,
+        'max_x': int(max_x),
+        'max_y_pixel': float(max_y_pixel),
+        'color': color,
+        'override_zero': analyzer.zero_y if zero_overridden else None,
+        'override_scale': analyzer.scale if zero_overridden else None,
+    }
+
+
+def predict_max(sample, grid_30k_offset, grid_minus_30k_offset, correction_factor=1.0):
+    """計測結果と調整値から、解析で得られる最大値を予測"""
+    if sample['override_zero'] is not None:
+        value = (sample['override_zero'] - sample['max_y_pixel']) * sample['override_scale']
+    else:
+        scale = linear_scale(sample['zero_in_crop'], sample['crop_height'],
+                             grid_30k_offset, grid_minus_30k_offset)
+        value = (sample['zero_in_crop'] - sample['max_y_pixel']) * scale
+    value = max(-30000, min(30000, value)) * correction_factor
+    # 最大値がマイナスの場合は0とする（analyze_valuesと同じ）
+    return max(0, int(value))
+
+
+def solve_calibration(samples, actual_maxima, settings):
+    """±30,000ライン調整値と補正係数を最小二乗法で同時に求める
+
+    1. ゼロライン再検出のない画像から スケール s を最小二乗で推定
+       （実際の最大値 ≒ s × ゼロラインから最大値までのピクセル距離）
+    2. 30000 / s の距離に合う±30,000ラインの間隔を全画像の最小二乗で決定
+    3. 整数に丸めた調整値での予測値に対して、補正係数を最小二乗で決定
+
+    Args:
+        samples: measure_calibration_sample の結果のリスト
+        actual_maxima: 各画像の実際の最大値（0以下は未入力として除外）
+        settings: 現在の設定（グリッド調整値のフォールバックに使用）
+
+    Returns:
+        dict: 調整値・補正係数・誤差（有効な画像がない場合はNone）
+    """
+    pairs = [(s, float(v)) for s, v in zip(samples, actual_maxima) if s is not None and v and v > 0]
+    if not pairs:
+        return None
+
+    grid_30k_offset = settings.get('grid_30k_offset', 0)
+    grid_minus_30k_offset = settings.get('grid_minus_30k_offset', 0)
+
+    # 1. スケールの推定（ゼロライン再検出のない画像のみ調整値の影響を受ける）
+    # グラフ上限（30,000玉）に張り付いた画像は距離と値が比例しないため除外
+    linear_pairs = [(s, v) for s, v in pairs
+                    if s['override_zero'] is None and s['zero_in_crop'] - s['max_y_pixel'] > 0 and v < 30000]
+    scale = None
+    if linear_pairs:
+        distances = np.array([s['zero_in_crop'] - s['max_y_pixel'] for s, _ in linear_pairs])
+        actual = np.array([v for _, v in linear_pairs])
+        scale = float(distances @ actual / (distances @ distances))
+
+    # 2. ±30,000ライン位置
+    # スケールは2本のラインの間隔（調整値の差）だけで決まるため、
+    # 現在の調整値の中心を保ったまま間隔だけを合わせる
+    if scale and scale > 0:
+        distance_30k = 30000 / scale
+        heights = np.array([s['crop_height'] for s, _ in linear_pairs], dtype=np.float64)
+        spread = int(round(np.mean(2 * distance_30k - heights + 1)))
+        center = (grid_30k_offset + grid_minus_30k_offset) / 2
+        grid_30k_offset = int(round(center - spread / 2))
+        grid_minus_30k_offset = grid_30k_offset + spread
+
+    # 3. 丸めた調整値での予測に対する補正係数
+    predicted = np.array([predict_max(s, grid_30k_offset, grid_minus_30k_offset) for s, _ in pairs],
+                         dtype=np.float64)
+    actual = np.array([v for _, v in pairs])
+    if predicted @ predicted > 0:
+        correction_factor = float(predicted @ actual / (predicted @ predicted))
+    else:
+        correction_factor = 1.0
+
+    corrected = predicted * correction_factor
+    errors = corrected - actual
+
+    return {
+        'grid_30k_offset': grid_30k_offset,
+        'grid_minus_30k_offset': grid_minus_30k_offset,
+        'correction_factor': round(correction_factor, 4),
+        'scale': scale,
+        'rms_error': float(np.sqrt(np.mean(errors ** 2))),
+        'max_abs_error': float(np.max(np.abs(errors))),
+        'samples_used': len(pairs),
+        'per_image': [
+            {
+                'image_name': s['image_name'],
+                'actual': int(v),
+                'predicted': int(round(p)),
+            }
+            for (s, v), p in zip(pairs, corrected)
+        ],
+    }
+
+
+def apply_calibration(settings, solution):
+    """解の調整値を設定に反映した新しい設定を返す"""
+    calibrated = dict(settings)
+    calibrated['grid_30k_offset'] = solution['grid_30k_offset']
+    calibrated['grid_minus_30k_offset'] = solution['grid_minus_30k_offset']
+    calibrated['correction_factor'] = solution['correction_factor']
+    return calibrated
+
+
+def save_preset(db_path, name, settings):
+    """プリセットをデータベースに保存（streamlit_app_full.pyと同じテーブル）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS presets (
+                name TEXT PRIMARY KEY,
+                settings TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            INSERT OR REPLACE INTO presets (name, settings, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', (name, json.dumps(settings)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='実際の最大値がわかっている画像からプリセットを自動調整')
+    parser.add_argument('images', nargs='+', help='調整用の画像')
+    parser.add_argument('--max', required=True,
+                        help='各画像の実際の最大値（カンマ区切り、画像と同じ順番）')
+    parser.add_argument('--settings', help='ベースにする設定のJSONファイル')
+    parser.add_argument('--preset', help='保存するプリセット名（省略時は結果の表示のみ）')
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'presets.db'),
+                        help='プリセットデータベースのパス')
+    args = parser.parse_args()
+
+    actual_maxima = [int(v) for v in args.max.split(',')]
+    if len(actual_maxima) != len(args.images):
+        print("Error: --max の個数が画像の枚数と一致しません")
+        sys.exit(1)
+
+    settings = {
+        'search_start_offset': 50,
+        'search_end_offset': 500,
+        'crop_top': 246,
+        'crop_bottom': 280,
+        'left_margin': 120,
+        'right_margin': 120,
+        'grid_30k_offset': 1,
+        'grid_minus_30k_offset': -34,
+    }
+    if args.settings:
+        with open(args.settings, encoding='utf-8') as f:
+            settings.update(json.load(f))
+
+    samples = []
+    for image_path in args.images:
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"Error: Could not read image {image_path}")
+            samples.append(None)
+            continue
+        sample = measure_calibration_sample(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), settings,
+                                            name=os.path.basename(image_path))
+        if sample is None:
+            print(f"Warning: グラフデータを検出できませんでした: {image_path}")
+        samples.append(sample)
+
+    solution = solve_calibration(samples, actual_maxima, settings)
+    if solution is None:
+        print("Error: 調整に使える画像がありません")
+        sys.exit(1)
+
+    print(f"+30,000ライン調整: {solution['grid_30k_offset']:+d}px")
+    print(f"-30,000ライン調整: {solution['grid_minus_30k_offset']:+d}px")
+    print(f"補正係数: x{solution['correction_factor']:.4f}")
+    print(f"誤差 (RMS): {solution['rms_error']:.0f}玉 / 最大: {solution['max_abs_error']:.0f}玉")
+    for row in solution['per_image']:
+        print(f"  {row['image_name']}: 実際 {row['actual']:,}玉 / 予測 {row['predicted']:,}玉")
+
+    if args.preset:
+        save_preset(args.db, args.preset, apply_calibration(settings, solution))
+        print(f"✅ プリセット '{args.preset}' を保存しました: {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+色分類テーブル
+HSVの色範囲（color_ranges）を、量子化したBGR値→色の該当ビットのテーブルに変換する
+
+各ピクセルの値は、色番号（color_ranges の順番 + 1）ごとに1ビットを立てたビット列で、
+色ごとに cv2.inRange で判定した結果と同じになる（色範囲が重なる場合は両方のビットが立つ）。
+量子化したセル内の全色の判定が同じセルはテーブルの値をそのまま使い、
+判定が分かれるセル（色範囲の境界にかかるセル）は MIXED_CELL とし、該当するピクセルだけHSVで判定し直す。
+
+テーブルは1回だけ作成してディスクにキャッシュし、以降は1回の参照で切り抜き画像の全ピクセルを分類する。
+"""
+
+import os
+import hashlib
+
+import cv2
+import numpy as np
+
+# BGR各チャンネルの量子化ビット数（6ビット = 64^3 = 262,144エントリ）
+COLOR_LUT_BITS = 6
+
+# どの色にも該当しないピクセルの値
+UNCLASSIFIED = 0
+
+# セル内で判定が分かれる（HSVで判定し直す）セルの値
+MIXED_CELL = np.iinfo(np.uint16).max
+
+# テーブルで扱える色の数（MIXED_CELL と区別できるビット数）
+MAX_COLOR_CLASSES = 15
+
+# テーブルのキャッシュ先
+COLOR_LUT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# プロセス内のキャッシュ（色範囲のダイジェスト → テーブル）
+_lut_cache = {}
+
+
+def color_ranges_digest(color_ranges, bits=COLOR_LUT_BITS):
+    """色範囲と量子化ビット数からテーブルの識別子を作成"""
+    md5 = hashlib.md5(f"bits={bits}|membership".encode())
+    for name, color_range in color_ranges.items():
+        md5.update(name.encode('utf-8'))
+        md5.update(np.asarray(color_range['lower'], dtype=np.int64).tobytes())
+        md5.update(np.asarray(color_range['upper'], dtype=np.int64).tobytes())
+    return md5.hexdigest()[:16]
+
+
+def hsv_membership(hsv, color_ranges):
+    """HSV画像の各ピクセルについて、該当する色のビットを立てた値（色ごとの cv2.inRange と同じ判定）"""
+    membership = np.zeros(hsv.shape[:2], dtype=np.uint16)
+    for class_id, color_range in enumerate(color_ranges.values(), start=1):
+        in_range = cv2.inRange(hsv, color_range['lower'], color_range['upper']) > 0
+        membership[in_range] |= np.uint16(1 << (class_id - 1))
+    return membership
+
+
+def build_color_lut(color_ranges, bits=COLOR_LUT_BITS):
+    """量子化BGR→色の該当ビットのテーブルを作成
+
+    全てのBGR値をHSVで判定し（Bの値ごとに分けて変換）、セル内の判定が全て同じならその値、
+    分かれる場合は MIXED_CELL にする。
+    """
+    if len(color_ranges) > MAX_COLOR_CLASSES:
+        raise ValueError(f"色分類テーブルで扱える色は{MAX_COLOR_CLASSES}色までです")
+    levels = 1 << bits
+    cell = 256 // levels
+    g, r = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8), indexing='ij')
+    plane = np.empty((256 * 256, 1, 3), dtype=np.uint8)
+    plane[:, 0, 1] = g.ravel()
+    plane[:, 0, 2] = r.ravel()
+
+    lut = np.empty((levels, levels, levels), dtype=np.uint16)
+    for b_cell in range(levels):
+        # このセルの行（Bの値 cell 個分）の全色を判定 → (B, G, R) の順
+        block = np.empty((cell, 256, 256), dtype=np.uint16)
+        for i in range(cell):
+            plane[:, 0, 0] = b_cell * cell + i
+            hsv = cv2.cvtColor(plane, cv2.COLOR_BGR2HSV)
+            block[i] = hsv_membership(hsv, color_ranges).reshape(256, 256)
+        # (B, G, R) をセル単位に分けて、セル内の値が全て同じかを確認
+        cells = block.reshape(cell, levels, cell, levels, cell).transpose(1, 3, 0, 2, 4).reshape(levels, levels, -1)
+        first = cells[..., 0]
+        uniform = (cells == first[..., np.newaxis]).all(axis=-1)
+        lut[b_cell] = np.where(uniform, first, MIXED_CELL)
+    return lut.ravel()
+
+
+def load_color_lut(color_ranges, bits=COLOR_LUT_BITS, cache_dir=COLOR_LUT_CACHE_DIR):
+    """色分類テーブルを取得（メモリ→ディスク→新規作成の順）"""
+    digest = color_ranges_digest(color_ranges, bits)
+    if digest in _lut_cache:
+        return _lut_cache[digest]
+
+    lut = None
+    cache_path = os.path.join(cache_dir, f"color_lut_{digest}.npy") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            lut = np.load(cache_path)
+            if lut.shape != (1 << (3 * bits),) or lut.dtype != np.uint16:
+                lut = None
+        except Exception as e:
+            print(f"Warning: 色分類テーブルの読み込みに失敗: {e}")
+            lut = None
+
+    if lut is None:
+        lut = build_color_lut(color_ranges, bits)
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.save(cache_path, lut)
+            except Exception as e:
+                # 書き込みできない環境ではメモリのみ
+                print(f"Warning: 色分類テーブルを保存できませんでした: {e}")
+
+    _lut_cache[digest] = lut
+    return lut
+
+
+def classify_pixels(img, lut, color_ranges, bits=COLOR_LUT_BITS):
+    """BGR画像の全ピクセルを色の該当ビットに変換
+
+    テーブルを1回参照し、判定が分かれるセルのピクセルだけHSVで判定し直す。
+    """
+    shift = 8 - bits
+    quantized = (img >> shift).astype(np.intp)
+    index = (quantized[..., 0] << (2 * bits)) | (quantized[..., 1] << bits) | quantized[..., 2]
+    membership = lut[index]
+    mixed = membership == MIXED_CELL
+    if mixed.any():
+        pixels = np.ascontiguousarray(img[mixed]).reshape(-1, 1, 3)
+        membership[mixed] = hsv_membership(cv2.cvtColor(pixels, cv2.COLOR_BGR2HSV), color_ranges).ravel()
+    return membership
+
+
+def class_mask(membership, class_id):
+    """色番号 class_id に該当するピクセルのマスク（bool）"""
+    return (membership & np.uint16(1 << (class_id - 1))) > 0
+
+
+def column_class_stats(membership, n_classes):
+    """色の該当ビットの画像から、色×カラムごとのピクセル数とY座標の合計を求める
+
+    ビットの組み合わせ×カラムで1回集計し、色ごとに該当する組み合わせを足し合わせる
+    （色範囲が重なるピクセルは両方の色に数える）。
+
+    Returns:
+        (counts, row_sums): どちらも (n_classes + 1, width) の配列（行0はどの色にも該当しないピクセル）
+    """
+    height, width = membership.shape
+    values, inverse = np.unique(membership.ravel(), return_inverse=True)
+    index = inverse.reshape(height, width) * width + np.arange(width)
+    size = len(values) * width
+    combo_counts = np.bincount(index.ravel(), minlength=size).reshape(len(values), width)
+    rows = np.repeat(np.arange(height, dtype=np.float64), width)
+    combo_sums = np.bincount(index.ravel(), weights=rows, minlength=size).reshape(len(values), width)
+
+    # (n_classes + 1, 組み合わせ) の対応表
+    bits = np.arange(n_classes, dtype=np.uint16)
+    selector = np.zeros((n_classes + 1, len(values)))
+    selector[0] = values == UNCLASSIFIED
+    selector[1:] = (values[np.newaxis, :] >> bits[:, np.newaxis]) & 1
+    counts = (selector @ combo_counts).astype(np.int64)
+    row_sums = selector @ combo_sums
+    return counts, row_sums
+
+
+def classes_by_columns(counts):
+    """色を、ラインのあるカラム数の多い順に並べる（同数の場合は color_ranges で先に定義された色）
+
+    主系列の色（extract_graph_data・extract_all_series・detect_graph_color）の優先順位は全てこの順番。
+
+    Args:
+        counts: column_class_stats の counts
+
+    Returns:
+        (class_ids, columns_per_class): class_ids はカラムが1つ以上ある色の色番号のリスト（先頭が主系列）、
+        columns_per_class は色番号 - 1 の位置に各色のカラム数
+    """
+    columns_per_class = (counts[1:] > 0).sum(axis=1)
+    order = np.argsort(-columns_per_class, kind='stable')
+    return [int(index) + 1 for index in order if columns_per_class[index] > 0], columns_per_class
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+site7の数字のテンプレート認識
+データ表（累計スタート・大当り回数・初当り回数・スタート・大当り確率・最高出玉）とオレンジバーの台番号は
+site7の固定のフォントで決まった位置に表示されるため、Tesseractを使わずに1文字ずつテンプレートと照合して読む
+
+    reader = DigitTemplateReader()
+    fields, confidence = reader.read_site7(img)   # fields['total_start'] == '4233'、読めない項目はNone
+
+位置: 基準幅（CANONICAL_WIDTH）の座標で、オレンジバーの下端から決まった距離にある（表の各行・バー内の文字）。
+分割: 行ごとに文字を二値化して連結成分に分け、x方向に重なる成分（「回」の内側の四角など）を1文字にまとめる。
+      間隔の広いところで区切り、行の左端のまとまりを左の値、右端のまとまりを右の値とする。
+照合: 文字を高さで揃えた GLYPH_SIZE 四方の画像にし、各テンプレートとの正規化相関の最大値を信頼度とする。
+テンプレート: graphs/original のスクリーンショットと正解ラベル（DIGIT_LABELS_PATH）から learn_templates で作る。
+            評価用の正解ラベル（DIGIT_HOLDOUT_LABELS_PATH）の画像はテンプレートに使わない。
+
+    python digit_ocr.py learn           # テンプレートを作成
+    python digit_ocr.py read 画像...     # 読み取り結果と時間を表示
+
+信頼度が DIGIT_MIN_CONFIDENCE 未満の文字を含む項目はNoneにする（呼び出し側でTesseractに任せる）。
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from graph_detection import CANONICAL_WIDTH, DETECTION_REDUCTION, detect_orange_bottom_multires
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# テンプレートと、テンプレートを作る正解ラベル・スクリーンショット
+DIGIT_TEMPLATE_PATH = os.path.join(_BASE_DIR, 'data', 'digit_templates.npz')
+DIGIT_LABELS_PATH = os.path.join(_BASE_DIR, 'data', 'digit_template_labels.json')
+# テンプレートの評価用の正解ラベル（テンプレートの作成には使わないスクリーンショット）
+DIGIT_HOLDOUT_LABELS_PATH = os.path.join(_BASE_DIR, 'data', 'digit_holdout_labels.json')
+DIGIT_CORPUS_DIR = os.path.join(os.path.dirname(_BASE_DIR), 'graphs', 'original')
+
+# 正規化した文字画像の大きさ（高さを揃え、横は中央に置く）
+GLYPH_SIZE = 28
+
+# これ未満の信頼度の文字を含む項目は読めなかったものとする
+DIGIT_MIN_CONFIDENCE = 0.85
+
+# 文字の縦横比がテンプレートの平均からこれ以上ずれる場合は照合しない（漢字を数字と取り違えない）
+GLYPH_ASPECT_TOLERANCE = 0.2
+
+# 1文字あたりのテンプレートの数（PNGとJPEG、表とバーで文字の輪郭が違うため、サンプルを分類して複数持つ）
+DIGIT_TEMPLATES_PER_CHAR = 3
+
+# 台番号の後に続く「番」の縦横比の範囲（数字がくっついた横長の塊を「番」と取り違えない）
+KANJI_ASPECT_RANGE = (0.8, 1.2)
+
+# 横長の塊を2文字に分けて照合する縦横比の範囲（隣の数字とくっついた場合）
+TOUCHING_ASPECT_RANGE = (1.1, 1.6)
+
+# 文字とみなす濃さ（背景0〜文字255）と、ノイズとして捨てる成分の面積
+INK_THRESHOLD = 110
+GLYPH_MIN_AREA = 6
+
+# 値の文字の間隔の上限（これより広い間隔はラベルとの区切り）
+GLYPH_GAP = 22
+
+# データ表の位置（基準幅の座標。行の上端はオレンジバーの下端からの距離）
+TABLE_FIRST_ROW_OFFSET = 1022
+TABLE_ROW_PITCH = 42
+TABLE_X_RANGE = (340, 1080)
+
+# データ表の各行の項目（左の値、右の値）
+TABLE_FIELDS = (
+    ('total_start', 'current_start'),
+    ('jackpot_count', 'jackpot_probability'),
+    ('first_hit_count', 'max_payout'),
+)
+
+# オレンジバー内の文字の範囲（上下はバーの下端からの距離、角の丸みと余白を除く）
+BAR_TOP_OFFSET = 76
+BAR_BOTTOM_OFFSET = 8
+BAR_X_RANGE = (160, 1020)
+
+# 項目ごとの表示形式（読み取った文字列から値を取り出す）
+FIELD_PATTERNS = {
+    'total_start': re.compile(r'^(\d+)$'),
+    'current_start': re.compile(r'^(\d+)$'),
+    'jackpot_count': re.compile(r'^(\d+)回$'),
+    'first_hit_count': re.compile(r'^(\d+)回$'),
+    'jackpot_probability': re.compile(r'^(1/\d+)$'),
+    'max_payout': re.compile(r'^(\d+)$'),
+}
+
+# データ表の全項目
+SITE7_TABLE_FIELDS = tuple(field for pair in TABLE_FIELDS for field in pair)
+
+# データがない項目の表示（大当りがない場合の大当り確率など）
+FIELD_EMPTY = '--'
+
+
+def segment_glyphs(ink, threshold=INK_THRESHOLD, min_area=GLYPH_MIN_AREA):
+    """連結成分で文字に分割（x方向に重なる成分は1文字にまとめる）
+
+    Returns:
+        [(x0, y0, x1, y1), ...]: 左から順の文字の範囲
+    """
+    mask = (ink > threshold).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    boxes = sorted([int(x), int(y), int(x + w), int(y + h)]
+                   for x, y, w, h, area in stats[1:] if area >= min_area)
+    merged = []
+    for box in boxes:
+        if merged:
+            last = merged[-1]
+            overlap = last[2] - box[0]
+            if overlap > 0.3 * min(last[2] - last[0], box[2] - box[0]):
+                last[1], last[2], last[3] = min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])
+                continue
+        merged.append(box)
+    return [tuple(box) for box in merged]
+
+
+def split_groups(boxes, gap=GLYPH_GAP):
+    """文字の間隔が gap を超えるところで区切る"""
+    groups = []
+    for box in boxes:
+        if groups and box[0] - groups[-1][-1][2] <= gap:
+            groups[-1].append(box)
+        else:
+            groups.append([box])
+    return groups
+
+
+def normalize_glyph(ink, box):
+    """文字を GLYPH_SIZE 四方に正規化（平均0・長さ1のベクトル）し、縦横比と合わせて返す"""
+    x0, y0, x1, y1 = box
+    glyph = ink[y0:y1, x0:x1].astype(np.float32)
+    height, width = glyph.shape
+    scaled_width = max(1, min(GLYPH_SIZE, int(round(width * GLYPH_SIZE / height))))
+    canvas = np.zeros((GLYPH_SIZE, GLYPH_SIZE), dtype=np.float32)
+    left = (GLYPH_SIZE - scaled_width) // 2
+    canvas[:, left:left + scaled_width] = cv2.resize(glyph, (scaled_width, GLYPH_SIZE),
+                                                     interpolation=cv2.INTER_AREA)
+    vector = canvas.ravel()
+    vector = vector - vector.mean()
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm > 0 else vector), width / height
+
+
+def _canonical_region(img, y0, y1, x0, x1, scale):
+    """基準幅の座標の範囲を元画像から切り出し、基準幅の倍率に拡大縮小（範囲外はNone）"""
+    src_y0, src_y1 = int(round(y0 / scale)), int(round(y1 / scale))
+    src_x0, src_x1 = int(round(x0 / scale)), int(round(x1 / scale))
+    if src_y0 < 0 or src_y1 > img.shape[0] or src_y1 <= src_y0:
+        return None
+    region = img[src_y0:src_y1, src_x0:src_x1]
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        region = cv2.resize(region, (x1 - x0, y1 - y0), interpolation=interpolation)
+    return region
+
+
+def locate_field_glyphs(img, bgr=False, orange_bottom=None):
+    """データ表とオレンジバーの文字を切り出す
+
+    Args:
+        img: スクリーンショット（元の解像度）
+        orange_bottom: 元画像でのオレンジバーの下端（省略時は検出）
+
+    Returns:
+        {項目名: (濃さの画像, 文字の範囲のリスト)}: 表の項目と 'machine_number'（バー内の全文字）。
+        表が画面外・別の要素で隠れている項目は含まない
+    """
+    if img is None or img.ndim != 3:
+        return {}
+    scale = CANONICAL_WIDTH / img.shape[1]
+    if orange_bottom is None:
+        # バーの位置の見当を付けるだけなので、面積平均ではなく間引きで縮小する（下端はフル解像度の帯で確定）
+        small = np.ascontiguousarray(img[::DETECTION_REDUCTION, ::DETECTION_REDUCTION])
+        orange_bottom = detect_orange_bottom_multires(img, small, bgr=bgr)
+    if orange_bottom is None:
+        return {}
+    orange_bottom = int(round(orange_bottom * scale))
+    fields = {}
+
+    # オレンジバー: 白い文字（オレンジの背景は青チャンネルが低いため、チャンネルの最小値で文字だけが残る）
+    bar = _canonical_region(img, orange_bottom - BAR_TOP_OFFSET, orange_bottom - BAR_BOTTOM_OFFSET,
+                            BAR_X_RANGE[0], BAR_X_RANGE[1], scale)
+    if bar is not None:
+        ink = bar.min(axis=2)
+        fields['machine_number'] = (ink, segment_glyphs(ink))
+
+    # データ表: 明るい背景に暗い文字
+    table_top = orange_bottom + TABLE_FIRST_ROW_OFFSET
+    table = _canonical_region(img, table_top, table_top + TABLE_ROW_PITCH * len(TABLE_FIELDS),
+                              TABLE_X_RANGE[0], TABLE_X_RANGE[1], scale)
+    if table is None:
+        return fields
+    gray = cv2.cvtColor(table, cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY)
+    for row, (left_field, right_field) in enumerate(TABLE_FIELDS):
+        ink = 255 - gray[row * TABLE_ROW_PITCH:(row + 1) * TABLE_ROW_PITCH]
+        groups = split_groups(segment_glyphs(ink))
+        # 左の値・右のラベル・右の値の3つ以上に分かれない行は表ではない（隠れている・画面外）
+        if len(groups) < 3:
+            continue
+        fields[left_field] = (ink, groups[0])
+        fields[right_field] = (ink, groups[-1])
+    return fields
+
+
+class DigitTemplateReader:
+    """テンプレート照合による数字の読み取り"""
+
+    def __init__(self, template_path=DIGIT_TEMPLATE_PATH, min_confidence=DIGIT_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.chars = []
+        self.templates = None
+        self.aspects = None
+        if os.path.exists(template_path):
+            try:
+                with np.load(template_path) as data:
+                    self.chars = [str(c) for c in data['chars']]
+                    self.templates = data['templates'].reshape(len(self.chars), -1).astype(np.float32)
+                    self.aspects = data['aspects'].astype(np.float32)
+            except Exception as e:
+                print(f"Warning: 数字のテンプレートを読み込めません: {template_path}: {e}")
+                self.chars = []
+
+    @property
+    def available(self):
+        return bool(self.chars)
+
+    def classify(self, ink, box):
+        """1文字を照合
+
+        Returns:
+            (文字, 信頼度): 縦横比の合うテンプレートがない場合は (None, 0.0)
+        """
+        vector, aspect = normalize_glyph(ink, box)
+        candidates = np.abs(self.aspects - aspect) <= GLYPH_ASPECT_TOLERANCE
+        if not candidates.any():
+            return None, 0.0
+        scores = np.where(candidates, self.templates @ vector, -1.0)
+        best = int(np.argmax(scores))
+        return self.chars[best], float(scores[best])
+
+    def classify_run(self, ink, box):
+        """1文字、または横長の塊を2文字に分けて照合
+
+        Returns:
+            [(文字, 信頼度), ...]: 照合できない場合は [(None, 0.0)]
+        """
+        char, score = self.classify(ink, box)
+        x0, y0, x1, y1 = box
+        aspect = (x1 - x0) / (y1 - y0)
+        if char is None and TOUCHING_ASPECT_RANGE[0] <= aspect <= TOUCHING_ASPECT_RANGE[1]:
+            middle = (x0 + x1) // 2
+            halves = [self.classify(ink, (x0, y0, middle, y1)), self.classify(ink, (middle, y0, x1, y1))]
+            if all(half_char is not None and half_char.isdigit() for half_char, _ in halves):
+                return halves
+        return [(char, score)]
+
+    def read_glyphs(self, ink, boxes):
+        """文字列を照合（信頼度は最も低い文字の値）"""
+        text = []
+        confidence = 1.0
+        for box in boxes:
+            for char, score in self.classify_run(ink, box):
+                if char is None:
+                    return None, 0.0
+                text.append(char)
+                confidence = min(confidence, score)
+        return ''.join(text), confidence
+
+    def read_machine_number(self, ink, boxes):
+        """バーの先頭から続く数字を台番号として読む（「番台」の手前まで）"""
+        digits = []
+        confidence = 1.0
+        for box in boxes:
+            run = self.classify_run(ink, box)
+            if all(char is not None and char.isdigit() and score >= self.min_confidence for char, score in run):
+                digits.extend(char for char, _ in run)
+                confidence = min([confidence] + [score for _, score in run])
+                continue
+            # 数字の後に「番」（正方形に近い文字）が続く場合だけ台番号とみなす
+            x0, y0, x1, y1 = box
+            if digits and KANJI_ASPECT_RANGE[0] <= (x1 - x0) / (y1 - y0) <= KANJI_ASPECT_RANGE[1]:
+                return ''.join(digits), confidence
+            return None, 0.0
+        return None, 0.0
+
+    def is_confident(self, confidence, fields=SITE7_TABLE_FIELDS):
+        """指定した項目（省略時はデータ表の全項目）をすべて信頼度以上で読めたか"""
+        return self.available and all(confidence.get(field, 0.0) >= self.min_confidence for field in fields)
+
+    def confident_fields(self, fields, confidence, names=SITE7_TABLE_FIELDS):
+        """信頼度以上で読めた項目だけの辞書（含まれない項目は呼び出し側でTesseractの結果を使う）"""
+        return {field: fields[field] for field in names
+                if fields.get(field) is not None and confidence.get(field, 0.0) >= self.min_confidence}
+
+    def read_site7(self, img, bgr=False, orange_bottom=None):
+        """site7のスクリーンショットの数値項目を読み取る
+
+        Returns:
+            (fields, confidence): fields は extract_site7_data と同じキー
+                （machine_number は「123番台」、jackpot_probability は「1/156」、他は数字の文字列）。
+                読めなかった項目はNone。confidence は項目ごとの信頼度
+        """
+        fields = {field: None for field in SITE7_TABLE_FIELDS}
+        fields['machine_number'] = None
+        confidence = {field: 0.0 for field in fields}
+        if not self.available:
+            return fields, confidence
+
+        for field, (ink, boxes) in locate_field_glyphs(img, bgr=bgr, orange_bottom=orange_bottom).items():
+            if field == 'machine_number':
+                text, score = self.read_machine_number(ink, boxes)
+                value = f"{text}番台" if text else None
+            else:
+                text, score = self.read_glyphs(ink, boxes)
+                match = FIELD_PATTERNS[field].match(text) if text else None
+                value = match.group(1) if match else None
+                # 表示形式に合わない読み取りは信頼しない（データがない場合の「--」は読めたものとする）
+                if value is None and text != FIELD_EMPTY:
+                    score = 0.0
+            confidence[field] = score
+            if value is not None and score >= self.min_confidence:
+                fields[field] = value
+        return fields, confidence
+
+
+def format_site7_text(fields):
+    """読み取った項目を画面の表と同じ並びのテキストにする（OCRテキストの確認表示用）"""
+    def show(field, suffix=''):
+        value = fields.get(field)
+        return f"{value}{suffix}" if value is not None else FIELD_EMPTY
+
+    lines = []
+    if fields.get('machine_number'):
+        lines.append(fields['machine_number'])
+    lines.append(f"累計スタート {show('total_start')} スタート {show('current_start')}")
+    lines.append(f"大当り回数 {show('jackpot_count', '回')} 大当り確率 {show('jackpot_probability')}")
+    lines.append(f"初当り回数 {show('first_hit_count', '回')} 最高出玉 {show('max_payout')}")
+    return '\n'.join(lines)
+
+
+def learn_templates(corpus_dir=DIGIT_CORPUS_DIR, labels_path=DIGIT_LABELS_PATH, output_path=DIGIT_TEMPLATE_PATH):
+    """正解ラベル付きのスクリーンショットから文字ごとのテンプレートを作成
+
+    ラベルは {ファイル名: {項目名: 表示どおりの文字列}}（例: "jackpot_count": "27回", "machine_number": "70"）。
+    文字数とラベルの長さが一致した項目だけを使い、文字ごとに正規化した画像を平均する。
+
+    Returns:
+        dict: 文字 → 使ったサンプル数
+    """
+    with open(labels_path, encoding='utf-8') as f:
+        labels = json.load(f)
+
+    samples = {}
+    skipped = 0
+    for file_name, expected in labels.items():
+        img = cv2.imread(os.path.join(corpus_dir, file_name))
+        if img is None:
+            print(f"Warning: 画像を読み込めません: {file_name}")
+            continue
+        for field, (ink, boxes) in locate_field_glyphs(img, bgr=True).items():
+            text = expected.get(field)
+            if not text:
+                continue
+            if field == 'machine_number':
+                boxes = boxes[:len(text)]
+            if len(boxes) != len(text):
+                print(f"Warning: 文字数がラベルと一致しません: {file_name} {field}（{len(boxes)}文字 / {text}）")
+                skipped += 1
+                continue
+            for char, box in zip(text, boxes):
+                samples.setdefault(char, []).append(normalize_glyph(ink, box))
+
+    # 文字ごとにサンプルを最大 DIGIT_TEMPLATES_PER_CHAR 個に分類し、各分類の平均をテンプレートにする
+    cv2.setRNGSeed(0)
+    chars, templates, aspects = [], [], []
+    for char in sorted(samples):
+        vectors = np.array([vector for vector, _ in samples[char]], dtype=np.float32)
+        char_aspects = np.array([aspect for _, aspect in samples[char]], dtype=np.float32)
+        clusters = min(DIGIT_TEMPLATES_PER_CHAR, len(vectors))
+        if clusters > 1:
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1e-4)
+            _, assignment, _ = cv2.kmeans(vectors, clusters, None, criteria, 3, cv2.KMEANS_PP_CENTERS)
+            assignment = assignment.ravel()
+        else:
+            assignment = np.zeros(len(vectors), dtype=np.int32)
+        for cluster in range(clusters):
+            members = assignment == cluster
+            if not members.any():
+                continue
+            mean = vectors[members].mean(axis=0)
+            mean -= mean.mean()
+            chars.append(char)
+            templates.append(mean / np.linalg.norm(mean))
+            aspects.append(char_aspects[members].mean())
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    np.savez_compressed(output_path, chars=np.array(chars),
+                        templates=np.array(templates, dtype=np.float32).reshape(-1, GLYPH_SIZE, GLYPH_SIZE),
+                        aspects=np.array(aspects, dtype=np.float32))
+    if skipped:
+        print(f"Warning: {skipped}項目をスキップしました")
+    return {char: len(samples[char]) for char in sorted(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='site7の数字のテンプレート認識')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    learn_parser = subparsers.add_parser('learn', help='正解ラベルからテンプレートを作成')
+    learn_parser.add_argument('--corpus', default=DIGIT_CORPUS_DIR, help='スクリーンショットのフォルダ')
+    learn_parser.add_argument('--labels', default=DIGIT_LABELS_PATH, help='正解ラベル（JSON）')
+    learn_parser.add_argument('--output', default=DIGIT_TEMPLATE_PATH, help='テンプレートの保存先')
+    read_parser = subparsers.add_parser('read', help='画像の数値項目を読み取る')
+    read_parser.add_argument('images', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'learn':
+        counts = learn_templates(args.corpus, args.labels, args.output)
+        print(f"テンプレートを保存しました: {args.output}")
+        print('  ' + ', '.join(f"{char}: {count}" for char, count in counts.items()))
+        return
+
+    reader = DigitTemplateReader()
+    if not reader.available:
+        print(f"テンプレートがありません（python digit_ocr.py learn で作成）: {DIGIT_TEMPLATE_PATH}")
+        return
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"{path}: 読み込めません")
+            continue
+        start = time.perf_counter()
+        fields, confidence = reader.read_site7(img, bgr=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{os.path.basename(path)} ({elapsed:.1f}ms): " +
+              ', '.join(f"{field}={value}({confidence[field]:.2f})" for field, value in fields.items()))
+
+
+if __name__ == '__main__':
+    main()
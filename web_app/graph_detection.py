@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+グラフ領域検出モジュール
+オレンジバー・ゼロライン検出と切り抜き範囲の計算（Pattern3: Zero Line Based）
+
+streamlit_app_full.py の各セクションで同じロジックを使うための共通実装。
+行ごとのループをベクトル化しているが、検出結果は従来の実装と同じ。
+"""
+
+import cv2
+import numpy as np
+
+# site7のオレンジバー検出用HSV範囲
+ORANGE_LOWER = np.array([10, 100, 100])
+ORANGE_UPPER = np.array([30, 255, 255])
+
+# オレンジバーが見つからない場合のデフォルト位置
+DEFAULT_ORANGE_BOTTOM = 150
+
+# ゼロライン検出で左右から除外するピクセル数
+ZERO_LINE_SIDE_MARGIN = 100
+
+# 基準となる画面幅（デフォルト設定を調整したiPhoneのスクリーンショット幅）
+# プリセットのピクセル値はこの幅の画像に対する値として扱う
+CANONICAL_WIDTH = 1179
+
+# 縮小画像での検出に使う縮小率（1/2, 1/4, 1/8）
+DETECTION_REDUCTION = 4
+
+# 縮小画像で見つけたゼロライン候補の数（フル解像度で再評価する）
+ZERO_LINE_CANDIDATES = 3
+
+# 縮小デコード用のフラグ
+REDUCED_COLOR_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def normalize_resolution(img, reference_width=CANONICAL_WIDTH):
+    """画像を基準幅に拡大縮小
+
+    Args:
+        img: 入力画像
+        reference_width: 基準幅（Noneの場合は変換しない）
+
+    Returns:
+        (normalized, scale_factor): 変換後の画像と倍率（基準幅 / 元の幅）
+    """
+    if not reference_width:
+        return img, 1.0
+    height, width = img.shape[:2]
+    if width == reference_width:
+        return img, 1.0
+
+    scale_factor = reference_width / width
+    # 縮小は面積平均、拡大は色が変わりにくい線形補間
+    interpolation = cv2.INTER_AREA if scale_factor < 1 else cv2.INTER_LINEAR
+    normalized = cv2.resize(img, (reference_width, int(round(height * scale_factor))),
+                            interpolation=interpolation)
+    return normalized, scale_factor
+
+
+def layout_to_source(layout, scale_factor):
+    """正規化画像での検出結果（Y座標と切り抜き範囲）を元画像の座標に変換"""
+    if scale_factor == 1.0:
+        return dict(layout)
+    source = dict(layout)
+    for key in ('orange_bottom', 'search_start', 'search_end', 'zero_line_y',
+                'top', 'bottom', 'left', 'right', 'zero_in_crop', 'crop_height'):
+        source[key] = int(round(layout[key] / scale_factor))
+    return source
+
+
+def detect_orange_bottom(img_rgb):
+    """オレンジバーの下端Y座標を検出"""
+    height, width = img_rgb.shape[:2]
+    hsv = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2HSV)
+    orange_mask = cv2.inRange(hsv, ORANGE_LOWER, ORANGE_UPPER)
+    return orange_bottom_from_mask(orange_mask)
+
+
+def orange_bottom_from_mask(orange_mask):
+    """オレンジマスクからバーの下端を求める"""
+    orange_bottom = _orange_bar_end(orange_mask, orange_mask.shape[0])
+    if orange_bottom is None:
+        return DEFAULT_ORANGE_BOTTOM
+    return orange_bottom
+
+
+def _orange_bar_end(orange_mask, height, offset=0):
+    """マスク（画像のoffset行目以降の帯）からオレンジバーの下端を求める
+
+    Returns:
+        int: 画像座標での下端（見つからない場合はNone）
+    """
+    width = orange_mask.shape[1]
+    row_sums = orange_mask.sum(axis=1, dtype=np.int64)
+
+    # 上半分でオレンジが30%以上の最後の行
+    bar_rows = np.flatnonzero(row_sums[:max(0, height // 2 - offset)] > width * 0.3 * 255)
+    if len(bar_rows) == 0 or bar_rows[-1] + offset == 0:
+        return None
+    orange_bottom = int(bar_rows[-1])
+
+    # オレンジバーの下端を正確に見つける（10%未満になる最初の行）
+    window = row_sums[orange_bottom:min(orange_bottom + 100, height - offset)]
+    below = np.flatnonzero(window < width * 0.1 * 255)
+    if len(below) > 0:
+        orange_bottom += int(below[0])
+    return orange_bottom + offset
+
+
+def compute_row_scores(gray, side_margin=ZERO_LINE_SIDE_MARGIN):
+    """各行のゼロラインらしさ（暗さ＋均一さ）をまとめて計算"""
+    width = gray.shape[1]
+    rows = gray[:, side_margin:width - side_margin].astype(np.float64)
+    darkness = 1.0 - (rows.mean(axis=1) / 255.0)
+    uniformity = 1.0 - (rows.std(axis=1) / 128.0)
+    return darkness * 0.5 + uniformity * 0.5
+
+
+def find_zero_line(row_scores, search_start, search_end):
+    """検索範囲内で最もスコアの高い行をゼロラインとする
+
+    Returns:
+        (zero_line_y, best_score): スコアが0以下なら範囲の中央を返す
+    """
+    zero_line_y = (search_start + search_end) // 2
+    start = max(0, search_start)
+    window = row_scores[start:max(start, search_end)]
+    if len(window) == 0:
+        return zero_line_y, 0
+
+    best = int(np.argmax(window))
+    best_score = float(window[best])
+    if best_score <= 0:
+        return zero_line_y, 0
+    return start + best, best_score
+
+
+def search_range(orange_bottom, height, settings):
+    """設定値からゼロラインの検索範囲を計算"""
+    search_start = orange_bottom + settings['search_start_offset']
+    search_end = min(height - 100, orange_bottom + settings['search_end_offset'])
+    return search_start, search_end
+
+
+def crop_box(zero_line_y, height, width, settings):
+    """ゼロラインと設定値から切り抜き範囲 (top, bottom, left, right) を計算"""
+    top = max(0, zero_line_y - settings['crop_top'])
+    bottom = min(height, zero_line_y + settings['crop_bottom'])
+    left = settings['left_margin']
+    right = width - settings['right_margin']
+    return int(top), int(bottom), int(left), int(right)
+
+
+def detect_graph_layout(img_rgb, settings, gray=None, row_scores=None, orange_bottom=None):
+    """オレンジバー・ゼロライン・切り抜き範囲をまとめて検出
+
+    既に計算済みの中間結果（gray, row_scores, orange_bottom）があれば再利用する。
+    """
+    height, width = img_rgb.shape[:2]
+
+    if orange_bottom is None:
+        orange_bottom = detect_orange_bottom(img_rgb)
+    if row_scores is None:
+        if gray is None:
+            gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+        row_scores = compute_row_scores(gray)
+
+    search_start, search_end = search_range(orange_bottom, height, settings)
+    zero_line_y, best_score = find_zero_line(row_scores, search_start, search_end)
+    top, bottom, left, right = crop_box(zero_line_y, height, width, settings)
+
+    return {
+        'orange_bottom': orange_bottom,
+        'search_start': search_start,
+        'search_end': search_end,
+        'zero_line_y': zero_line_y,
+        'best_score': best_score,
+        'top': top,
+        'bottom': bottom,
+        'left': left,
+        'right': right,
+        'zero_in_crop': zero_line_y - top,
+        'crop_height': bottom - top,
+    }
+
+
+def linear_scale(zero_in_crop, crop_height, grid_30k_offset, grid_minus_30k_offset):
+    """調整された±30,000ライン位置から線形スケール（玉/ピクセル）を計算"""
+    distance_to_plus_30k = zero_in_crop - grid_30k_offset
+    distance_to_minus_30k = (crop_height - 1 + grid_minus_30k_offset) - zero_in_crop
+
+    if distance_to_plus_30k > 0 and distance_to_minus_30k > 0:
+        return 30000 / ((distance_to_plus_30k + distance_to_minus_30k) / 2)
+
+    # フォールバック（調整前の値を使用）
+    return 30000 / ((zero_in_crop + (crop_height - zero_in_crop)) / 2)
+
+
+# ---------------------------------------------------------------------------
+# 縮小画像による検出（フル解像度は狭い帯だけ参照する）
+# ---------------------------------------------------------------------------
+
+def decode_reduced(file_bytes, reduction=DETECTION_REDUCTION):
+    """画像バイト列を縮小デコード（RGB）
+
+    JPEGはデコード時に縮小されるため高速。PNGは内部で全体をデコードしてから縮小される。
+    """
+    flag = REDUCED_COLOR_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(np.frombuffer(file_bytes, dtype=np.uint8), flag)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def reduce_image(img, reduction=DETECTION_REDUCTION):
+    """デコード済み画像を検出用に縮小（面積平均）"""
+    height, width = img.shape[:2]
+    return cv2.resize(img, (max(1, width // reduction), max(1, height // reduction)),
+                      interpolation=cv2.INTER_AREA)
+
+
+def _row_band(center_rows, ratio, pad, limit_start, limit_end):
+    """縮小画像の行範囲をフル解像度の行範囲に変換（前後にpad行の余裕）"""
+    start = int(np.floor(center_rows[0] * ratio)) - pad
+    end = int(np.ceil((center_rows[1] + 1) * ratio)) + pad
+    return max(limit_start, start), min(limit_end, end)
+
+
+def detect_orange_bottom_multires(img, small, bgr=False):
+    """縮小画像でオレンジバーの位置を求め、フル解像度の帯で下端を確定"""
+    height = img.shape[0]
+    ratio = height / small.shape[0]
+    hsv_code = cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV
+
+    small_mask = cv2.inRange(cv2.cvtColor(small, hsv_code), ORANGE_LOWER, ORANGE_UPPER)
+    coarse = _orange_bar_end(small_mask, small.shape[0])
+    if coarse is None:
+        # 縮小画像で見つからない場合はフル解像度で検出
+        full_mask = cv2.inRange(cv2.cvtColor(img, hsv_code), ORANGE_LOWER, ORANGE_UPPER)
+        return orange_bottom_from_mask(full_mask)
+
+    # バー下端付近の帯だけフル解像度で判定（バー最終行の判定と下端探索の100行を含む）
+    pad = int(np.ceil(ratio)) * 2
+    band_start, band_end = _row_band((coarse - 1, coarse), ratio, pad, 0, height)
+    band_end = min(height, band_end + 100)
+    band_mask = cv2.inRange(cv2.cvtColor(img[band_start:band_end], hsv_code), ORANGE_LOWER, ORANGE_UPPER)
+    orange_bottom = _orange_bar_end(band_mask, height, offset=band_start)
+    if orange_bottom is None:
+        full_mask = cv2.inRange(cv2.cvtColor(img, hsv_code), ORANGE_LOWER, ORANGE_UPPER)
+        return orange_bottom_from_mask(full_mask)
+    return orange_bottom
+
+
+def find_zero_line_multires(img, small, search_start, search_end, bgr=False):
+    """縮小画像でゼロライン候補を絞り込み、候補付近の行だけフル解像度で評価
+
+    Returns:
+        (zero_line_y, best_score): find_zero_line と同じ形式
+    """
+    height = img.shape[0]
+    ratio = height / small.shape[0]
+    gray_code = cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY
+    start = max(0, search_start)
+    if search_end <= start:
+        return (search_start + search_end) // 2, 0
+
+    # 縮小画像で候補行（スコア上位）を選ぶ
+    small_gray = cv2.cvtColor(small, gray_code)
+    small_scores = compute_row_scores(small_gray, side_margin=int(round(ZERO_LINE_SIDE_MARGIN / ratio)))
+    small_start = int(start / ratio)
+    small_end = min(len(small_scores), int(np.ceil(search_end / ratio)))
+    window = small_scores[small_start:small_end]
+    if len(window) == 0:
+        return find_zero_line(compute_row_scores(cv2.cvtColor(img, gray_code)), search_start, search_end)
+    candidates = small_start + np.argsort(-window, kind='stable')[:ZERO_LINE_CANDIDATES]
+
+    # 候補付近の帯だけフル解像度でスコアを計算
+    pad = int(np.ceil(ratio))
+    best_y, best_score = None, 0
+    for candidate in sorted(candidates):
+        band_start, band_end = _row_band((candidate, candidate), ratio, pad, start, search_end)
+        if band_end <= band_start:
+            continue
+        band_scores = compute_row_scores(cv2.cvtColor(img[band_start:band_end], gray_code))
+        best = int(np.argmax(band_scores))
+        score = float(band_scores[best])
+        if score > best_score or (score == best_score and best_y is not None and band_start + best < best_y):
+            best_y, best_score = band_start + best, score
+
+    if best_y is None or best_score <= 0:
+        return (search_start + search_end) // 2, 0
+    return best_y, best_score
+
+
+def detect_graph_layout_multires(img, settings, small=None, reduction=DETECTION_REDUCTION, bgr=False):
+    """縮小画像を使ってオレンジバー・ゼロライン・切り抜き範囲を検出
+
+    フル解像度の画素はオレンジバー下端とゼロライン候補付近の帯だけ参照する。
+    戻り値は detect_graph_layout と同じ。
+    """
+    height, width = img.shape[:2]
+    if small is None:
+        small = reduce_image(img, reduction)
+
+    orange_bottom = detect_orange_bottom_multires(img, small, bgr=bgr)
+    search_start, search_end = search_range(orange_bottom, height, settings)
+    zero_line_y, best_score = find_zero_line_multires(img, small, search_start, search_end, bgr=bgr)
+    top, bottom, left, right = crop_box(zero_line_y, height, width, settings)
+
+    return {
+        'orange_bottom': orange_bottom,
+        'search_start': search_start,
+        'search_end': search_end,
+        'zero_line_y': zero_line_y,
+        'best_score': best_score,
+        'top': top,
+        'bottom': bottom,
+        'left': left,
+        'right': right,
+        'zero_in_crop': zero_line_y - top,
+        'crop_height': bottom - top,
+    }
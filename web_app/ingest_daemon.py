@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+取り込みデーモン
+共有フォルダに同期されたスクリーンショットを監視し、追加された画像だけをその場で解析する
+
+    python ingest_daemon.py 監視するフォルダ [監視するフォルダ ...] [--report-dir reports/ingest]
+
+処理の流れ:
+    1. 監視（Linuxはinotify、使えない環境はフォルダの定期的な確認）
+    2. 書き込み途中のファイルを待つ（サイズと更新時刻が INGEST_SETTLE_SECONDS 変わらなくなるまで）
+    3. 内容のハッシュ（MD5、streamlit_app_full.py の image_digest と同じ）で解析済みの画像を除外
+    4. プロセスプールで解析（WebCompatibleAnalyzer.process_single_image、同時に投入する数に上限）
+       画像はメインプロセスで読み込み、入力の画像と結果の画像（切り抜き・オーバーレイ）は
+       共有メモリで受け渡す（shared_frames.py）。結果の画像はメインプロセスがレポートのフォルダに保存する
+    5. 解析結果データベースに保存し、その日のレポート（日付ごとのフォルダの index.html）に追加
+
+フォルダ全体を解析し直す complete_pipeline.py と違い、新しい画像1枚あたり数秒で結果が出る。
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from concurrent.futures import wait
+from datetime import datetime
+
+import cv2
+
+from results_store import ResultsStore, machine_number_from_file_name
+from shared_frames import SharedFrameExecutor
+
+# 解析する画像の拡張子
+INGEST_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 書き込み完了とみなすまでの時間（秒、この間サイズと更新時刻が変わらないこと）
+INGEST_SETTLE_SECONDS = 1.0
+
+# inotifyが使えない場合のフォルダの確認間隔（秒）
+INGEST_POLL_INTERVAL = 2.0
+
+# 解析プロセス数と、プロセス1つあたりに先行して投入する画像の数
+INGEST_MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+INGEST_QUEUE_PER_WORKER = 2
+
+# 共有メモリで受け取る結果の画像と、その保存先のファイル名の結果のキー
+INGEST_OUTPUT_IMAGES = {'cropped': 'cropped_image', 'overlay': 'visualization'}
+
+# オーバーレイ画像の最大サイズ（create_analysis_image の figsize=(20, 14)・dpi=150 のBGR画像）
+INGEST_OVERLAY_BYTES = (20 * 150) * (14 * 150) * 3
+
+# 既定のレポートの保存先（日付ごとのフォルダを作成）
+INGEST_REPORT_DIR = os.path.join('reports', 'ingest')
+
+# inotifyのイベント（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def _is_image(path):
+    return path.lower().endswith(INGEST_EXTENSIONS) and not os.path.basename(path).startswith('.')
+
+
+def _list_images(directory, recursive):
+    """フォルダ内の画像（起動時とinotifyのイベントが溢れた場合だけ使う）"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if _is_image(path):
+                yield path
+        if not recursive:
+            break
+
+
+class InotifyWatcher:
+    """inotifyによる監視（Linuxのみ、使えない場合は OSError）"""
+
+    def __init__(self, directories, recursive=False):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError('inotifyはLinuxでのみ使えます')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1に失敗しました')
+        self.recursive = recursive
+        self._directories = {}
+        for directory in directories:
+            for root, _, _ in os.walk(directory):
+                self._add_watch(root)
+                if not recursive:
+                    break
+
+    def _add_watch(self, directory):
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'監視を追加できません: {directory}')
+        self._directories[wd] = directory
+
+    def poll(self, timeout):
+        """変更されたファイルのパスを返す（timeout秒まで待つ）"""
+        paths = []
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return paths
+
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return paths
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buffer):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            name = buffer[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # イベントが溢れた場合は取りこぼしがないよう監視中のフォルダを確認し直す
+                print("Warning: inotifyのイベントが溢れたため、監視中のフォルダを確認し直します")
+                for directory in list(self._directories.values()):
+                    paths.extend(_list_images(directory, recursive=False))
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # 新しいサブフォルダは監視を追加し、監視前に置かれた画像を拾う
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    for root, _, _ in os.walk(path):
+                        self._add_watch(root)
+                    paths.extend(_list_images(path, recursive=True))
+                continue
+            paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """フォルダを定期的に確認する監視（inotifyが使えない環境用）
+
+    確認するのはファイル名・サイズ・更新時刻だけで、変わったファイルだけを返す。
+    """
+
+    def __init__(self, directories, recursive=False, interval=INGEST_POLL_INTERVAL):
+        self.directories = list(directories)
+        self.recursive = recursive
+        self.interval = interval
+        self._state = self._snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _snapshot(self):
+        state = {}
+        for directory in self.directories:
+            for path in _list_images(directory, self.recursive):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def poll(self, timeout):
+        wait_seconds = self._next_poll - time.monotonic()
+        if wait_seconds > 0:
+            time.sleep(min(timeout, wait_seconds))
+            if time.monotonic() < self._next_poll:
+                return []
+        self._next_poll = time.monotonic() + self.interval
+        state = self._snapshot()
+        changed = [path for path, signature in state.items() if self._state.get(path) != signature]
+        self._state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+# 解析プロセスごとの解析器（_init_worker で作成）
+_worker_analyzer = None
+
+
+def _init_worker(extraction_mode):
+    global _worker_analyzer
+    from web_analyzer import WebCompatibleAnalyzer
+    # Ctrl+Cはメインプロセスで受け取り、解析中の画像は最後まで処理する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_analyzer = WebCompatibleAnalyzer(work_dir=tempfile.mkdtemp(prefix='ingest_'))
+    _worker_analyzer.extraction_mode = extraction_mode
+
+
+def _analyze_frame(frame, path):
+    """解析プロセスで1枚を解析
+
+    Returns:
+        (process_single_image の結果, {'cropped': 切り抜き画像, 'overlay': オーバーレイ画像})
+    """
+    images = {}
+    result = _worker_analyzer.process_single_image(path, None, img=frame, images=images)
+    # レポートはメインプロセスで作るため、解析器に結果を溜めない
+    _worker_analyzer.results.clear()
+    return result, images
+
+
+class IngestDaemon:
+    """監視フォルダの取り込みデーモン"""
+
+    def __init__(self, watch_dirs, report_dir=INGEST_REPORT_DIR, results_store=None,
+                 max_workers=INGEST_MAX_WORKERS, hall=None, extraction_mode='fast',
+                 settle_seconds=INGEST_SETTLE_SECONDS, recursive=False, initial_scan=True, use_inotify=True):
+        self.watch_dirs = [os.path.abspath(directory) for directory in watch_dirs]
+        self.report_dir = report_dir
+        self.results_store = results_store or ResultsStore()
+        self.max_workers = max_workers
+        self.hall = hall
+        self.extraction_mode = extraction_mode
+        self.settle_seconds = settle_seconds
+        self.recursive = recursive
+        self.initial_scan = initial_scan
+        self.use_inotify = use_inotify
+
+        # 書き込み完了待ちのファイル（パス → (サイズ, 更新時刻, 最後に変化を確認した時刻)）
+        self._pending = {}
+        # 解析待ちのファイル（パス, ハッシュ）と解析中のファイル（future → (パス, ハッシュ, 投入時刻, レポートのフォルダ)）
+        self._ready = deque()
+        self._in_flight = {}
+        # このプロセスで投入したハッシュ（同じ内容の画像が別名で置かれた場合も1回だけ解析）
+        self._seen_digests = set()
+        self._stopping = False
+        self._report_analyzer = None
+        self._report_day_dir = None
+
+    def _watcher(self):
+        if self.use_inotify:
+            try:
+                return InotifyWatcher(self.watch_dirs, recursive=self.recursive)
+            except OSError as e:
+                print(f"Warning: inotifyを使えないため定期的な確認で監視します: {e}")
+        return PollingWatcher(self.watch_dirs, recursive=self.recursive)
+
+    def _touch(self, path, now):
+        """変更されたファイルを書き込み完了待ちに追加"""
+        if not _is_image(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = (*signature, now)
+
+    def _settle(self, now):
+        """サイズと更新時刻が変わらなくなったファイルを解析待ちに移す"""
+        for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            if now - changed_at < self.settle_seconds:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            del self._pending[path]
+            if size == 0:
+                continue
+
+            try:
+                with open(path, 'rb') as f:
+                    digest = hashlib.md5(f.read()).hexdigest()
+            except OSError as e:
+                print(f"Warning: 画像を読み込めません: {path}: {e}")
+                continue
+            if digest in self._seen_digests or self.results_store.has_image_digest(digest):
+                continue
+            self._seen_digests.add(digest)
+            self._ready.append((path, digest))
+
+    def _day_dir(self):
+        day_dir = os.path.join(self.report_dir, datetime.now().strftime('%Y-%m-%d'))
+        os.makedirs(os.path.join(day_dir, 'images'), exist_ok=True)
+        return day_dir
+
+    def _submit(self, executor):
+        """解析待ちのファイルをプールに投入（同時に投入する数は上限まで）"""
+        limit = self.max_workers * INGEST_QUEUE_PER_WORKER
+        while self._ready and len(self._in_flight) < limit:
+            path, digest = self._ready.popleft()
+            img = cv2.imread(path)
+            if img is None:
+                print(f"Warning: 画像を読み込めません: {path}")
+                continue
+            day_dir = self._day_dir()
+            future = executor.submit(_analyze_frame, img, path, outputs=tuple(INGEST_OUTPUT_IMAGES),
+                                     output_bytes={'overlay': INGEST_OVERLAY_BYTES})
+            self._in_flight[future] = (path, digest, time.monotonic(), day_dir)
+
+    def _collect(self, done):
+        """解析が終わったファイルを解析結果データベースとその日のレポートに追加"""
+        records = []
+        report_results = defaultdict(list)
+        for future in done:
+            path, digest, submitted_at, day_dir = self._in_flight.pop(future)
+            try:
+                result, images = future.result()
+            except Exception as e:
+                print(f"解析エラー: {path}: {e}")
+                continue
+            for key, file_key in INGEST_OUTPUT_IMAGES.items():
+                if result.get(file_key) and key in images:
+                    cv2.imwrite(os.path.join(day_dir, 'images', result[file_key]), images[key])
+            elapsed = time.monotonic() - submitted_at
+            status = result.get('error') or f"最高値 {result['analysis']['max_value']:,}玉"
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {os.path.basename(path)}: {status}（{elapsed:.1f}秒）")
+
+            # 事前チェックで除外した画像は記録しない（streamlit_app.py と同じ）
+            if (result.get('preflight') or {}).get('status', 'graph') != 'graph':
+                continue
+            records.append({
+                'file_name': result['filename'],
+                'image_digest': digest,
+                'machine_number': machine_number_from_file_name(result['filename']),
+                'hall': self.hall,
+                'source': 'ingest_daemon',
+                'success': not result.get('error'),
+                'error': result.get('error'),
+                'extraction_mode': self.extraction_mode,
+                'color': result.get('detected_color'),
+                'data_points': result.get('series'),
+                **{key: result['analysis'].get(key) for key in
+                   ('max_value', 'min_value', 'final_value', 'first_hit_value', 'total_jackpot_balls')}
+            })
+            if not result.get('error'):
+                report_results[day_dir].append({key: value for key, value in result.items() if key != 'series'})
+
+        if records:
+            try:
+                self.results_store.record_batch(records)
+            except Exception as e:
+                print(f"解析結果データベースへの保存エラー: {e}")
+        for day_dir, results in report_results.items():
+            self._append_report(day_dir, results)
+
+    def _append_report(self, day_dir, results):
+        """その日のレポートに結果を追加（results.jsonl に追記し、index.html と結果データを作り直す）
+
+        ページ分割のレポートにするため、作り直すのは結果データと新しい画像のサムネイルだけ。
+        """
+        from web_analyzer import WebCompatibleAnalyzer
+
+        results_path = os.path.join(day_dir, 'results.jsonl')
+        with open(results_path, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False, default=lambda value: value.item()) + '\n')
+
+        # 日付が変わった場合と再起動した場合は、その日の結果を読み込み直す
+        if self._report_analyzer is None or self._report_day_dir != day_dir:
+            self._report_analyzer = WebCompatibleAnalyzer(work_dir=day_dir)
+            with open(results_path, encoding='utf-8') as f:
+                self._report_analyzer.results = [json.loads(line) for line in f if line.strip()]
+            self._report_day_dir = day_dir
+        else:
+            self._report_analyzer.results.extend(results)
+
+        try:
+            self._report_analyzer.generate_paged_report(os.path.join(day_dir, 'index.html'))
+        except Exception as e:
+            print(f"レポート生成エラー: {e}")
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run(self):
+        """監視を開始（Ctrl+C / SIGTERM で解析中の画像を処理してから終了）"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        watcher = self._watcher()
+        print(f"監視を開始しました: {', '.join(self.watch_dirs)}（{type(watcher).__name__}、"
+              f"解析プロセス {self.max_workers}）")
+        now = time.monotonic()
+        if self.initial_scan:
+            # 停止中に置かれた画像（解析済みのものはハッシュで除外）
+            for directory in self.watch_dirs:
+                for path in _list_images(directory, self.recursive):
+                    self._touch(path, now - self.settle_seconds)
+
+        with SharedFrameExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(self.extraction_mode,)) as executor:
+            try:
+                while not self._stopping:
+                    # 書き込み完了待ちのファイルがある間は短い間隔で確認
+                    timeout = 0.2 if self._pending or self._in_flight else 1.0
+                    for path in watcher.poll(timeout):
+                        self._touch(path, time.monotonic())
+                    self._settle(time.monotonic())
+                    self._submit(executor)
+                    if self._in_flight:
+                        done, _ = wait(list(self._in_flight), timeout=0)
+                        if done:
+                            self._collect(done)
+                # 解析中の画像は最後まで処理して保存する
+                if self._in_flight:
+                    print(f"解析中の{len(self._in_flight)}枚を処理してから終了します")
+                    done, _ = wait(list(self._in_flight))
+                    self._collect(done)
+            finally:
+                watcher.close()
+        print("監視を終了しました")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='監視フォルダのスクリーンショットを自動で解析')
+    parser.add_argument('watch_dirs', nargs='+', help='監視するフォルダ')
+    parser.add_argument('--report-dir', default=INGEST_REPORT_DIR, help='レポートの保存先（日付ごとのフォルダを作成）')
+    parser.add_argument('--results-db', default=None, help='解析結果データベースのパス')
+    parser.add_argument('--workers', type=int, default=INGEST_MAX_WORKERS, help='解析プロセス数')
+    parser.add_argument('--hall', default=None, help='店舗名')
+    parser.add_argument('--mode', default='fast', choices=['fast', 'subpixel', 'trace', 'cascade'],
+                        help='抽出モード')
+    parser.add_argument('--settle', type=float, default=INGEST_SETTLE_SECONDS, help='書き込み完了とみなすまでの秒数')
+    parser.add_argument('--recursive', action='store_true', help='サブフォルダも監視')
+    parser.add_argument('--no-initial-scan', action='store_true', help='起動時にフォルダ内の未解析の画像を処理しない')
+    parser.add_argument('--poll', action='store_true', help='inotifyを使わず定期的な確認で監視')
+    args = parser.parse_args()
+
+    for directory in args.watch_dirs:
+        if not os.path.isdir(directory):
+            parser.error(f"フォルダが見つかりません: {directory}")
+
+    daemon = IngestDaemon(
+        args.watch_dirs,
+        report_dir=args.report_dir,
+        results_store=ResultsStore(args.results_db) if args.results_db else None,
+        max_workers=max(1, args.workers),
+        hall=args.hall,
+        extraction_mode=args.mode,
+        settle_seconds=args.settle,
+        recursive=args.recursive,
+        initial_scan=not args.no_initial_scan,
+        use_inotify=not args.poll,
+    )
+    daemon.run()
+
+
+if __name__ == '__main__':
+    main()
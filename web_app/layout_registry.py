@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+画面レイアウト登録簿
+同じ端末・同じスクロール位置のスクリーンショットはオレンジバー・ゼロライン・切り抜き範囲が同じになるため、
+画像サイズとヘッダー付近の行から作った指紋で検出結果を再利用する
+
+指紋が一致した場合は数行だけフル解像度で確認し、合わない場合は通常の検出に戻す。
+"""
+
+import hashlib
+import sqlite3
+
+import cv2
+import numpy as np
+
+from graph_detection import (
+    ORANGE_LOWER, ORANGE_UPPER, search_range, crop_box, compute_row_scores,
+    detect_graph_layout_multires
+)
+
+# 指紋に使う行の範囲（画像の高さに対する割合、ステータスバーは除外）
+FINGERPRINT_TOP = 0.04
+FINGERPRINT_BOTTOM = 0.30
+FINGERPRINT_ROWS = 24
+
+# 行の中央値の量子化ビット数（文字や圧縮ノイズの影響を受けにくくする）
+FINGERPRINT_SHIFT = 4
+
+# ゼロライン確認時に比較する前後の行数とスコアの許容差
+VERIFY_ZERO_RADIUS = 3
+VERIFY_SCORE_TOLERANCE = 0.02
+
+
+def layout_fingerprint(img, bgr=False):
+    """サンプル行から画面レイアウトの指紋を作成
+
+    各サンプル行の中央値（文字に影響されにくい）を量子化してハッシュ化する。
+    参照するのはFINGERPRINT_ROWS行だけなので、画像全体の変換は不要。
+    """
+    height = img.shape[0]
+    rows = np.linspace(height * FINGERPRINT_TOP, height * FINGERPRINT_BOTTOM, FINGERPRINT_ROWS).astype(int)
+    gray = cv2.cvtColor(img[rows], cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY)
+    profile = (np.median(gray, axis=1).astype(np.uint8) >> FINGERPRINT_SHIFT)
+    return hashlib.md5(profile.tobytes()).hexdigest()[:16]
+
+
+def layout_key(img, bgr=False):
+    """画像サイズと指紋を組み合わせたキー"""
+    height, width = img.shape[:2]
+    return f"{width}x{height}:{layout_fingerprint(img, bgr=bgr)}"
+
+
+def verify_layout(img, orange_bottom, zero_line_y, best_score, bgr=False):
+    """登録済みの位置が現在の画像と一致するか数行だけ確認"""
+    height, width = img.shape[:2]
+    if not (0 < orange_bottom < height and VERIFY_ZERO_RADIUS <= zero_line_y < height - VERIFY_ZERO_RADIUS):
+        return False
+
+    # オレンジバー下端: 直前の行はバー、下端の行はバーではない
+    band = img[orange_bottom - 1:orange_bottom + 1]
+    mask = cv2.inRange(cv2.cvtColor(band, cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV),
+                       ORANGE_LOWER, ORANGE_UPPER)
+    row_sums = mask.sum(axis=1, dtype=np.int64)
+    if not (row_sums[0] >= width * 0.1 * 255 and row_sums[1] < width * 0.1 * 255):
+        return False
+
+    # ゼロライン: 前後の行より高スコアで、登録時のスコアとほぼ同じ
+    band = img[zero_line_y - VERIFY_ZERO_RADIUS:zero_line_y + VERIFY_ZERO_RADIUS + 1]
+    scores = compute_row_scores(cv2.cvtColor(band, cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY))
+    if int(np.argmax(scores)) != VERIFY_ZERO_RADIUS:
+        return False
+    return abs(float(scores[VERIFY_ZERO_RADIUS]) - best_score) <= VERIFY_SCORE_TOLERANCE
+
+
+class LayoutRegistry:
+    """画面レイアウトの登録簿（プリセットと同じSQLiteデータベースに保存）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS layouts (
+                    layout_key TEXT PRIMARY KEY,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    orange_bottom INTEGER NOT NULL,
+                    zero_line_y INTEGER NOT NULL,
+                    best_score REAL NOT NULL,
+                    crop_top INTEGER NOT NULL,
+                    crop_bottom INTEGER NOT NULL,
+                    crop_left INTEGER NOT NULL,
+                    crop_right INTEGER NOT NULL,
+                    preset_name TEXT,
+                    hit_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_layouts_size ON layouts (width, height)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def lookup(self, key):
+        """キーに一致する登録済みレイアウトを取得"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute('''
+                SELECT orange_bottom, zero_line_y, best_score, crop_top, crop_bottom,
+                       crop_left, crop_right, preset_name
+                FROM layouts WHERE layout_key = ?
+            ''', (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            'orange_bottom': row[0],
+            'zero_line_y': row[1],
+            'best_score': row[2],
+            'crop_rect': (row[3], row[4], row[5], row[6]),
+            'preset_name': row[7],
+        }
+
+    def register(self, key, img, layout, preset_name=None):
+        """検出結果を登録（既存のキーは上書き）"""
+        height, width = img.shape[:2]
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO layouts
+                    (layout_key, width, height, orange_bottom, zero_line_y, best_score,
+                     crop_top, crop_bottom, crop_left, crop_right, preset_name, hit_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                        COALESCE((SELECT hit_count FROM layouts WHERE layout_key = ?), 0), CURRENT_TIMESTAMP)
+            ''', (key, width, height, int(layout['orange_bottom']), int(layout['zero_line_y']),
+                  float(layout['best_score']), layout['top'], layout['bottom'], layout['left'], layout['right'],
+                  preset_name, key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _record_hit(self, key, preset_name):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if preset_name:
+                conn.execute('''
+                    UPDATE layouts SET hit_count = hit_count + 1, preset_name = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE layout_key = ?
+                ''', (preset_name, key))
+            else:
+                conn.execute('UPDATE layouts SET hit_count = hit_count + 1 WHERE layout_key = ?', (key,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def detect(self, img, settings, preset_name=None, bgr=False):
+        """登録簿を使ってレイアウトを検出
+
+        指紋が一致して確認が通れば登録済みの位置を使い、そうでなければ通常の検出を行って登録する。
+
+        Returns:
+            (layout, hit): detect_graph_layout と同じ形式の辞書と、登録簿を使ったかどうか
+        """
+        height, width = img.shape[:2]
+        key = layout_key(img, bgr=bgr)
+
+        entry = self.lookup(key)
+        if entry is not None:
+            search_start, search_end = search_range(entry['orange_bottom'], height, settings)
+            zero_line_y = entry['zero_line_y']
+            if (search_start <= zero_line_y < search_end and
+                    verify_layout(img, entry['orange_bottom'], zero_line_y, entry['best_score'], bgr=bgr)):
+                top, bottom, left, right = crop_box(zero_line_y, height, width, settings)
+                self.hits += 1
+                self._record_hit(key, preset_name)
+                return {
+                    'orange_bottom': entry['orange_bottom'],
+                    'search_start': search_start,
+                    'search_end': search_end,
+                    'zero_line_y': zero_line_y,
+                    'best_score': entry['best_score'],
+                    'top': top,
+                    'bottom': bottom,
+                    'left': left,
+                    'right': right,
+                    'zero_in_crop': zero_line_y - top,
+                    'crop_height': bottom - top,
+                }, True
+
+        self.misses += 1
+        layout = detect_graph_layout_multires(img, settings, bgr=bgr)
+        self.register(key, img, layout, preset_name=preset_name)
+        return layout, False
+
+    def suggest_preset(self, img, bgr=False):
+        """画像に合うプリセット名を推定
+
+        指紋が一致する登録があればそのプリセット、なければ同じ画像サイズで最も使われたプリセットを返す。
+        """
+        height, width = img.shape[:2]
+        entry = self.lookup(layout_key(img, bgr=bgr))
+        if entry is not None and entry['preset_name']:
+            return entry['preset_name']
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute('''
+                SELECT preset_name, SUM(hit_count + 1) AS uses
+                FROM layouts
+                WHERE width = ? AND height = ? AND preset_name IS NOT NULL
+                GROUP BY preset_name
+                ORDER BY uses DESC
+                LIMIT 1
+            ''', (width, height)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+台ごとの前回の解析結果
+同じ台を1日に何度も撮影したスクリーンショットは、前回のグラフの右側に新しい部分が追加されただけなので、
+台番号と日付をキーに前回の抽出結果（平滑化前の系列）と統計の途中状態を保存し、差分抽出に使う
+
+保存するのは WebCompatibleAnalyzer.last_extraction と update_running_stats の resume。
+"""
+
+import json
+import sqlite3
+
+
+class MachineSeriesStore:
+    """台番号・日付ごとの前回の抽出結果（プリセットと同じSQLiteデータベースに保存）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS machine_series (
+                    machine_number TEXT NOT NULL,
+                    graph_date TEXT NOT NULL,
+                    extraction TEXT NOT NULL,
+                    stats TEXT,
+                    correction_factor REAL,
+                    point_count INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (machine_number, graph_date)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, machine_number, graph_date):
+        """前回の抽出結果を取得
+
+        Returns:
+            dict: extraction（last_extraction）、stats（resume、なければNone）、correction_factor
+                  登録がない場合はNone
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute('''
+                SELECT extraction, stats, correction_factor FROM machine_series
+                WHERE machine_number = ? AND graph_date = ?
+            ''', (machine_number, graph_date)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        try:
+            return {
+                'extraction': json.loads(row[0]),
+                'stats': json.loads(row[1]) if row[1] else None,
+                'correction_factor': row[2],
+            }
+        except ValueError as e:
+            print(f"Warning: 前回の解析結果を読み込めません（{machine_number} {graph_date}）: {e}")
+            return None
+
+    def save(self, machine_number, graph_date, extraction, stats=None, correction_factor=None):
+        """抽出結果を保存（同じ台・日付は上書き）"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO machine_series
+                    (machine_number, graph_date, extraction, stats, correction_factor, point_count,
+                     created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?,
+                        COALESCE((SELECT created_at FROM machine_series
+                                  WHERE machine_number = ? AND graph_date = ?), CURRENT_TIMESTAMP),
+                        CURRENT_TIMESTAMP)
+            ''', (machine_number, graph_date, json.dumps(extraction),
+                  json.dumps(stats) if stats else None, correction_factor, len(extraction['points']),
+                  machine_number, graph_date))
+            conn.commit()
+        finally:
+            conn.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+OCR結果のキャッシュ
+Tesseractに渡す前処理済みの画像（領域）のバイト列と、言語・設定文字列・Tesseractのバージョンから
+キーを作り、読み取ったテキストを保存する
+
+    ocr_cache = OcrCache(disk_path='data/ocr_cache.db')
+    text = ocr_cache.image_to_string(binary, lang='jpn', config='--psm 7')   # pytesseract と同じ呼び方
+
+同じ台のスクリーンショットのオレンジバーや、設定を変えて再解析した画像は、前処理後の領域が同じになるため
+Tesseractを呼ばずにテキストを返す。
+メモリ（LRU、OCR_CACHE_MAX_ENTRIES 件）を先に引き、なければディスク（SQLite、省略可）を引く。
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pytesseract
+
+# メモリに置く件数（1件は数百バイト〜数キロバイトのテキスト）
+OCR_CACHE_MAX_ENTRIES = 1024
+
+
+class OcrCache:
+    """領域の内容をキーにしたOCR結果のキャッシュ"""
+
+    def __init__(self, max_entries=OCR_CACHE_MAX_ENTRIES, disk_path=None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._tesseract_version = None
+        # メモリ・ディスクで見つかった回数と、Tesseractを呼んだ回数
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.disk_path, timeout=10)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _version(self):
+        # バージョンが変わると同じ画像でも結果が変わりうるため、キーに含める（ディスクのキャッシュを引き継がない）
+        if self._tesseract_version is None:
+            try:
+                self._tesseract_version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                self._tesseract_version = ''
+        return self._tesseract_version
+
+    def cache_key(self, image, lang=None, config=''):
+        """前処理済みの画像と設定からキーを作成"""
+        image = np.ascontiguousarray(image)
+        md5 = hashlib.md5(f"{image.shape}|{image.dtype.str}|{lang}|{config}|{self._version()}".encode('utf-8'))
+        md5.update(image.data)
+        return md5.hexdigest()
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._memory[key] = text
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _load_disk(self, key):
+        try:
+            conn = sqlite3.connect(self.disk_path, timeout=10)
+            try:
+                row = conn.execute('SELECT text FROM ocr_cache WHERE cache_key = ?', (key,)).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"OCRキャッシュの読み込みエラー: {e}")
+            return None
+        return row[0] if row else None
+
+    def _save_disk(self, key, text):
+        try:
+            conn = sqlite3.connect(self.disk_path, timeout=10)
+            try:
+                conn.execute('INSERT OR REPLACE INTO ocr_cache (cache_key, text) VALUES (?, ?)', (key, text))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"OCRキャッシュの保存エラー: {e}")
+
+    def image_to_string(self, image, lang=None, config=''):
+        """pytesseract.image_to_string と同じ結果をキャッシュ経由で返す"""
+        key = self.cache_key(image, lang, config)
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return text
+
+        if self.disk_path:
+            text = self._load_disk(key)
+            if text is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, text)
+                return text
+
+        # Tesseractの呼び出し中はロックを持たない（並行するOCRを止めない）
+        text = pytesseract.image_to_string(image, lang=lang, config=config)
+        with self._lock:
+            self.misses += 1
+        self._remember(key, text)
+        if self.disk_path:
+            self._save_disk(key, text)
+        return text
+
+    def stats(self):
+        """ヒット数・ヒット率（Tesseractを呼ばずに済んだ割合）"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'lookups': lookups,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self._memory),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.disk_hits = self.misses = 0
+
+    def clear(self):
+        """メモリとディスクのキャッシュを削除"""
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            conn = sqlite3.connect(self.disk_path, timeout=10)
+            try:
+                conn.execute('DELETE FROM ocr_cache')
+                conn.commit()
+            finally:
+                conn.close()
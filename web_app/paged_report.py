@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+ページ分割のHTMLレポート
+結果カードをHTMLに埋め込まず、小さなHTML（集計を埋め込んだ枠）と結果データのファイルに分けて書き出す
+
+    write_paged_report('report/index.html', cards, summary, title='解析レポート')
+    # → report/index.html（枠と集計）、report/index_data.js（結果データ）、report/thumbs/*.jpg（サムネイル）
+
+カードはブラウザで REPORT_PAGE_SIZE 件ずつ描画し、画像はサムネイルを loading="lazy" で読み込む
+（元の画像はサムネイルのリンク先）。集計はPython側で計算してHTMLに埋め込むため、結果データを読み込む前に表示される。
+結果データはJSONを代入するだけのスクリプト（window.REPORT_DATA = {...};）にする。
+ZIPを展開して file:// で開いた場合は fetch でJSONを読めないため。
+
+HTMLの大きさは結果の件数によらず一定で、サムネイルは元の画像より新しいものがあれば作り直さない。
+"""
+
+import html
+import json
+import os
+
+import cv2
+from PIL import Image
+
+# 1ページに描画するカードの数
+REPORT_PAGE_SIZE = 24
+
+# サムネイルの幅（ピクセル）とJPEGの品質
+THUMBNAIL_WIDTH = 480
+THUMBNAIL_QUALITY = 80
+
+# サムネイルを置くディレクトリ（レポートのHTMLと同じ場所からの相対パス）
+THUMBNAIL_DIR = 'thumbs'
+
+
+def make_thumbnail(source_path, thumb_path, width=THUMBNAIL_WIDTH):
+    """サムネイルを作成し、(幅, 高さ) を返す（作成済みで元の画像より新しければ読み込むだけ）"""
+    try:
+        if os.path.exists(thumb_path) and os.path.getmtime(thumb_path) >= os.path.getmtime(source_path):
+            # 作成済みのサムネイルはヘッダーだけ読む（デコードしない）
+            with Image.open(thumb_path) as thumb:
+                return thumb.size
+        img = cv2.imread(source_path)
+        if img is None:
+            return None
+        height, source_width = img.shape[:2]
+        if source_width > width:
+            img = cv2.resize(img, (width, max(1, round(height * width / source_width))), interpolation=cv2.INTER_AREA)
+        cv2.imwrite(thumb_path, img, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+        return img.shape[1], img.shape[0]
+    except Exception as e:
+        print(f"Warning: サムネイルを作成できませんでした {source_path}: {e}")
+        return None
+
+
+def _thumbnail_name(image):
+    # 画像の相対パスをそのまま使う（サブディレクトリ違いの同名ファイルを区別する）
+    stem = os.path.splitext(image.replace('\\', '/').lstrip('./'))[0]
+    return stem.replace('/', '__') + '.jpg'
+
+
+def write_paged_report(output_path, cards, summary, title, subtitle='', footer='', page_size=REPORT_PAGE_SIZE):
+    """ページ分割のレポートを書き出す
+
+    Args:
+        output_path: HTMLのパス（結果データは同じ場所に <名前>_data.js として書き出す）
+        cards: カードの辞書のリスト
+            title: 見出し
+            image: 画像のパス（HTMLからの相対パス、None なら画像なし）
+            image_file: サムネイルの元にする画像のファイルパス（省略時は image をHTMLの場所から解決）
+            fields: [(項目, 値, クラス名)] のリスト（クラス名は 'positive' / 'negative' / ''）
+            error: エラーの内容（なければ None）
+            sort: 並べ替えに使う値の辞書（例 {'max_value': 12000}）
+        summary: 集計の [(項目, 値, クラス名)] のリスト（HTMLに埋め込む）
+        title, subtitle, footer: レポートの見出しとフッター（テキスト）
+
+    Returns:
+        list: 書き出したファイルのパス（HTMLの場所からの相対パス、ZIPに入れる場合などに使う）
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    thumb_dir = os.path.join(output_dir, THUMBNAIL_DIR)
+    os.makedirs(thumb_dir, exist_ok=True)
+    data_name = os.path.splitext(os.path.basename(output_path))[0] + '_data.js'
+    written = [os.path.basename(output_path), data_name]
+
+    sort_keys = []
+    records = []
+    for card in cards:
+        record = {
+            'title': str(card.get('title', '')),
+            'image': card.get('image'),
+            'thumb': None,
+            'fields': [[str(label), str(value), cls or ''] for label, value, cls in card.get('fields', [])],
+            'error': card.get('error'),
+            'sort': card.get('sort') or {},
+        }
+        for key in record['sort']:
+            if key not in sort_keys:
+                sort_keys.append(key)
+        if record['image']:
+            source = card.get('image_file') or os.path.join(output_dir, record['image'])
+            thumb_name = _thumbnail_name(record['image'])
+            size = make_thumbnail(source, os.path.join(thumb_dir, thumb_name))
+            if size is not None:
+                record['thumb'] = f'{THUMBNAIL_DIR}/{thumb_name}'
+                record['thumb_size'] = list(size)
+                written.append(f'{THUMBNAIL_DIR}/{thumb_name}')
+        records.append(record)
+
+    data = {
+        'summary': [[str(label), str(value), cls or ''] for label, value, cls in summary],
+        'sort_keys': sort_keys,
+        'page_size': page_size,
+        'cards': records,
+    }
+    with open(os.path.join(output_dir, data_name), 'w', encoding='utf-8') as f:
+        f.write('window.REPORT_DATA = ')
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=lambda value: value.item())
+        f.write(';\n')
+
+    summary_html = ''.join(
+        f'<div class="stat-card"><div class="stat-value {html.escape(cls or "")}">{html.escape(str(value))}</div>'
+        f'<div class="stat-label">{html.escape(str(label))}</div></div>'
+        for label, value, cls in summary
+    )
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(_SHELL_TEMPLATE
+                .replace('{{TITLE}}', html.escape(title))
+                .replace('{{SUBTITLE}}', html.escape(subtitle))
+                .replace('{{FOOTER}}', html.escape(footer))
+                .replace('{{SUMMARY}}', summary_html)
+                .replace('{{COUNT}}', str(len(records)))
+                .replace('{{DATA_FILE}}', html.escape(data_name)))
+    return written
+
+
+# 並べ替えの項目名（sort のキー → 表示名）
+SORT_LABELS = {
+    'max_value': '最高値',
+    'min_value': '最低値',
+    'final_value': '最終値',
+}
+
+_SHELL_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{{TITLE}}</title>
+<style>
+* { margin: 0; padding: 0; box-sizing: border-box; }
+body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Noto Sans JP', sans-serif;
+       background: #eef1f6; color: #333; padding: 16px; }
+.container { max-width: 1400px; margin: 0 auto; background: #fff; border-radius: 16px; overflow: hidden;
+             box-shadow: 0 10px 30px rgba(0, 0, 0, 0.08); }
+.header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: #fff; padding: 28px; text-align: center; }
+.header h1 { font-size: 1.8rem; margin-bottom: 6px; }
+.summary { padding: 20px; background: #f8f9fa; }
+.stats-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(160px, 1fr)); gap: 12px; }
+.stat-card { background: #fff; padding: 16px; border-radius: 10px; text-align: center;
+             box-shadow: 0 2px 8px rgba(0, 0, 0, 0.06); }
+.stat-value { font-size: 1.5rem; font-weight: bold; margin-bottom: 4px; }
+.stat-label { color: #666; font-size: 0.85rem; }
+.toolbar { display: flex; flex-wrap: wrap; gap: 8px; align-items: center; padding: 16px 20px 0; }
+.toolbar input, .toolbar select { padding: 6px 10px; border: 1px solid #ccc; border-radius: 6px; font-size: 0.95rem; }
+.toolbar .count { color: #666; font-size: 0.9rem; margin-left: auto; }
+.analysis-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(320px, 1fr)); gap: 16px; padding: 20px; }
+.analysis-card { border-radius: 12px; overflow: hidden; box-shadow: 0 3px 12px rgba(0, 0, 0, 0.08); background: #fff; }
+.analysis-card a { display: block; background: #f3f3f3; }
+.analysis-card img { width: 100%; height: auto; display: block; }
+.analysis-info { padding: 12px 14px; }
+.analysis-info h3 { font-size: 1rem; margin-bottom: 8px; word-break: break-all; }
+.result-table { width: 100%; border-collapse: collapse; font-size: 0.9rem; }
+.result-table td { padding: 4px 6px; border-bottom: 1px solid #eee; }
+.result-table td:last-child { text-align: right; }
+.error { color: #dc3545; font-size: 0.9rem; }
+.positive { color: #28a745; }
+.negative { color: #dc3545; }
+.pager { display: flex; flex-wrap: wrap; justify-content: center; gap: 6px; padding: 0 20px 24px; }
+.pager button { min-width: 40px; padding: 6px 10px; border: 1px solid #ccc; border-radius: 6px; background: #fff; cursor: pointer; }
+.pager button.current { background: #667eea; border-color: #667eea; color: #fff; }
+.pager button:disabled { opacity: 0.4; cursor: default; }
+.footer { background: #333; color: #fff; text-align: center; padding: 20px; font-size: 0.85rem; }
+@media (max-width: 768px) { .analysis-grid { grid-template-columns: 1fr; } .stats-grid { grid-template-columns: repeat(2, 1fr); } }
+</style>
+</head>
+<body>
+<div class="container">
+  <div class="header">
+    <h1>{{TITLE}}</h1>
+    <p>{{SUBTITLE}}</p>
+  </div>
+  <div class="summary"><div class="stats-grid">{{SUMMARY}}</div></div>
+  <div class="toolbar">
+    <input id="query" type="search" placeholder="ファイル名で絞り込み">
+    <select id="sort"><option value="">元の順番</option></select>
+    <span class="count" id="count">{{COUNT}}件</span>
+  </div>
+  <div class="pager" id="pager-top"></div>
+  <div class="analysis-grid" id="cards"><p>読み込み中...</p></div>
+  <div class="pager" id="pager-bottom"></div>
+  <div class="footer"><p>{{FOOTER}}</p></div>
+</div>
+<script src="{{DATA_FILE}}" defer></script>
+<script>
+window.addEventListener('DOMContentLoaded', function () {
+  var data = window.REPORT_DATA;
+  if (!data) { document.getElementById('cards').textContent = '結果データを読み込めませんでした（{{DATA_FILE}}）'; return; }
+  var sortLabels = """ + json.dumps(SORT_LABELS, ensure_ascii=False) + """;
+  var sortSelect = document.getElementById('sort');
+  data.sort_keys.forEach(function (key) {
+    [['-', '（高い順）'], ['+', '（低い順）']].forEach(function (order) {
+      var option = document.createElement('option');
+      option.value = order[0] + key;
+      option.textContent = (sortLabels[key] || key) + order[1];
+      sortSelect.appendChild(option);
+    });
+  });
+  var state = { page: 0, query: '', sort: '' };
+  var view = data.cards;
+
+  function el(tag, className, text) {
+    var node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function renderCard(card) {
+    var node = el('div', 'analysis-card');
+    if (card.thumb) {
+      var link = el('a');
+      link.href = card.image;
+      link.target = '_blank';
+      var img = el('img');
+      img.loading = 'lazy';
+      img.decoding = 'async';
+      img.alt = card.title;
+      if (card.thumb_size) { img.width = card.thumb_size[0]; img.height = card.thumb_size[1]; }
+      img.src = card.thumb;
+      link.appendChild(img);
+      node.appendChild(link);
+    }
+    var info = el('div', 'analysis-info');
+    info.appendChild(el('h3', '', card.title));
+    if (card.error) info.appendChild(el('p', 'error', card.error));
+    var table = el('table', 'result-table');
+    card.fields.forEach(function (field) {
+      var row = el('tr');
+      row.appendChild(el('td', '', field[0]));
+      row.appendChild(el('td', field[2], field[1]));
+      table.appendChild(row);
+    });
+    info.appendChild(table);
+    node.appendChild(info);
+    return node;
+  }
+
+  function renderPager(container, pages) {
+    container.textContent = '';
+    if (pages <= 1) return;
+    function button(label, page, disabled) {
+      var node = el('button', page === state.page && label === String(page + 1) ? 'current' : '', label);
+      node.disabled = disabled;
+      node.onclick = function () { state.page = page; render(); window.scrollTo(0, document.getElementById('cards').offsetTop - 60); };
+      container.appendChild(node);
+    }
+    button('‹', state.page - 1, state.page === 0);
+    for (var page = 0; page < pages; page++) {
+      // 先頭・末尾と現在のページの前後だけ表示
+      if (page === 0 || page === pages - 1 || Math.abs(page - state.page) <= 2) {
+        button(String(page + 1), page, false);
+      } else if (Math.abs(page - state.page) === 3) {
+        container.appendChild(el('span', '', '…'));
+      }
+    }
+    button('›', state.page + 1, state.page >= pages - 1);
+  }
+
+  function updateView() {
+    var query = state.query.toLowerCase();
+    view = query ? data.cards.filter(function (card) { return card.title.toLowerCase().indexOf(query) >= 0; }) : data.cards.slice();
+    if (state.sort) {
+      var sign = state.sort[0] === '-' ? -1 : 1;
+      var key = state.sort.slice(1);
+      view.sort(function (a, b) {
+        var x = a.sort[key], y = b.sort[key];
+        if (x === undefined || x === null) return 1;
+        if (y === undefined || y === null) return -1;
+        return sign * (x - y);
+      });
+    }
+    state.page = 0;
+    document.getElementById('count').textContent = view.length + '件';
+  }
+
+  function render() {
+    var pages = Math.max(1, Math.ceil(view.length / data.page_size));
+    state.page = Math.min(Math.max(0, state.page), pages - 1);
+    var fragment = document.createDocumentFragment();
+    view.slice(state.page * data.page_size, (state.page + 1) * data.page_size).forEach(function (card) {
+      fragment.appendChild(renderCard(card));
+    });
+    var container = document.getElementById('cards');
+    container.textContent = '';
+    container.appendChild(fragment);
+    renderPager(document.getElementById('pager-top'), pages);
+    renderPager(document.getElementById('pager-bottom'), pages);
+    history.replaceState(null, '', '#page=' + (state.page + 1));
+  }
+
+  var match = /page=(\\d+)/.exec(location.hash);
+  document.getElementById('query').addEventListener('input', function (event) { state.query = event.target.value; updateView(); render(); });
+  sortSelect.addEventListener('change', function (event) { state.sort = event.target.value; updateView(); render(); });
+  updateView();
+  if (match) state.page = parseInt(match[1], 10) - 1;
+  render();
+});
+</script>
+</body>
+</html>
+"""
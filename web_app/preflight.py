@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+事前チェック
+OCRやグラフ抽出の前に、縮小画像の統計だけで入力がグラフのスクリーンショットかどうかを判定する
+
+判定結果:
+    'graph'       : 通常どおり解析する
+    'non_graph'   : グラフ画面ではない（一覧ページ・写真・切り抜き済み画像など）
+    'low_quality' : グラフ画面だが解析できる品質ではない（解像度不足・ぼけ・ラインなし）
+
+数ミリ秒で終わるため、失敗する画像でOCRと色抽出を実行する前に打ち切れる。
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from color_lut import load_color_lut, classify_pixels
+from graph_detection import (
+    ORANGE_LOWER, ORANGE_UPPER, CANONICAL_WIDTH,
+    ZERO_LINE_SIDE_MARGIN, _orange_bar_end, compute_row_scores, reduce_image
+)
+
+# 解析できる最小の画像幅（これより小さい画像はラインが潰れる）
+PREFLIGHT_MIN_WIDTH = 600
+
+# 縦長（スマートフォンのスクリーンショット）とみなす縦横比
+PREFLIGHT_MIN_ASPECT = 1.3
+
+# ゼロライン行のスコアと探索範囲の中央値との差（実画像は0.046以上、ぼけた画像は0.03未満）
+# NO未満は際立った行がない（グラフ画面ではない）とみなす
+PREFLIGHT_MIN_ZERO_CONTRAST = 0.03
+PREFLIGHT_NO_ZERO_CONTRAST = 0.01
+
+# グラフの色が検出されたカラムの割合（開店直後の短いグラフでも0.03程度）
+PREFLIGHT_MIN_LINE_COVERAGE = 0.02
+
+# ライン色を数えるカラムの間隔（基準幅でのピクセル数）
+PREFLIGHT_COLUMN_STEP = 8
+
+# 既定の検出設定（streamlit_app_full.pyの初期値と同じ、基準幅でのピクセル数）
+PREFLIGHT_DEFAULT_SETTINGS = {
+    'search_start_offset': 50,
+    'search_end_offset': 500,
+    'crop_top': 246,
+    'crop_bottom': 280,
+    'left_margin': 120,
+    'right_margin': 120,
+}
+
+
+def _result(status, reason, start_time, **metrics):
+    result = {
+        'status': status,
+        'reason': reason,
+        'elapsed_ms': (time.perf_counter() - start_time) * 1000,
+    }
+    result.update(metrics)
+    return result
+
+
+def preflight_check(img, color_ranges, bgr=False, settings=None, small=None):
+    """縮小画像の統計で入力画像を判定
+
+    Args:
+        img: 読み込み済みの画像（正規化前でもよい）
+        color_ranges: グラフの色範囲（WebCompatibleAnalyzer.color_ranges）
+        bgr: BGR画像の場合True（オレンジバーとゼロラインの判定に使用）
+        settings: 検出設定（省略時は PREFLIGHT_DEFAULT_SETTINGS）
+        small: 縮小済みの画像（省略時は作成）
+
+    Returns:
+        dict: status（'graph' / 'non_graph' / 'low_quality'）、reason、各指標、elapsed_ms
+    """
+    start_time = time.perf_counter()
+    settings = settings or PREFLIGHT_DEFAULT_SETTINGS
+
+    if img is None or not hasattr(img, 'shape') or img.ndim != 3 or img.size == 0:
+        return _result('non_graph', '画像を読み込めません', start_time)
+
+    height, width = img.shape[:2]
+    if height < width * PREFLIGHT_MIN_ASPECT:
+        return _result('non_graph', '縦長のスクリーンショットではありません', start_time)
+    if width < PREFLIGHT_MIN_WIDTH:
+        return _result('low_quality', f'解像度が低すぎます（幅{width}px）', start_time)
+
+    # 設定値は基準幅でのピクセル数のため、画像の幅に合わせて換算
+    ratio = width / CANONICAL_WIDTH
+
+    def px(key):
+        return int(round(settings.get(key, PREFLIGHT_DEFAULT_SETTINGS[key]) * ratio))
+
+    if small is None:
+        small = reduce_image(img)
+    reduction = height / small.shape[0]
+    small_height, small_width = small.shape[:2]
+
+    # 1. オレンジバー
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV)
+    orange_mask = cv2.inRange(hsv, ORANGE_LOWER, ORANGE_UPPER)
+    small_orange_bottom = _orange_bar_end(orange_mask, small_height)
+    if small_orange_bottom is None:
+        return _result('non_graph', 'オレンジバーが見つかりません', start_time)
+    orange_bottom = int(small_orange_bottom * reduction)
+
+    # 2. ゼロライン（探索範囲の中で際立って暗く均一な行があるか）
+    search_start = int((orange_bottom + px('search_start_offset')) / reduction)
+    search_end = int(min(height - 100 * ratio, orange_bottom + px('search_end_offset')) / reduction)
+    if search_end - search_start < 3:
+        return _result('non_graph', 'グラフ領域がありません', start_time, orange_bottom=orange_bottom)
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY if bgr else cv2.COLOR_RGB2GRAY)
+    side_margin = min(small_width // 4, max(1, int(ZERO_LINE_SIDE_MARGIN * ratio / reduction)))
+    scores = compute_row_scores(gray[search_start:search_end], side_margin=side_margin)
+    best = int(np.argmax(scores))
+    zero_contrast = float(scores[best] - np.median(scores))
+    zero_line_y = int((search_start + best + 0.5) * reduction)
+    if zero_contrast < PREFLIGHT_NO_ZERO_CONTRAST:
+        return _result('non_graph', 'ゼロラインが見つかりません', start_time,
+                       orange_bottom=orange_bottom, zero_contrast=zero_contrast)
+    if zero_contrast < PREFLIGHT_MIN_ZERO_CONTRAST:
+        return _result('low_quality', 'ゼロラインが不鮮明です（ぼけ・圧縮ノイズ）', start_time,
+                       orange_bottom=orange_bottom, zero_contrast=zero_contrast)
+
+    # 3. グラフの色（細いラインが縮小で消えないよう、フル解像度のカラムを間引いて参照）
+    # 抽出処理と同じく配列をそのまま色分類テーブルに渡す
+    top = max(orange_bottom, zero_line_y - px('crop_top'))
+    bottom = min(height, zero_line_y + px('crop_bottom'))
+    left = px('left_margin')
+    right = width - px('right_margin')
+    column_step = max(1, int(round(PREFLIGHT_COLUMN_STEP * ratio)))
+    columns = img[top:bottom, left:right:column_step]
+    if columns.size == 0:
+        return _result('non_graph', 'グラフ領域がありません', start_time,
+                       orange_bottom=orange_bottom, zero_contrast=zero_contrast)
+    labels = classify_pixels(columns, load_color_lut(color_ranges), color_ranges)
+    line_coverage = float(((labels > 0).sum(axis=0) >= 2).mean())
+    if line_coverage < PREFLIGHT_MIN_LINE_COVERAGE:
+        return _result('low_quality', 'グラフの線がほとんど検出できません', start_time,
+                       orange_bottom=orange_bottom, zero_contrast=zero_contrast,
+                       line_coverage=line_coverage)
+
+    return _result('graph', None, start_time, orange_bottom=orange_bottom, zero_line_y=zero_line_y,
+                   zero_contrast=zero_contrast, line_coverage=line_coverage)
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+解析結果データベース
+解析結果を台番号・日付・店舗ごとに蓄積し、過去のスクリーンショットを再解析せずに推移を集計する
+
+テーブル:
+    images     : 解析した画像（ファイル名・内容のハッシュ・サイズ）
+    analyses   : 1回の解析結果（台番号・日付・店舗・最高値などの統計）
+    ocr_fields : OCRで読み取った項目（1項目1行）
+
+集計テーブル（解析の保存と同じトランザクションで更新）:
+    machine_daily : 台・日付・店舗ごとの結果（その日の最後の解析の統計と解析枚数）
+    hall_daily    : 店舗・日付ごとの合計（台数・現在値の合計・最高値・総獲得球数・回転率の合計）
+
+履歴画面と店舗の集計は集計テーブルだけを読むため、画像の枚数や系列の長さに関係なく台数分の行で済む。
+店舗が未入力の解析は店舗 '' として集計する。
+
+抽出した系列はデータベースに入れず、日付ごとの系列アーカイブ（series_archive.py）に解析IDをキーに追記する。
+
+サーバーのデータベースの代わりにローカルのSQLite（WALモード）を使う。
+書き込みはアップロード単位でまとめて1回のトランザクションで行い、解析中の読み込み（履歴画面）を妨げない。
+"""
+
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+
+from series_archive import SeriesArchive
+
+# 既定の保存先
+RESULTS_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'results.db')
+
+# analyses テーブルに保存する統計の列
+ANALYSIS_VALUE_KEYS = ('max_value', 'min_value', 'final_value', 'first_hit_value', 'total_jackpot_balls')
+
+# 台ごとの集計（machine_daily）を解析結果から作り直すSQL
+# 最後に成功した解析の統計をその日の結果とする（グラフは累積のため最新のスクリーンショットがすべてを含む）
+_REFRESH_MACHINE_DAILY_SQL = '''
+    INSERT OR REPLACE INTO machine_daily
+        (graph_date, hall, machine_number, screenshots, successes, last_analysis_id, max_value, min_value,
+         final_value, first_hit_value, total_jackpot_balls, rotation_rate)
+    SELECT d.graph_date, d.hall, d.machine_number, d.screenshots, d.successes, a.id, a.max_value, a.min_value,
+           a.final_value, a.first_hit_value, a.total_jackpot_balls, a.rotation_rate
+    FROM (
+        SELECT graph_date, COALESCE(hall, '') AS hall, machine_number, COUNT(*) AS screenshots,
+               SUM(success) AS successes, MAX(CASE WHEN success = 1 THEN id END) AS last_id
+        FROM analyses
+        WHERE machine_number IS NOT NULL {where}
+        GROUP BY graph_date, COALESCE(hall, ''), machine_number
+    ) AS d
+    LEFT JOIN analyses AS a ON a.id = d.last_id
+'''
+
+# 店舗ごとの集計（hall_daily）の台の項目を machine_daily から作り直すSQL
+_REFRESH_HALL_MACHINES_SQL = '''
+    UPDATE hall_daily SET (machines, final_sum, max_value, jackpot_sum, rotation_sum, rotation_count) = (
+        SELECT COUNT(*), COALESCE(SUM(final_value), 0), MAX(max_value), COALESCE(SUM(total_jackpot_balls), 0),
+               COALESCE(SUM(rotation_rate), 0), COUNT(rotation_rate)
+        FROM machine_daily AS m
+        WHERE m.graph_date = hall_daily.graph_date AND m.hall = hall_daily.hall AND m.last_analysis_id IS NOT NULL
+    )
+    WHERE {where}
+'''
+
+
+def normalize_machine_number(machine_number):
+    """台番号を数字だけの文字列に統一（'2308番台' → '2308'、読み取れない場合はNone）"""
+    if machine_number is None:
+        return None
+    match = re.search(r'\d+', str(machine_number))
+    return match.group(0) if match else None
+
+
+def machine_number_from_file_name(file_name):
+    """ファイル名から台番号を推測（'1番台.jpg' → '1'、「番台」を含まない場合はNone）"""
+    match = re.search(r'(\d+)\s*番台', os.path.basename(str(file_name)))
+    return match.group(1) if match else None
+
+
+class ResultsStore:
+    """解析結果データベース"""
+
+    def __init__(self, db_path=RESULTS_DB_PATH, archive_dir=None):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_tables()
+        # 系列アーカイブはデータベースと同じディレクトリの series/
+        self.archive = SeriesArchive(archive_dir or os.path.join(db_dir or '.', 'series'))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+    def _init_tables(self):
+        conn = self._connect()
+        try:
+            # WALモードはデータベースファイルに記録されるため、作成時に1回設定すればよい
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS images (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_name TEXT NOT NULL,
+                    image_digest TEXT,
+                    width INTEGER,
+                    height INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS idx_images_digest ON images (image_digest);
+
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    image_id INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+                    machine_number TEXT,
+                    hall TEXT,
+                    graph_date TEXT NOT NULL,
+                    analyzed_at TEXT NOT NULL,
+                    source TEXT,
+                    success INTEGER NOT NULL,
+                    error TEXT,
+                    extraction_mode TEXT,
+                    color TEXT,
+                    max_value INTEGER,
+                    min_value INTEGER,
+                    final_value INTEGER,
+                    first_hit_value INTEGER,
+                    total_jackpot_balls INTEGER,
+                    correction_factor REAL,
+                    rotation_rate REAL,
+                    point_count INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_machine_date ON analyses (machine_number, graph_date);
+                CREATE INDEX IF NOT EXISTS idx_analyses_hall_date ON analyses (hall, graph_date);
+                CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses (graph_date);
+
+                CREATE TABLE IF NOT EXISTS ocr_fields (
+                    analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                    field TEXT NOT NULL,
+                    value TEXT,
+                    PRIMARY KEY (analysis_id, field)
+                );
+
+                CREATE TABLE IF NOT EXISTS machine_daily (
+                    graph_date TEXT NOT NULL,
+                    hall TEXT NOT NULL,
+                    machine_number TEXT NOT NULL,
+                    screenshots INTEGER NOT NULL,
+                    successes INTEGER NOT NULL,
+                    last_analysis_id INTEGER,
+                    max_value INTEGER,
+                    min_value INTEGER,
+                    final_value INTEGER,
+                    first_hit_value INTEGER,
+                    total_jackpot_balls INTEGER,
+                    rotation_rate REAL,
+                    PRIMARY KEY (graph_date, hall, machine_number)
+                );
+                CREATE INDEX IF NOT EXISTS idx_machine_daily_machine ON machine_daily (machine_number, graph_date);
+
+                CREATE TABLE IF NOT EXISTS hall_daily (
+                    graph_date TEXT NOT NULL,
+                    hall TEXT NOT NULL,
+                    analyses INTEGER NOT NULL DEFAULT 0,
+                    successes INTEGER NOT NULL DEFAULT 0,
+                    machines INTEGER NOT NULL DEFAULT 0,
+                    final_sum INTEGER NOT NULL DEFAULT 0,
+                    max_value INTEGER,
+                    jackpot_sum INTEGER NOT NULL DEFAULT 0,
+                    rotation_sum REAL NOT NULL DEFAULT 0,
+                    rotation_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (graph_date, hall)
+                );
+            ''')
+
+            # 回転率の列がない古いデータベースに列を追加
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(analyses)')}
+            if 'rotation_rate' not in columns:
+                conn.execute('ALTER TABLE analyses ADD COLUMN rotation_rate REAL')
+            conn.commit()
+
+            # 集計テーブルより前に保存した解析があれば集計を作成
+            has_analyses = conn.execute('SELECT 1 FROM analyses LIMIT 1').fetchone()
+            has_rollups = conn.execute('SELECT 1 FROM hall_daily LIMIT 1').fetchone()
+            if has_analyses and not has_rollups:
+                with conn:
+                    self._rebuild_rollups(conn)
+        finally:
+            conn.close()
+
+    def _rebuild_rollups(self, conn):
+        """集計テーブルを解析結果から作り直す（呼び出し側のトランザクション内で実行）"""
+        conn.execute('DELETE FROM machine_daily')
+        conn.execute('DELETE FROM hall_daily')
+        conn.execute(_REFRESH_MACHINE_DAILY_SQL.format(where=''))
+        conn.execute('''
+            INSERT INTO hall_daily (graph_date, hall, analyses, successes)
+            SELECT graph_date, COALESCE(hall, ''), COUNT(*), SUM(success)
+            FROM analyses GROUP BY graph_date, COALESCE(hall, '')
+        ''')
+        conn.execute(_REFRESH_HALL_MACHINES_SQL.format(where='1'))
+
+    def rebuild_rollups(self):
+        """集計テーブルを作り直す（解析結果を直接変更した場合など）"""
+        conn = self._connect()
+        try:
+            with conn:
+                self._rebuild_rollups(conn)
+        finally:
+            conn.close()
+
+    def _update_rollups(self, conn, hall_counts, machine_keys):
+        """保存した解析の分だけ集計テーブルを更新
+
+        Args:
+            hall_counts: {(graph_date, hall): [解析数, 成功数]}
+            machine_keys: 解析を追加した (graph_date, hall, machine_number) の集合
+        """
+        # 台ごとの集計は、その台・日付の解析（数枚）から作り直す
+        for graph_date, hall, machine_number in machine_keys:
+            conn.execute(_REFRESH_MACHINE_DAILY_SQL.format(
+                where="AND machine_number = ? AND graph_date = ? AND COALESCE(hall, '') = ?"),
+                (machine_number, graph_date, hall))
+
+        # 店舗ごとの解析数は加算し、台の項目はその店舗・日付の machine_daily（台数分）から作り直す
+        for (graph_date, hall), (analyses, successes) in hall_counts.items():
+            conn.execute('''
+                INSERT INTO hall_daily (graph_date, hall, analyses, successes) VALUES (?, ?, ?, ?)
+                ON CONFLICT (graph_date, hall) DO UPDATE SET
+                    analyses = analyses + excluded.analyses,
+                    successes = successes + excluded.successes
+            ''', (graph_date, hall, analyses, successes))
+            conn.execute(_REFRESH_HALL_MACHINES_SQL.format(where='graph_date = ? AND hall = ?'),
+                         (graph_date, hall))
+
+    def record_batch(self, records):
+        """解析結果をまとめて保存（全件で1回のトランザクション）
+
+        系列はトランザクションの確定後に日付ごとの系列アーカイブへまとめて追記する。
+
+        Args:
+            records: 辞書のリスト。キーは file_name（必須）、image_digest、width、height、
+                     machine_number、hall、graph_date（'YYYY-MM-DD'、省略時は今日）、source、
+                     success、error、extraction_mode、color、ANALYSIS_VALUE_KEYS の各統計、
+                     correction_factor、rotation_rate（回転率、回/千円）、ocr（項目名→値）、
+                     data_points（[(x, value), ...]）、
+                     overlay（オーバーレイの再描画に必要な値、系列のメタデータとして保存）
+
+        Returns:
+            list: 保存した解析のID（recordsと同じ順番）
+        """
+        analyzed_at = datetime.now().isoformat(timespec='seconds')
+        today = datetime.now().strftime('%Y-%m-%d')
+        analysis_ids = []
+        archive_entries = defaultdict(list)
+        hall_counts = defaultdict(lambda: [0, 0])
+        machine_keys = set()
+
+        conn = self._connect()
+        try:
+            with conn:
+                for record in records:
+                    size = (record.get('width'), record.get('height'))
+                    image_id = conn.execute(
+                        'INSERT INTO images (file_name, image_digest, width, height) VALUES (?, ?, ?, ?)',
+                        (record['file_name'], record.get('image_digest'), *size)
+                    ).lastrowid
+
+                    data_points = record.get('data_points') or []
+                    values = [None if record.get(key) is None else int(record[key]) for key in ANALYSIS_VALUE_KEYS]
+                    graph_date = record.get('graph_date') or today
+                    machine_number = normalize_machine_number(record.get('machine_number'))
+                    hall = record.get('hall') or None
+                    success = int(bool(record.get('success')))
+                    analysis_id = conn.execute('''
+                        INSERT INTO analyses
+                            (image_id, machine_number, hall, graph_date, analyzed_at, source, success, error,
+                             extraction_mode, color, max_value, min_value, final_value, first_hit_value,
+                             total_jackpot_balls, correction_factor, rotation_rate, point_count)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (image_id, machine_number, hall, graph_date, analyzed_at,
+                          record.get('source'), success, record.get('error'),
+                          record.get('extraction_mode'), record.get('color'), *values,
+                          record.get('correction_factor'), record.get('rotation_rate') or None,
+                          len(data_points))).lastrowid
+
+                    counts = hall_counts[(graph_date, hall or '')]
+                    counts[0] += 1
+                    counts[1] += success
+                    if machine_number:
+                        machine_keys.add((graph_date, hall or '', machine_number))
+
+                    ocr = record.get('ocr') or {}
+                    conn.executemany(
+                        'INSERT INTO ocr_fields (analysis_id, field, value) VALUES (?, ?, ?)',
+                        [(analysis_id, field, str(value)) for field, value in ocr.items()
+                         if value is not None and not isinstance(value, (dict, list))]
+                    )
+                    if data_points:
+                        meta = {'file_name': record['file_name'], 'color': record.get('color'),
+                                **(record.get('overlay') or {})}
+                        archive_entries[graph_date].append((analysis_id, data_points, meta))
+                    analysis_ids.append(analysis_id)
+
+                self._update_rollups(conn, hall_counts, machine_keys)
+        finally:
+            conn.close()
+
+        for graph_date, entries in archive_entries.items():
+            self.archive.append(graph_date, entries)
+        return analysis_ids
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def machine_trend(self, machine_number, start_date=None, end_date=None, hall=None):
+        """台の日ごとの推移（machine_daily から取得）
+
+        1日に複数回解析した場合は最後の解析（最も新しいスクリーンショット）をその日の結果とする。
+
+        Returns:
+            list: 日付順の辞書（graph_date、screenshots（解析枚数）、successes（成功した枚数）、max_value、
+                  min_value、final_value、first_hit_value、total_jackpot_balls、rotation_rate、analysis_id）
+        """
+        conditions = ['machine_number = ?', 'last_analysis_id IS NOT NULL']
+        params = [normalize_machine_number(machine_number)]
+        if start_date:
+            conditions.append('graph_date >= ?')
+            params.append(str(start_date))
+        if end_date:
+            conditions.append('graph_date <= ?')
+            params.append(str(end_date))
+        if hall:
+            conditions.append('hall = ?')
+            params.append(hall)
+        where = ' AND '.join(conditions)
+        # 店舗を指定しない場合に同じ台番号が複数の店舗にあれば、最後に解析した方をその日の結果とする
+        # （SQLiteでは MAX() と同じ行の値が他の列に入る）
+        return self._query(f'''
+            SELECT graph_date, screenshots, successes, max_value, min_value, final_value,
+                   first_hit_value, total_jackpot_balls, rotation_rate, MAX(last_analysis_id) AS analysis_id
+            FROM machine_daily WHERE {where}
+            GROUP BY graph_date
+            ORDER BY graph_date
+        ''', params)
+
+    def daily_summary(self, graph_date, hall=None):
+        """1日の全台の結果（machine_daily から取得）"""
+        conditions = ['graph_date = ?', 'last_analysis_id IS NOT NULL']
+        params = [str(graph_date)]
+        if hall:
+            conditions.append('hall = ?')
+            params.append(hall)
+        where = ' AND '.join(conditions)
+        return self._query(f'''
+            SELECT machine_number, NULLIF(hall, '') AS hall, screenshots, successes, max_value, min_value,
+                   final_value, first_hit_value, total_jackpot_balls, rotation_rate,
+                   last_analysis_id AS analysis_id
+            FROM machine_daily WHERE {where}
+            ORDER BY CAST(machine_number AS INTEGER)
+        ''', params)
+
+    def hall_summary(self, start_date=None, end_date=None, hall=None, weekly=False):
+        """店舗の日ごと（weekly=True の場合は週ごと）の合計（hall_daily から取得）
+
+        Returns:
+            list: 期間順の辞書（period、hall、analyses、successes、machines（週ごとは延べ台数）、
+                  final_sum、max_value、jackpot_sum、avg_rotation_rate）
+        """
+        conditions = ['1']
+        params = []
+        if start_date:
+            conditions.append('graph_date >= ?')
+            params.append(str(start_date))
+        if end_date:
+            conditions.append('graph_date <= ?')
+            params.append(str(end_date))
+        if hall is not None:
+            conditions.append('hall = ?')
+            params.append(hall)
+        where = ' AND '.join(conditions)
+        # 週は月曜始まり（その週の月曜日の日付で表す）
+        period = "date(graph_date, '-' || ((CAST(strftime('%w', graph_date) AS INTEGER) + 6) % 7) || ' days')" \
+            if weekly else 'graph_date'
+        return self._query(f'''
+            SELECT {period} AS period, NULLIF(hall, '') AS hall, SUM(analyses) AS analyses,
+                   SUM(successes) AS successes, SUM(machines) AS machines, SUM(final_sum) AS final_sum,
+                   MAX(max_value) AS max_value, SUM(jackpot_sum) AS jackpot_sum,
+                   SUM(rotation_sum) / NULLIF(SUM(rotation_count), 0) AS avg_rotation_rate
+            FROM hall_daily WHERE {where}
+            GROUP BY period, hall
+            ORDER BY period, hall
+        ''', params)
+
+    def machines(self, hall=None):
+        """記録のある台の一覧（日数・最後の日付）"""
+        params = []
+        where = 'last_analysis_id IS NOT NULL'
+        if hall:
+            where += ' AND hall = ?'
+            params.append(hall)
+        return self._query(f'''
+            SELECT machine_number, COUNT(DISTINCT graph_date) AS days, MAX(graph_date) AS last_date
+            FROM machine_daily WHERE {where}
+            GROUP BY machine_number
+            ORDER BY CAST(machine_number AS INTEGER)
+        ''', params)
+
+    def halls(self):
+        """記録のある店舗の一覧"""
+        return [row['hall'] for row in self._query(
+            "SELECT DISTINCT hall FROM hall_daily WHERE hall != '' ORDER BY hall")]
+
+    def has_image_digest(self, image_digest):
+        """内容が同じ画像を解析済みか（images.image_digest の索引で検索）"""
+        return bool(self._query('SELECT 1 FROM images WHERE image_digest = ? LIMIT 1', (image_digest,)))
+
+    def ocr_fields(self, analysis_id):
+        """解析のOCR項目（項目名→値）"""
+        return {row['field']: row['value'] for row in self._query(
+            'SELECT field, value FROM ocr_fields WHERE analysis_id = ?', (analysis_id,))}
+
+    def load_series(self, analysis_id):
+        """解析の系列 [(x, value), ...]（保存されていない場合は空リスト）"""
+        rows = self._query('SELECT graph_date FROM analyses WHERE id = ?', (analysis_id,))
+        if not rows:
+            return []
+        data_points, _ = self.archive.read(rows[0]['graph_date'], analysis_id)
+        return data_points
+
+    def load_day_series(self, graph_date):
+        """1日分の全系列（SeriesArchive.load_day の結果、再集計用）"""
+        return self.archive.load_day(str(graph_date))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+抽出系列のアーカイブ
+抽出したグラフの系列を日付ごとの追記専用ファイルにまとめて保存する
+
+ファイル構成（archive_dir/YYYY-MM-DD.*）:
+    .series : 系列のレコードを追記したファイル
+              レコード = ヘッダー（SERIES_HEADER）+ メタデータ（JSON）+ 本体（差分をzlib圧縮）
+    .index  : 系列ID・オフセット・レコード長の固定長レコード（INDEX_DTYPE）
+
+本体はx座標と値を整数化した差分（通常はint16、範囲を超える場合だけint32）で、
+隣り合う点の差が小さいグラフはzlibで1系列あたり数百バイトになる。
+メタデータには色・ゼロライン・スケールなどオーバーレイ画像の再描画に必要な値を入れ、画像自体は保存しない。
+
+1系列の読み込みは索引からオフセットを引いて1回のシーク、1日分の読み込みはファイル全体の1回の順次読み込み
+（メモリマップ）で行う。
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# 既定の保存先
+SERIES_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'series')
+
+# レコードのヘッダー: マジック、系列ID、点数、フラグ、最初のx、最初の値、メタデータ長、本体長
+SERIES_MAGIC = b'GSR1'
+SERIES_HEADER = struct.Struct('<4sqIHiiHI')
+
+# フラグ: 差分をint32で保存（int16の範囲を超える差分がある場合）
+FLAG_WIDE_DELTAS = 1
+
+# 索引のレコード（系列ID、オフセット、レコード長）
+INDEX_DTYPE = np.dtype([('series_id', '<i8'), ('offset', '<u8'), ('length', '<u4')])
+
+# zlibの圧縮レベル（系列は小さいため、これ以上上げても縮まらない）
+SERIES_COMPRESS_LEVEL = 6
+
+
+def encode_record(series_id, data_points, meta=None):
+    """系列 [(x, value), ...] を1件のレコードのバイト列に変換"""
+    array = np.rint(np.asarray(data_points, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    count = len(array)
+    first_x, first_value = (int(array[0, 0]), int(array[0, 1])) if count else (0, 0)
+
+    deltas = np.diff(array, axis=0)
+    flags = 0
+    if deltas.size and (deltas.min() < np.iinfo(np.int16).min or deltas.max() > np.iinfo(np.int16).max):
+        flags |= FLAG_WIDE_DELTAS
+    dtype = '<i4' if flags & FLAG_WIDE_DELTAS else '<i2'
+    # x の差分の後に値の差分を並べる（同じ種類の値が続くため圧縮しやすい）
+    body = zlib.compress(deltas.T.astype(dtype).tobytes(), SERIES_COMPRESS_LEVEL) if deltas.size else b''
+    # numpy の数値（検出結果の座標など）は Python の数値に変換
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':'),
+                            default=lambda value: value.item()).encode('utf-8') if meta else b''
+
+    header = SERIES_HEADER.pack(SERIES_MAGIC, int(series_id), count, flags, first_x, first_value,
+                                len(meta_bytes), len(body))
+    return header + meta_bytes + body
+
+
+def decode_record(buffer, offset=0):
+    """レコードを読み込み
+
+    Returns:
+        (series_id, x, values, meta, 次のレコードのオフセット)。x と values は int32 の配列
+    """
+    magic, series_id, count, flags, first_x, first_value, meta_length, body_length = \
+        SERIES_HEADER.unpack_from(buffer, offset)
+    if magic != SERIES_MAGIC:
+        raise ValueError(f"系列アーカイブのレコードが壊れています（オフセット {offset}）")
+    position = offset + SERIES_HEADER.size
+    meta = json.loads(bytes(buffer[position:position + meta_length]).decode('utf-8')) if meta_length else {}
+    position += meta_length
+    body = bytes(buffer[position:position + body_length])
+    position += body_length
+
+    x = np.empty(count, dtype=np.int32)
+    values = np.empty(count, dtype=np.int32)
+    if count:
+        x[0], values[0] = first_x, first_value
+        if count > 1:
+            dtype = '<i4' if flags & FLAG_WIDE_DELTAS else '<i2'
+            deltas = np.frombuffer(zlib.decompress(body), dtype=dtype).reshape(2, count - 1)
+            x[1:] = first_x + np.cumsum(deltas[0], dtype=np.int64)
+            values[1:] = first_value + np.cumsum(deltas[1], dtype=np.int64)
+    return series_id, x, values, meta, position
+
+
+class SeriesArchive:
+    """日付ごとの系列アーカイブ"""
+
+    def __init__(self, archive_dir=SERIES_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def _paths(self, graph_date):
+        base = os.path.join(self.archive_dir, str(graph_date))
+        return base + '.series', base + '.index'
+
+    def append(self, graph_date, entries):
+        """系列をまとめて追記
+
+        Args:
+            graph_date: 'YYYY-MM-DD'
+            entries: [(系列ID, [(x, value), ...], メタデータの辞書またはNone), ...]
+        """
+        if not entries:
+            return
+        series_path, index_path = self._paths(graph_date)
+        records = [encode_record(series_id, points, meta) for series_id, points, meta in entries]
+
+        with open(series_path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            index = np.zeros(len(records), dtype=INDEX_DTYPE)
+            for i, ((series_id, _, _), record) in enumerate(zip(entries, records)):
+                index[i] = (series_id, offset, len(record))
+                offset += len(record)
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        # 索引は本体の書き込みが終わってから追記する（途中で失敗しても索引が本体を指さない）
+        with open(index_path, 'ab') as f:
+            f.write(index.tobytes())
+
+    def load_index(self, graph_date):
+        """1日分の索引（INDEX_DTYPE の配列、ファイルがない場合は空）"""
+        _, index_path = self._paths(graph_date)
+        if not os.path.exists(index_path):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.fromfile(index_path, dtype=INDEX_DTYPE)
+
+    def read(self, graph_date, series_id):
+        """1系列を読み込み
+
+        Returns:
+            (data_points, meta): data_points は [(x, value), ...]。見つからない場合は ([], None)
+        """
+        index = self.load_index(graph_date)
+        matches = np.flatnonzero(index['series_id'] == int(series_id))
+        if len(matches) == 0:
+            return [], None
+        # 同じIDを再保存した場合は最後のレコード
+        entry = index[matches[-1]]
+        series_path, _ = self._paths(graph_date)
+        with open(series_path, 'rb') as f:
+            f.seek(int(entry['offset']))
+            buffer = f.read(int(entry['length']))
+        _, x, values, meta, _ = decode_record(buffer)
+        return list(zip(x.tolist(), values.tolist())), meta
+
+    def load_day(self, graph_date):
+        """1日分の全系列をメモリマップで順に読み込み（集計用）
+
+        Returns:
+            dict: series_id（各系列のID）、offsets（各系列の先頭位置、末尾に総点数）、
+                  x / values（全系列を連結した int32 の配列）、meta（各系列のメタデータ）
+        """
+        series_path, _ = self._paths(graph_date)
+        series_ids, metas, xs, values = [], [], [], []
+        if os.path.exists(series_path) and os.path.getsize(series_path) > 0:
+            with open(series_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                position = 0
+                while position + SERIES_HEADER.size <= len(buffer):
+                    series_id, x, series_values, meta, position = decode_record(buffer, position)
+                    series_ids.append(series_id)
+                    metas.append(meta)
+                    xs.append(x)
+                    values.append(series_values)
+
+        lengths = np.array([len(x) for x in xs], dtype=np.int64)
+        return {
+            'series_id': np.array(series_ids, dtype=np.int64),
+            'offsets': np.concatenate([[0], np.cumsum(lengths)]),
+            'x': np.concatenate(xs) if xs else np.zeros(0, dtype=np.int32),
+            'values': np.concatenate(values) if values else np.zeros(0, dtype=np.int32),
+            'meta': metas,
+        }
+
+    def dates(self):
+        """アーカイブのある日付の一覧"""
+        return sorted(name[:-len('.series')] for name in os.listdir(self.archive_dir) if name.endswith('.series'))
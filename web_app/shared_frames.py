@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+共有メモリによる画像の受け渡し
+プロセスプールで画像を解析する際に、デコード済みの画像と結果の画像（切り抜き・オーバーレイ）を
+共有メモリに置き、プロセス間では名前・形・型だけの小さな記述子（FrameRef）を送る
+
+    executor = SharedFrameExecutor(max_workers=4)
+    future = executor.submit(analyze, img_array, settings, outputs=('cropped', 'overlay'))
+    result, images = future.result()   # images['overlay'] などは親プロセスの配列
+
+解析関数は解析プロセスで fn(画像, *args) として呼ばれ、(結果の辞書, {名前: 配列}) を返す。
+入力の画像は共有メモリのビュー（コピーなし）で、返した配列は親プロセスが用意した共有メモリに書き込まれる。
+1枚あたりのプロセス間のコピーは、親プロセスでの書き込みと読み出しの memcpy それぞれ1回だけになる
+（pickleでは送信側の直列化・パイプ転送・受信側の復元で往復それぞれ数回コピーされる）。
+
+共有メモリは SharedFramePool で再利用し、画像ごとに確保・解放しない。
+"""
+
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 共有メモリ上の配列の記述子（共有メモリの名前、配列の形、型）
+FrameRef = namedtuple('FrameRef', ['name', 'shape', 'dtype'])
+
+# 共有メモリを確保する単位（大きさの近い画像で同じブロックを使い回せるよう切り上げる）
+FRAME_BLOCK_UNIT = 1024 * 1024
+
+# 再利用のために残しておく空きブロックの数
+FRAME_POOL_MAX_FREE = 16
+
+# 解析プロセスで開いたままにしておくブロックの数（親プロセスが解放したブロックを開き続けないよう古いものから閉じる）
+FRAME_WORKER_MAX_ATTACHED = 64
+
+
+class SharedFramePool:
+    """共有メモリのブロックを再利用するプール（親プロセス側）"""
+
+    def __init__(self, max_free=FRAME_POOL_MAX_FREE):
+        self.max_free = max_free
+        self._free = []
+        self._used = {}
+        self._lock = threading.Lock()
+        # 確保した回数と再利用した回数（プールの効き具合の確認用）
+        self.created = 0
+        self.reused = 0
+
+    def allocate(self, nbytes):
+        """nbytes以上のブロックを取得（空きブロックのうち最も小さいものを使う）"""
+        nbytes = max(1, int(nbytes))
+        with self._lock:
+            candidates = [block for block in self._free if block.size >= nbytes]
+            if candidates:
+                block = min(candidates, key=lambda b: b.size)
+                self._free.remove(block)
+                self.reused += 1
+            else:
+                size = -(-nbytes // FRAME_BLOCK_UNIT) * FRAME_BLOCK_UNIT
+                block = shared_memory.SharedMemory(create=True, size=size)
+                self.created += 1
+            self._used[block.name] = block
+        return block
+
+    def put(self, array):
+        """配列を共有メモリに書き込み、記述子を返す"""
+        array = np.ascontiguousarray(array)
+        block = self.allocate(array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return FrameRef(block.name, array.shape, array.dtype.str)
+
+    def view(self, ref):
+        """記述子の配列（共有メモリのビュー、release するまで有効）"""
+        block = self._used[ref.name]
+        return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=block.buf)
+
+    def take(self, ref):
+        """記述子の配列をコピーして取り出し、ブロックを返却"""
+        array = self.view(ref).copy()
+        self.release(ref.name)
+        return array
+
+    def release(self, name):
+        """ブロックを返却（空きが多すぎる場合は小さいものから解放）"""
+        with self._lock:
+            block = self._used.pop(name, None)
+            if block is None:
+                return
+            self._free.append(block)
+            if len(self._free) > self.max_free:
+                self._free.sort(key=lambda b: b.size)
+                surplus = self._free.pop(0)
+                surplus.close()
+                surplus.unlink()
+
+    def close(self):
+        """すべてのブロックを解放"""
+        with self._lock:
+            for block in self._free + list(self._used.values()):
+                block.close()
+                block.unlink()
+            self._free = []
+            self._used = {}
+
+
+# 解析プロセスで開いた共有メモリ（名前 → SharedMemory、同じブロックは2回目以降開き直さない）
+# 解放（unlink）は親プロセスのプールだけが行う
+_attached_blocks = {}
+
+
+def _attach_block(name):
+    block = _attached_blocks.pop(name, None)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        while len(_attached_blocks) >= FRAME_WORKER_MAX_ATTACHED:
+            try:
+                _attached_blocks.pop(next(iter(_attached_blocks))).close()
+            except BufferError:
+                # 解析関数が返した結果がまだビューを参照している場合は閉じない（プロセス終了時に閉じる）
+                pass
+    # 最近使ったものを末尾に置く（古いものから閉じる）
+    _attached_blocks[name] = block
+    return block
+
+
+def attach_frame(ref):
+    """解析プロセスで記述子の配列を開く（コピーなしのビュー）"""
+    block = _attach_block(ref.name)
+    return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=block.buf)
+
+
+def _run_frame_task(fn, frame_ref, output_blocks, args, kwargs):
+    """解析プロセスでの1枚の処理（入力を開いて fn を呼び、結果の画像を共有メモリに書き込む）
+
+    Returns:
+        (結果の辞書, {名前: FrameRef}, {名前: 配列}): 用意されたブロックに入らない画像は配列のまま返す
+    """
+    frame = attach_frame(frame_ref)
+    result, images = fn(frame, *args, **kwargs)
+
+    refs = {}
+    inline = {}
+    for key, image in (images or {}).items():
+        if image is None:
+            continue
+        image = np.ascontiguousarray(image)
+        block_info = output_blocks.get(key)
+        if block_info is None or image.nbytes > block_info[1]:
+            inline[key] = image
+            continue
+        block = _attach_block(block_info[0])
+        np.ndarray(image.shape, dtype=image.dtype, buffer=block.buf)[...] = image
+        refs[key] = FrameRef(block_info[0], image.shape, image.dtype.str)
+    return result, refs, inline
+
+
+class SharedFrameExecutor:
+    """共有メモリで画像を受け渡すプロセスプール"""
+
+    def __init__(self, max_workers=None, initializer=None, initargs=(), pool=None):
+        self.pool = pool or SharedFramePool()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+
+    def submit(self, fn, frame, *args, outputs=(), output_bytes=None, **kwargs):
+        """1枚の解析を投入
+
+        Args:
+            fn: 解析関数（モジュールのトップレベルの関数）。fn(画像, *args, **kwargs) → (結果, {名前: 配列})
+            frame: 入力の画像
+            outputs: 共有メモリで受け取る結果の画像の名前
+            output_bytes: 結果の画像1枚あたりの最大サイズ（省略時は入力の画像と同じ）。
+                {名前: サイズ} の辞書の場合は画像ごとのサイズ（辞書にない画像は入力の画像と同じ）
+
+        Returns:
+            Future: (結果, {名前: 配列})
+        """
+        frame_ref = self.pool.put(frame)
+        if not isinstance(output_bytes, dict):
+            output_bytes = {key: output_bytes for key in outputs}
+        output_blocks = {}
+        for key in outputs:
+            nbytes = output_bytes.get(key) or frame_ref_nbytes(frame_ref)
+            output_blocks[key] = (self.pool.allocate(nbytes).name, nbytes)
+
+        future = Future()
+        inner = self._executor.submit(_run_frame_task, fn, frame_ref, output_blocks, args, kwargs)
+
+        def _done(inner_future):
+            self.pool.release(frame_ref.name)
+            error = None
+            try:
+                result, refs, inline = inner_future.result()
+                images = {key: self.pool.view(ref).copy() for key, ref in refs.items()}
+                images.update(inline)
+            except BaseException as e:
+                error = e
+            finally:
+                # ブロックを返却してから結果を渡す（結果を受け取った時点で次の画像にブロックを再利用できる）
+                for name, _ in output_blocks.values():
+                    self.pool.release(name)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result((result, images))
+
+        inner.add_done_callback(_done)
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def frame_ref_nbytes(ref):
+    """記述子の配列のバイト数"""
+    return int(np.prod(ref.shape)) * np.dtype(ref.dtype).itemsize
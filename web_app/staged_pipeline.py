@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+段階的な並行パイプライン
+1枚ずつの処理を段階（ステージ）に分け、段階ごとのキューとワーカー数で並行に処理する
+
+    pipeline = StagedPipeline()
+    pipeline.add_stage('ocr', run_ocr, workers=2)
+    pipeline.add_stage('extract', run_extract, workers=2)
+    pipeline.add_stage('metrics', run_metrics, after=('ocr', 'extract'))
+    for item in pipeline.run(decoded_images()):   # 投入した順に返す
+        ...
+
+前の段階を指定しない段階（after=()）には投入した項目がそのまま入り、前の段階をすべて終えた項目が次の段階に入る。
+各段階のキューには上限があり、後ろの段階が詰まると前の段階と投入側が待つ（メモリに置く画像の枚数が上限を超えない）。
+段階の途中で別の段階の結果が必要になった場合は item.wait('ocr') で待つ（待った時間は稼働時間に含めない）。
+待つ先は、それ自体は他の段階を待たない段階にする（待ちが循環しないように）。
+
+ワーカーはスレッドで、OCR（Tesseractのサブプロセス待ち）やOpenCV・NumPyの処理（GILを解放する）が重なる。
+段階ごとの稼働率（処理時間 ÷（経過時間 × ワーカー数））と待ち時間を stats() で返し、ボトルネックの確認に使う。
+"""
+
+import queue
+import threading
+import time
+
+# 各段階のキューの既定の上限
+PIPELINE_QUEUE_SIZE = 4
+
+# ワーカーの終了の合図
+_STOP = object()
+
+# 実行中の段階（item.wait の待ち時間をその段階に記録する）
+_current = threading.local()
+
+
+class PipelineItem:
+    """パイプラインを流れる1件（data は段階の間で受け渡す辞書）"""
+
+    def __init__(self, seq, data, stage_names):
+        self.seq = seq
+        self.data = data
+        # 失敗した段階と例外（以降の段階は実行しない）
+        self.error = None
+        self._done = {name: threading.Event() for name in stage_names}
+
+    def wait(self, stage_name):
+        """指定した段階がこの項目を処理し終えるまで待つ"""
+        event = self._done[stage_name]
+        if event.is_set():
+            return
+        started = time.perf_counter()
+        event.wait()
+        if getattr(_current, 'stage', None) is not None:
+            _current.wait_seconds += time.perf_counter() - started
+
+
+class PipelineStage:
+    """1つの段階（上限付きのキューとワーカーのスレッド）"""
+
+    def __init__(self, name, fn, workers=1, queue_size=PIPELINE_QUEUE_SIZE, after=()):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.after = tuple(after)
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.next_stages = []
+        self._threads = []
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+        # 他の段階の結果を待った時間、キューで待った時間、後ろの段階のキューが空くのを待った時間
+        self.wait_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue = 0
+
+    def put(self, item):
+        """項目をキューに入れる（キューが一杯なら空くまで待ち、待った時間を返す）"""
+        started = time.perf_counter()
+        self.queue.put((item, started))
+        blocked = time.perf_counter() - started
+        with self._lock:
+            self.max_queue = max(self.max_queue, self.queue.qsize())
+        return blocked
+
+    def start(self, pipeline, thread_hook=None):
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(pipeline,),
+                                      name=f'pipeline-{self.name}-{i}', daemon=True)
+            if thread_hook is not None:
+                thread_hook(thread)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """キューの残りを処理し終えてからワーカーを終了"""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self, pipeline):
+        while True:
+            entry = self.queue.get()
+            if entry is _STOP:
+                return
+            item, queued_at = entry
+            started = time.perf_counter()
+            _current.stage = self
+            _current.wait_seconds = 0.0
+            if item.error is None:
+                try:
+                    self.fn(item)
+                except Exception as e:
+                    item.error = (self.name, e)
+            finished = time.perf_counter()
+            waited = _current.wait_seconds
+            _current.stage = None
+            item._done[self.name].set()
+
+            blocked = pipeline._forward(item, self)
+            with self._lock:
+                self.items += 1
+                self.queue_seconds += started - queued_at
+                self.wait_seconds += waited
+                self.busy_seconds += finished - started - waited
+                self.blocked_seconds += blocked
+
+
+class StagedPipeline:
+    """段階を組み合わせたパイプライン"""
+
+    def __init__(self, thread_hook=None):
+        # thread_hook: ワーカーのスレッドを開始する前に呼ぶ関数（Streamlitの add_script_run_ctx など）
+        self.thread_hook = thread_hook
+        self.stages = []
+        self._stage_map = {}
+        self._lock = threading.Lock()
+        self._output = queue.Queue()
+        self._input_stats = None
+        self.wall_seconds = 0.0
+
+    def add_stage(self, name, fn, workers=1, queue_size=PIPELINE_QUEUE_SIZE, after=()):
+        """段階を追加（after の段階は先に追加しておく）
+
+        Args:
+            fn: fn(item) で呼ばれ、item.data を読み書きする
+            workers: ワーカーの数
+            queue_size: キューの上限
+            after: この段階の前に処理を終えている必要がある段階の名前
+        """
+        if name in self._stage_map:
+            raise ValueError(f"段階の名前が重複しています: {name}")
+        for previous in after:
+            if previous not in self._stage_map:
+                raise ValueError(f"前の段階 {previous} が追加されていません")
+        stage = PipelineStage(name, fn, workers=workers, queue_size=queue_size, after=after)
+        for previous in after:
+            self._stage_map[previous].next_stages.append(stage)
+        self.stages.append(stage)
+        self._stage_map[name] = stage
+        return stage
+
+    def _forward(self, item, stage):
+        """段階を終えた項目を次の段階へ（前の段階がすべて終わった段階だけ）。待った時間を返す"""
+        ready = []
+        with self._lock:
+            for next_stage in stage.next_stages:
+                item._pending[next_stage.name] -= 1
+                if item._pending[next_stage.name] == 0:
+                    ready.append(next_stage)
+            item._remaining -= 1
+            finished = item._remaining == 0
+        blocked = sum(next_stage.put(item) for next_stage in ready)
+        if finished:
+            self._output.put(item)
+        return blocked
+
+    def run(self, items, passthrough=None, input_name='decode'):
+        """項目を流し、処理を終えた項目を投入した順に返す
+
+        Args:
+            items: item.data にする辞書を順に返すイテラブル（取り出しにかかった時間を input_name の段階として集計）
+            passthrough: True を返した項目は段階を通さずにそのまま返す（事前チェックで除外した画像など）
+
+        段階で例外が起きた場合は、その項目を返す順番で例外を送出する。
+        """
+        names = [stage.name for stage in self.stages]
+        sources = [stage for stage in self.stages if not stage.after]
+        for stage in self.stages:
+            stage.reset_stats()
+        self._input_stats = {'name': input_name, 'workers': 1, 'items': 0, 'busy_seconds': 0.0,
+                             'wait_seconds': 0.0, 'queue_seconds': 0.0, 'blocked_seconds': 0.0, 'max_queue': 0}
+        for stage in self.stages:
+            stage.start(self, self.thread_hook)
+
+        started = time.perf_counter()
+        completed = {}
+        next_seq = 0
+        submitted = 0
+        iterator = iter(items)
+        try:
+            while True:
+                read_started = time.perf_counter()
+                try:
+                    data = next(iterator)
+                except StopIteration:
+                    break
+                self._input_stats['busy_seconds'] += time.perf_counter() - read_started
+                self._input_stats['items'] += 1
+
+                item = PipelineItem(submitted, data, names)
+                submitted += 1
+                if passthrough is not None and passthrough(data) or not self.stages:
+                    completed[item.seq] = item
+                else:
+                    item._pending = {stage.name: len(stage.after) for stage in self.stages}
+                    item._remaining = len(self.stages)
+                    for stage in sources:
+                        self._input_stats['blocked_seconds'] += stage.put(item)
+
+                # 処理を終えた項目を順番どおりに返す（投入を止めずに、終わっているものだけ）
+                while True:
+                    while not self._output.empty():
+                        finished_item = self._output.get()
+                        completed[finished_item.seq] = finished_item
+                    if next_seq not in completed:
+                        break
+                    yield self._release(completed.pop(next_seq))
+                    next_seq += 1
+
+            while next_seq < submitted:
+                while next_seq not in completed:
+                    finished_item = self._output.get()
+                    completed[finished_item.seq] = finished_item
+                yield self._release(completed.pop(next_seq))
+                next_seq += 1
+        finally:
+            for stage in self.stages:
+                stage.stop()
+            self.wall_seconds = time.perf_counter() - started
+
+    def _release(self, item):
+        if item.error is not None:
+            raise item.error[1]
+        return item
+
+    def stats(self):
+        """段階ごとの処理件数・稼働率・待ち時間（投入側の段階を先頭に含む）"""
+        wall = max(self.wall_seconds, 1e-9)
+        rows = []
+        entries = [self._input_stats] if self._input_stats else []
+        entries += [{'name': stage.name, 'workers': stage.workers, 'items': stage.items,
+                     'busy_seconds': stage.busy_seconds, 'wait_seconds': stage.wait_seconds,
+                     'queue_seconds': stage.queue_seconds, 'blocked_seconds': stage.blocked_seconds,
+                     'max_queue': stage.max_queue}
+                    for stage in self.stages]
+        for entry in entries:
+            rows.append({
+                **entry,
+                'occupancy': entry['busy_seconds'] / (wall * entry['workers']),
+                'avg_seconds': entry['busy_seconds'] / entry['items'] if entry['items'] else 0.0,
+            })
+        return rows
+
+    def bottleneck(self):
+        """稼働率が最も高い段階の名前"""
+        rows = self.stats()
+        return max(rows, key=lambda row: row['occupancy'])['name'] if rows else None
@@ -22,6 +22,11 @@ import json
 
 # 同じディレクトリのモジュールをインポート
 from web_analyzer import WebCompatibleAnalyzer
+from results_store import ResultsStore, machine_number_from_file_name
+
+# 1ファイルのHTMLレポート（ダウンロードとプレビュー）を作る枚数の上限
+# これより多い場合はZIPのページ分割レポート（index.html）だけを作る
+INLINE_REPORT_MAX_IMAGES = 50
 
 # ページ設定
 st.set_page_config(
@@ -191,6 +196,7 @@ with tab1:
                             # 各画像の処理
                             status_text.text("📊 画像を解析中...")
                             total_images = len(saved_files)
+                            history_records = []
                             for i, file_path in enumerate(saved_files):
                                 status_text.text(f"📊 画像を解析中... ({i+1}/{total_images})")
                                 progress = 25 + int(50 * (i + 1) / total_images)
@@ -198,22 +204,49 @@ with tab1:
                                 
                                 result = analyzer.process_single_image(file_path, output_dir)
                                 
+                                # 解析結果データベース用（事前チェックで除外した画像は記録しない）
+                                if result and (result.get('preflight') or {}).get('status', 'graph') == 'graph':
+                                    history_records.append({
+                                        'file_name': result['filename'],
+                                        'machine_number': machine_number_from_file_name(result['filename']),
+                                        'source': 'streamlit_app',
+                                        'success': not result.get('error'),
+                                        'error': result.get('error'),
+                                        'extraction_mode': analyzer.extraction_mode,
+                                        'color': result.get('detected_color'),
+                                        'data_points': result.get('series'),
+                                        **{key: result['analysis'].get(key) for key in
+                                           ('max_value', 'min_value', 'final_value', 'first_hit_value',
+                                            'total_jackpot_balls')}
+                                    })
+                                
                                 if show_individual and result:
                                     if result.get('error'):
                                         st.error(f"❌ {result['filename']}: {result['error']}")
                                     else:
                                         st.write(f"✅ {result['filename']}: 最高値 {result['analysis']['max_value']:,}玉")
                             
+                            # 解析結果データベースにまとめて保存
+                            try:
+                                ResultsStore().record_batch(history_records)
+                            except Exception as e:
+                                print(f"解析結果データベースへの保存エラー: {e}")
+                            
                             # レポート生成
                             status_text.text("📝 レポートを生成中...")
                             progress_bar.progress(80)
                             
-                            report_path = os.path.join(temp_dir, "report.html")
-                            analyzer.generate_html_report(report_path)
+                            # ZIP用のページ分割レポート（結果データとサムネイルを別ファイルにする）
+                            report_path = os.path.join(temp_dir, "index.html")
+                            report_files = analyzer.generate_paged_report(report_path)
                             
-                            # HTMLレポート読み込み
-                            with open(report_path, 'r', encoding='utf-8') as f:
-                                html_content = f.read()
+                            # 1ファイルのHTMLレポート（枚数が多い場合は作らない）
+                            html_content = None
+                            if len(analyzer.results) <= INLINE_REPORT_MAX_IMAGES:
+                                inline_report_path = os.path.join(temp_dir, "report.html")
+                                analyzer.generate_html_report(inline_report_path)
+                                with open(inline_report_path, 'r', encoding='utf-8') as f:
+                                    html_content = f.read()
                             
                             # ZIPファイル作成（production版と同じ形式）
                             status_text.text("📦 パッケージを作成中...")
@@ -233,6 +266,8 @@ with tab1:
 
 📁 ファイル構成:
 ├── index.html          ... メインレポート（ブラウザで開いてください）
+├── index_data.js       ... 解析結果データ（index.htmlが読み込みます）
+├── thumbs/             ... 一覧表示用のサムネイル
 ├── images/             ... 画像ファイル
 │   ├── *.png          ... AI分析結果画像
 │   └── *.jpg          ... 元画像ファイル
@@ -331,8 +366,9 @@ ErrorDocument 404 /index.html
 """
                             
                             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                                # HTMLレポートをindex.htmlとして保存
-                                zipf.write(report_path, "index.html")
+                                # ページ分割レポート（index.html・結果データ・サムネイル）
+                                for report_file in report_files:
+                                    zipf.write(os.path.join(temp_dir, report_file), report_file)
                                 
                                 # README.txt
                                 zipf.writestr("README.txt", readme_content)
@@ -477,13 +513,16 @@ with tab2:
         
         with col1:
             # HTMLレポート
-            st.download_button(
-                label="📄 HTMLレポート",
-                data=results['html_content'],
-                file_name=f"report_{results['timestamp']}.html",
-                mime="text/html",
-                use_container_width=True
-            )
+            if results['html_content']:
+                st.download_button(
+                    label="📄 HTMLレポート",
+                    data=results['html_content'],
+                    file_name=f"report_{results['timestamp']}.html",
+                    mime="text/html",
+                    use_container_width=True
+                )
+            else:
+                st.caption(f"{INLINE_REPORT_MAX_IMAGES}枚を超える場合は、ZIPパッケージのindex.htmlをご覧ください")
         
         with col2:
             # ZIPパッケージ（画像含む）
@@ -508,10 +547,13 @@ with tab2:
         st.subheader("📋 レポートプレビュー")
         
         # HTMLをiframeで表示
-        html_bytes = results['html_content'].encode()
-        html_b64 = base64.b64encode(html_bytes).decode()
-        iframe_html = f'<iframe src="data:text/html;base64,{html_b64}" width="100%" height="800"></iframe>'
-        st.markdown(iframe_html, unsafe_allow_html=True)
+        if results['html_content']:
+            html_bytes = results['html_content'].encode()
+            html_b64 = base64.b64encode(html_bytes).decode()
+            iframe_html = f'<iframe src="data:text/html;base64,{html_b64}" width="100%" height="800"></iframe>'
+            st.markdown(iframe_html, unsafe_allow_html=True)
+        else:
+            st.info(f"{results['image_count']}枚のため、プレビューは省略しました。ZIPパッケージのindex.htmlをご覧ください。")
         
     else:
         st.info("📊 まだ解析結果がありません。「アップロード」タブから画像をアップロードして解析を開始してください。")
@@ -11,6 +11,20 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import io
 from web_analyzer import WebCompatibleAnalyzer
+from graph_detection import (CANONICAL_WIDTH, normalize_resolution, layout_to_source, detect_orange_bottom,
+                             compute_row_scores, detect_graph_layout, detect_graph_layout_multires, reduce_image)
+from layout_registry import LayoutRegistry
+from preflight import preflight_check
+from upload_dedup import upload_fingerprint, find_duplicate
+from machine_series import MachineSeriesStore
+from results_store import ResultsStore, machine_number_from_file_name
+from archive_upload import ARCHIVE_TYPES, is_archive, count_uploads, iter_uploads, load_upload_array
+from staged_pipeline import StagedPipeline
+from ocr_cache import OcrCache
+from digit_ocr import DigitTemplateReader, SITE7_TABLE_FIELDS, format_site7_text
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+from calibration import (DETECTION_SETTING_KEYS, measure_calibration_sample, detection_settings_key,
+                         predict_max, solve_calibration)
 import platform
 import pytesseract
 import re
@@ -81,7 +95,7 @@ def extract_machine_number_from_orange_bar(image):
             # OCRで台番号を読み取り
             try:
                 # 横長の画像なのでPSM 7（単一テキスト行）を使用
-                text = pytesseract.image_to_string(result, lang='jpn', config='--psm 7')
+                text = ocr_cache.image_to_string(result, lang='jpn', config='--psm 7')
                 
                 # 台番号パターンを探す（「2308番台」のような形式）
                 match = re.search(r'(\d{1,4})\s*番台', text)
@@ -118,7 +132,7 @@ def extract_machine_number_from_orange_bar(image):
             try:
                 # 複数のOCR設定を試す
                 for config in [r'--oem 3 --psm 8', r'--oem 3 --psm 7', r'--oem 3 --psm 11', r'--oem 3 --psm 6']:
-                    text = pytesseract.image_to_string(binary, lang='jpn', config=config)
+                    text = ocr_cache.image_to_string(binary, lang='jpn', config=config)
                     # 台番号のパターンを探す
                     # 「1番」「1番台」「台1」「No.1」など
                     patterns = [
@@ -191,7 +205,7 @@ def extract_machine_number_from_orange_bar(image):
         for binary in [binary1, white_mask, binary3]:
             for config in configs:
                 try:
-                    text = pytesseract.image_to_string(binary, lang='jpn', config=config)
+                    text = ocr_cache.image_to_string(binary, lang='jpn', config=config)
                     # 数字を探す
                     numbers = re.findall(r'\d+', text)
                     for num in numbers:
@@ -215,14 +229,45 @@ def extract_machine_number_from_orange_bar(image):
     except Exception as e:
         return None
 
-def extract_site7_data(image):
-    """site7の画像からOCRでデータを抽出"""
+# 数字のテンプレート認識（site7の固定フォントの数字。テンプレートがない場合はTesseractだけで読む）
+digit_reader = DigitTemplateReader()
+
+def extract_site7_data(image, skip_machine_number=None):
+    """site7の画像からOCRでデータを抽出
+
+    数値項目はまず数字のテンプレート照合で読み、表の全項目を十分な信頼度で読めた場合はTesseractを使わない。
+    信頼度の低い項目がある場合だけ従来どおり画像全体をTesseractで読み、読めた項目はテンプレートの結果を優先する。
+
+    skip_machine_number を省略した場合はセッションステートの設定を使う
+    （解析ループのワーカースレッドからは、ループの開始時に読み込んだ値を渡す）
+    """
     try:
-        # まず、オレンジバーから台番号を抽出（スキップ設定を確認）
-        machine_number = None
-        if len(image.shape) == 3 and not st.session_state.get('skip_machine_number', True):  # カラー画像で、かつスキップしない場合
+        # 固定フォントの数字をテンプレート照合で読む（1枚数ミリ秒）
+        template_fields, template_confidence = {}, {}
+        if len(image.shape) == 3:
+            template_fields, template_confidence = digit_reader.read_site7(image)
+        
+        # まず、オレンジバーから台番号を抽出（テンプレートで読めない場合のTesseractはスキップ設定を確認）
+        machine_number = template_fields.get('machine_number')
+        if skip_machine_number is None:
+            skip_machine_number = st.session_state.get('skip_machine_number', True)
+        if machine_number is None and len(image.shape) == 3 and not skip_machine_number:  # カラー画像で、かつスキップしない場合
             machine_number = extract_machine_number_from_orange_bar(image)
         
+        # 表の全項目をテンプレートで読めた場合はTesseractを使わない
+        if digit_reader.is_confident(template_confidence):
+            data = {
+                'machine_number': machine_number,
+                **{field: template_fields[field] for field in SITE7_TABLE_FIELDS},
+                'ocr_text': format_site7_text({**template_fields, 'machine_number': machine_number}),
+                'orange_bar_detected': machine_number is not None,  # デバッグ用
+                'ocr_engine': 'template',
+            }
+            # 最高出玉は妥当な範囲の値だけ使う（Tesseractの場合と同じ100-99999）
+            if data['max_payout'] and not 100 <= int(data['max_payout']) <= 99999:
+                data['max_payout'] = None
+            return data
+        
         # 画像をグレースケールに変換
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
@@ -236,7 +281,7 @@ def extract_site7_data(image):
         adjusted = cv2.convertScaleAbs(gray, alpha=alpha, beta=beta)
         
         # 全体のOCR実行（日本語対応）
-        text = pytesseract.image_to_string(adjusted, lang='jpn')
+        text = ocr_cache.image_to_string(adjusted, lang='jpn')
         
         # 抽出したいデータのパターン定義
         data = {
@@ -248,7 +293,8 @@ def extract_site7_data(image):
             'jackpot_probability': None,
             'max_payout': None,
             'ocr_text': text,  # OCRテキストも保存
-            'orange_bar_detected': machine_number is not None  # デバッグ用
+            'orange_bar_detected': machine_number is not None,  # デバッグ用
+            'ocr_engine': 'tesseract',
         }
         
         # 台番号がオレンジバーから取得できなかった場合、全体テキストから探す
@@ -329,6 +375,11 @@ def extract_site7_data(image):
                     data['max_payout'] = str(value)
                     break
         
+        # テンプレートで十分な信頼度で読めた項目はそちらを使う
+        for field, value in digit_reader.confident_fields(template_fields, template_confidence).items():
+            if field == 'max_payout' and not 100 <= int(value) <= 99999:
+                continue
+            data[field] = value
         
         return data
     except Exception as e:
@@ -347,6 +398,8 @@ default_settings = {
     # グリッドライン調整値
     'grid_30k_offset': 1,       # +30000ライン（最上部）
     'grid_minus_30k_offset': -34, # -30000ライン（最下部）
+    # ピクセル値の基準となる画像幅（入力画像はこの幅に拡大縮小してから解析）
+    'reference_width': CANONICAL_WIDTH,
 }
 
 # セッションステートの初期化（エキスパンダーより前に行う）
@@ -598,6 +651,42 @@ def init_database():
 # データベースを初期化
 init_database()
 
+# 画面レイアウト登録簿（同じデータベースのlayoutsテーブル）
+layout_registry = LayoutRegistry(db_path)
+machine_series_store = MachineSeriesStore(db_path)
+results_store = ResultsStore(os.path.join(os.path.dirname(db_path), 'results.db'))
+
+# OCR結果のキャッシュ（前処理済みの領域と設定が同じならTesseractを呼ばない。再解析や同じ台の画像で効く）
+# スクリプトの再実行でメモリのキャッシュが消えないよう、プロセスで1つを共有する
+@st.cache_resource(show_spinner=False)
+def get_ocr_cache(cache_path):
+    return OcrCache(disk_path=cache_path)
+
+ocr_cache = get_ocr_cache(os.path.join(os.path.dirname(db_path), 'ocr_cache.db'))
+
+# 解析ループの段階ごとのワーカー数とキューの上限
+# OCRはTesseractのサブプロセスを待つ時間が長いため、抽出より多めにして他の画像の抽出の裏で進める
+UPLOAD_PIPELINE_WORKERS = {'ocr': 2, 'extract': 2, 'render': 1, 'metrics': 1}
+UPLOAD_PIPELINE_QUEUE_SIZE = 4
+
+# 解析結果に残す表示用画像（結果は画像の枚数分たまるため、配列ではなくJPEGのバイト列で保持する）
+RESULT_IMAGE_JPEG_QUALITY = 90
+# 元画像（折りたたみ表示）と事前チェックで除外した画像の最大幅
+RESULT_THUMBNAIL_WIDTH = 600
+
+def encode_result_image(image, max_width=None):
+    """RGBの画像を表示用のJPEGのバイト列に変換（st.image にそのまま渡せる）"""
+    if max_width and image.shape[1] > max_width:
+        image = cv2.resize(image, (max_width, int(image.shape[0] * max_width / image.shape[1])),
+                           interpolation=cv2.INTER_AREA)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    elif image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    _, encoded = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                              [cv2.IMWRITE_JPEG_QUALITY, RESULT_IMAGE_JPEG_QUALITY])
+    return encoded.tobytes()
+
 # プリセットを読み込み
 def load_presets_from_db():
     """データベースからプリセットを読み込み"""
@@ -661,6 +750,35 @@ def delete_preset_from_db(name):
         st.error(f"プリセットの削除に失敗しました: {str(e)}")
         return False
 
+# 検出の中間結果をキャッシュ（設定値に依存しない部分）
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_detection_base(file_digest, _file_bytes, reference_width=None):
+    """基準幅に正規化した画像・オレンジバー位置・各行のゼロラインスコア
+
+    切り抜きサイズやグリッド調整値に依存しないため、設定を変更しても再計算しない。
+    画像バイト列はハッシュ計算を避けるため引数名を_始まりにし、file_digestをキーに使う。
+    """
+    img_array = np.array(Image.open(io.BytesIO(_file_bytes)).convert('RGB'))
+    img_array, scale_factor = normalize_resolution(img_array, reference_width)
+    orange_bottom = detect_orange_bottom(img_array)
+    row_scores = compute_row_scores(cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY))
+    return img_array, orange_bottom, row_scores, scale_factor
+
+def load_detection_base_for(uploaded_file):
+    """アップロードファイルから検出の中間結果を取得（現在の設定の基準幅に正規化）"""
+    file_bytes = uploaded_file.getvalue()
+    return load_detection_base(hashlib.md5(file_bytes).hexdigest(), file_bytes,
+                               st.session_state.settings.get('reference_width'))
+
+# キャリブレーション用の計測結果をキャッシュ
+@st.cache_data(show_spinner=False, max_entries=64)
+def measure_calibration_sample_cached(file_digest, _file_bytes, file_name, settings_key, reference_width=None):
+    """画像ごとの計測結果（ファイル内容と検出設定が同じなら再計測しない）"""
+    img_array, orange_bottom, row_scores, _ = load_detection_base(file_digest, _file_bytes, reference_width)
+    settings = dict(zip(DETECTION_SETTING_KEYS, settings_key))
+    layout = detect_graph_layout(img_array, settings, row_scores=row_scores, orange_bottom=orange_bottom)
+    return measure_calibration_sample(img_array, settings, name=file_name, layout=layout)
+
 # 本番解析セクション
 st.markdown("---")
 st.markdown("## 🎰 AI Graph Analysis Report")
@@ -697,13 +815,13 @@ if show_analysis_help:
 
 # STEP 1: ファイルアップロード
 st.markdown("### 📤 STEP 1: 解析したいグラフ画像をアップロード")
-st.caption("site7のグラフ画像を選択してください（複数可）")
+st.caption("site7のグラフ画像を選択してください（複数可、まとめたZIP・tarも可）")
 
 uploaded_files = st.file_uploader(
     "画像を選択",
-    type=['jpg', 'jpeg', 'png'],
+    type=['jpg', 'jpeg', 'png'] + ARCHIVE_TYPES,
     accept_multiple_files=True,
-    help="複数の画像を一度にアップロードできます（JPG, PNG形式）",
+    help="複数の画像を一度にアップロードできます（JPG, PNG形式）。大量の画像はZIP・tarにまとめてアップロードすると、1枚ずつ読み込んで解析します",
     key="graph_uploader"
 )
 
@@ -736,9 +854,40 @@ if uploaded_files:
     # 以降はunique_filesを使用
     uploaded_files = unique_files
     
+    # アーカイブは中の画像の枚数を数える（メンバーの一覧だけを読み、画像は解析時に1枚ずつ読み込む）
+    archive_files = [f for f in uploaded_files if is_archive(f.name)]
+    if archive_files:
+        total_uploads = count_uploads(uploaded_files)
+        st.info(f"🗜️ アーカイブ {len(archive_files)}件を含めて、合計{total_uploads}枚の画像を解析します")
+    
     # ファイル名をセッションステートに保存
     st.session_state.uploaded_file_names = [f.name for f in uploaded_files]
     
+    # 登録済みの画面レイアウトからプリセットを自動選択（デフォルト使用中の場合のみ、アップロードごとに1回）
+    auto_preset_key = tuple(st.session_state.uploaded_file_names)
+    if (st.session_state.get('current_preset_name', 'デフォルト') == 'デフォルト' and
+            st.session_state.get('auto_preset_checked') != auto_preset_key):
+        st.session_state.auto_preset_checked = auto_preset_key
+        try:
+            first_upload = next(iter_uploads(uploaded_files), None)
+            first_img = np.array(Image.open(io.BytesIO(first_upload.getvalue())).convert('RGB'))
+            # 登録簿のキーは解析時と同じく基準幅に正規化した画像で作られている
+            normalized_img, first_scale = normalize_resolution(first_img, st.session_state.settings.get('reference_width'))
+            suggested_preset = layout_registry.suggest_preset(normalized_img)
+            if suggested_preset is None and first_scale != 1.0:
+                # 基準幅を持たない（元のピクセルで調整した）プリセットは元のサイズで登録されている
+                suggested_preset = layout_registry.suggest_preset(first_img)
+            if suggested_preset in st.session_state.saved_presets:
+                st.session_state.settings = st.session_state.saved_presets[suggested_preset].copy()
+                st.session_state.current_preset_name = suggested_preset
+                st.session_state.auto_selected_preset = suggested_preset
+        except Exception as e:
+            print(f"プリセット自動選択エラー: {e}")
+    
+    if st.session_state.get('auto_selected_preset') and \
+            st.session_state.get('current_preset_name') == st.session_state.auto_selected_preset:
+        st.info(f"📱 画面レイアウトから '{st.session_state.auto_selected_preset}' を自動選択しました")
+    
     # STEP 2: プリセット選択
     st.markdown("### 📋 STEP 2: 解析設定を選択")
     st.caption("保存されたプリセットを選択するか、デフォルト設定を使用します")
@@ -829,9 +978,65 @@ if uploaded_files:
     skip_machine_number = st.checkbox(
         "🏷️ 台番号検出をスキップ", 
         value=True,
-        help="台番号の検出処理をスキップして高速化します。台番号はファイル名から推測されます。"
+        help="Tesseractでの台番号の検出処理をスキップして高速化します。数字のテンプレート照合で読めなかった台番号はファイル名から推測されます。"
+    )
+    
+    extraction_labels = {
+        '標準（2ピクセルステップ）': 'fast',
+        '⚡ 自動（信頼度が低い画像のみ高精度で再解析）': 'cascade',
+        '🎯 高精度（全カラム・サブピクセル）': 'subpixel',
+        '🧵 ライン追跡（文字・マーカーを除外）': 'trace'
+    }
+    extraction_label = st.selectbox(
+        "📈 抽出モード",
+        list(extraction_labels.keys()),
+        index=0,
+        help="高精度: 全カラムをサブピクセル精度で抽出し、ジャックポットのスパイクや最高値をより正確に読み取ります。"
+             "ライン追跡: 直前の位置付近だけを探索してラインをたどるため、同じ色の文字やマーカーの影響を受けにくくなります。"
+             "自動: 標準で抽出し、ラインの途切れや外れ値・OCRの最高出玉との食い違いから信頼度が低いと判断した画像だけ高精度で再解析します。"
+    )
+    
+    smoothing_labels = {
+        'なし': None,
+        'Hampel（外れ値除去）': 'hampel',
+        'メディアン': 'median',
+        '適応的（エッジ保護）': 'adaptive'
+    }
+    smoothing_label = st.selectbox(
+        "〰️ 抽出後の平滑化",
+        list(smoothing_labels.keys()),
+        index=0,
+        help="抽出したグラフデータのノイズを除去します。文字やマーカーによる外れ値が多い場合に有効です。"
     )
     
+    multi_series = st.checkbox(
+        "🌈 複数系列を抽出（比較スクリーンショット用）",
+        value=False,
+        help="1枚の画像に複数の色のグラフがある場合、各色の系列を個別に抽出します。主な系列（最も長い系列）の結果は通常と同じです。"
+    )
+    
+    incremental = st.checkbox(
+        "♻️ 同じ台の前回の解析から差分だけ解析",
+        value=False,
+        help="同じ日に同じ台を撮影し直した場合、前回のグラフと一致することを確認して右側に増えた部分だけを解析します。"
+             "台番号（OCRまたはオレンジバー）が読み取れた画像のみ対象です。標準・高精度モードで使用できます。"
+    )
+    
+    # 解析結果データベースに記録する店舗名とグラフの日付
+    col_hist1, col_hist2 = st.columns([1, 1])
+    with col_hist1:
+        hall_name = st.text_input(
+            "🏢 店舗名（任意）",
+            value=st.session_state.get('hall_name', ''),
+            help="解析結果データベースに店舗名を記録し、履歴で店舗ごとに集計できます。"
+        )
+    with col_hist2:
+        graph_date = st.date_input(
+            "📅 グラフの日付",
+            value=st.session_state.get('graph_date', datetime.now().date()),
+            help="過去のスクリーンショットを解析する場合は撮影した日付を指定してください。"
+        )
+    
     st.caption("設定を確認したら、解析ボタンをクリックしてください")
     
     if st.button("🚀 解析を開始", type="primary", use_container_width=True):
@@ -839,6 +1044,12 @@ if uploaded_files:
         st.session_state.skip_ocr = skip_ocr
         st.session_state.show_ocr_debug = show_ocr_debug
         st.session_state.skip_machine_number = skip_machine_number
+        st.session_state.extraction_mode = extraction_labels[extraction_label]
+        st.session_state.smoothing = smoothing_labels[smoothing_label]
+        st.session_state.multi_series = multi_series
+        st.session_state.incremental = incremental
+        st.session_state.hall_name = hall_name.strip()
+        st.session_state.graph_date = graph_date
         st.rerun()
     
     # プログレスバー（解析中のみ表示）
@@ -912,170 +1123,178 @@ if uploaded_files and st.session_state.get('start_analysis', False):
     
     # 解析結果を格納
     analysis_results = []
-    
-    # 各画像を処理
-    for idx, uploaded_file in enumerate(uploaded_files):
-        # 進捗更新（開始時）
-        progress_start = idx / len(uploaded_files)
-        progress_bar.progress(progress_start)
-        status_text.text(f'処理中... ({idx + 1}/{len(uploaded_files)})')
-        detail_text.text(f'📷 {uploaded_file.name} の画像を読み込み中...')
-        time.sleep(0.1)  # 視覚的フィードバックのため少し徇機
-        
-        # 画像を読み込み
-        image = Image.open(uploaded_file)
-        img_array = np.array(image)
+
+    # 事前チェック用の色範囲（抽出と同じ定義）
+    preflight_color_ranges = WebCompatibleAnalyzer().color_ranges
+
+    # 解析済み画像の指紋（アップロード順の番号と指紋、内容が同じ画像は代表の結果を複製する）
+    upload_fingerprints = []
+    # アップロード順の番号 → ファイル名（表示用）と結果（重複した画像の代表の結果を番号で引く）
+    upload_names = {}
+    results_by_idx = {}
+
+    # 解析結果データベースに記録する日付（差分抽出の前回の結果もこの日付で探す）
+    graph_date_text = st.session_state.get('graph_date', datetime.now().date()).strftime('%Y-%m-%d')
+
+    # アーカイブを含む画像の枚数（進捗表示用）と、読み込めなかった画像・アーカイブ
+    total_uploads = max(1, count_uploads(uploaded_files))
+    unreadable_files = []
+
+    # 解析中の設定（段階のワーカーはスレッドで動くため、セッションステートはここでまとめて読み込む）
+    settings = st.session_state.get('settings', default_settings)
+    skip_ocr = st.session_state.get('skip_ocr', False)
+    skip_machine_number = st.session_state.get('skip_machine_number', True)
+    extraction_mode = st.session_state.get('extraction_mode', 'fast')
+    smoothing = st.session_state.get('smoothing')
+    multi_series = st.session_state.get('multi_series', False)
+    incremental = (st.session_state.get('incremental', False) and not multi_series
+                   and extraction_mode in ('fast', 'subpixel'))
+    layout_preset_name = current_preset_name if current_preset_name != 'デフォルト' else None
+
+    def decode_uploads():
+        """読み込み・事前チェック・重複チェック（前の画像の指紋を使うため、アップロード順に1枚ずつ行う）"""
+        for idx, uploaded_file in enumerate(iter_uploads(uploaded_files, unreadable_files)):
+            status_text.text(f'処理中... ({idx + 1}/{total_uploads})')
+            detail_text.text(f'📷 {uploaded_file.name} の画像を読み込み中...')
+
+            # 画像を読み込み
+            img_array = load_upload_array(uploaded_file)
+            if img_array is None:
+                unreadable_files.append(uploaded_file.name)
+                continue
+            item = {
+                'idx': idx,
+                'name': uploaded_file.name,
+                'img_array': img_array,
+                'image_digest': hashlib.md5(uploaded_file.getvalue()).hexdigest(),
+            }
+
+            # 事前チェック（グラフ画面でない・品質が低い画像はOCRと抽出を行わない）
+            small_image = reduce_image(img_array)
+            item['preflight'] = preflight_check(img_array, preflight_color_ranges,
+                                                settings=settings, small=small_image)
+            if item['preflight']['status'] != 'graph':
+                yield item
+                continue
+
+            # 重複チェック（ファイル名が違っても内容が同じスクリーンショットは解析しない）
+            fingerprint = upload_fingerprint(img_array, item['preflight'], small_image, settings=settings)
+            item['duplicate_kind'], item['duplicate_idx'], item['duplicate_detail'] = \
+                find_duplicate(fingerprint, upload_fingerprints)
+            item['duplicate_name'] = upload_names.get(item['duplicate_idx'])
+            if item['duplicate_kind'] != 'duplicate':
+                upload_fingerprints.append((idx, fingerprint))
+                upload_names[idx] = uploaded_file.name
+            yield item
+
+    def run_ocr(item):
+        """OCR（元画像で実行）"""
+        data = item.data
+        if skip_ocr:
+            data['ocr_data'] = None
+            return
+        ocr_start_time = time.time()
+        data['ocr_data'] = extract_site7_data(data['img_array'], skip_machine_number=skip_machine_number)
+        data['ocr_seconds'] = time.time() - ocr_start_time
+
+    def run_extract(item):
+        """グラフ領域の検出・切り抜き・グリッドライン描画・グラフデータの抽出と統計"""
+        data = item.data
+        img_array = data['img_array']
         height, width = img_array.shape[:2]
-        
-        # OCRでデータ抽出を試みる（スキップ設定を確認）
-        if not st.session_state.get('skip_ocr', False):
-            detail_text.text(f'🔍 {uploaded_file.name} のOCR解析を実行中...')
-            ocr_start_time = time.time()
-            ocr_data = extract_site7_data(img_array)
-            ocr_end_time = time.time()
-            detail_text.text(f'✅ OCR完了 ({ocr_end_time - ocr_start_time:.1f}秒)')
-        else:
-            detail_text.text(f'⚡ {uploaded_file.name} のOCR解析をスキップ（高速モード）')
-            ocr_data = None
-        
-        # Pattern3: Zero Line Based の自動検出
-        detail_text.text(f'📐 {uploaded_file.name} のグラフ領域を検出中...')
-        time.sleep(0.1)  # 視覚的フィードバック
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
-        orange_mask = cv2.inRange(hsv, np.array([10, 100, 100]), np.array([30, 255, 255]))
-        orange_bottom = 0
-        
-        # オレンジバーの検出
-        for y in range(height//2):
-            if np.sum(orange_mask[y, :]) > width * 0.3 * 255:
-                orange_bottom = y
-        
-        # オレンジバーの下端を正確に見つける
-        if orange_bottom > 0:
-            for y in range(orange_bottom, min(orange_bottom + 100, height)):
-                if np.sum(orange_mask[y, :]) < width * 0.1 * 255:
-                    orange_bottom = y
-                    break
-        else:
-            orange_bottom = 150
-        
-        # ゼロライン検出
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        
-        # 設定値を使用（セッションステートから取得）
-        settings = st.session_state.get('settings', default_settings)
-        
-        # 検索範囲（設定値を使用）
-        search_start = orange_bottom + settings['search_start_offset']
-        search_end = min(height - 100, orange_bottom + settings['search_end_offset'])
-        
-        # 切り抜きサイズ（±30000）
-        crop_top_offset = settings['crop_top']
-        crop_bottom_offset = settings['crop_bottom']
-        
-        best_score = 0
-        zero_line_y = (search_start + search_end) // 2
-        
-        for y in range(search_start, search_end):
-            row = gray[y, 100:width-100]
-            darkness = 1.0 - (np.mean(row) / 255.0)
-            uniformity = 1.0 - (np.std(row) / 128.0)
-            score = darkness * 0.5 + uniformity * 0.5
-            
-            if score > best_score:
-                best_score = score
-                zero_line_y = y
-        
+
+        # 基準幅に正規化（OCRは元画像で実行、以降の座標は基準幅の画像に対する値）
+        source_height, source_width = height, width
+        img_array, scale_factor = normalize_resolution(img_array, settings.get('reference_width'))
+        height, width = img_array.shape[:2]
+
+        # 登録済みの画面レイアウトがあれば数行の確認だけで再利用、なければ縮小画像で検出して登録
+        layout_hit = False
+        try:
+            layout, layout_hit = layout_registry.detect(img_array, settings, preset_name=layout_preset_name)
+        except Exception as e:
+            print(f"レイアウト登録簿エラー: {e}")
+            layout = detect_graph_layout_multires(img_array, settings)
+        zero_line_y = layout['zero_line_y']
+
         # 切り抜き範囲を設定（最終調整値）
-        top = max(0, zero_line_y - crop_top_offset)  # 0ラインから上
-        bottom = min(height, zero_line_y + crop_bottom_offset)  # 0ラインから下
-        left = settings['left_margin']  # 左右の余白
-        right = width - settings['right_margin']  # 左右の余白
-        
+        top, bottom = layout['top'], layout['bottom']  # 0ラインから上下
+        left, right = layout['left'], layout['right']  # 左右の余白
+
         # 切り抜き実行
         cropped_img = img_array[int(top):int(bottom), int(left):int(right)].copy()
-        
+
         # グリッドラインを追加
         # 切り抜き画像の高さは493px（246+247）
         # 最上部が+30000、最下部が-30000なので、60000の範囲を493pxで表現
         # 1pxあたり約121.7玉
         crop_height = cropped_img.shape[0]
         zero_line_in_crop = zero_line_y - top  # 切り抜き画像内での0ライン位置
-        
-        # スケール計算（調整されたグリッドラインに基づく）
-        # 注意：この変数はグリッドライン描画にのみ使用され、実際の解析には使用されない
-        scale = 30000 / 246  # グリッドライン描画用のデフォルト値
-        
+
         # グリッドライン描画（設定値を使用）
         # +30000ライン（最上部）
         y_30k = 0 + settings.get('grid_30k_offset', 0)  # 最上部基準
         if 0 <= y_30k < crop_height:
             cv2.line(cropped_img, (0, y_30k), (cropped_img.shape[1], y_30k), (128, 128, 128), 2)
             cv2.putText(cropped_img, '+30000', (10, max(20, y_30k + 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (64, 64, 64), 1)
-        
+
         # -30000ライン（最下部）
         y_minus_30k = crop_height - 1 + settings.get('grid_minus_30k_offset', 0)
         y_minus_30k = min(max(0, y_minus_30k), crop_height - 1)  # 画像範囲内に制限
         cv2.line(cropped_img, (0, y_minus_30k), (cropped_img.shape[1], y_minus_30k), (128, 128, 128), 2)
         cv2.putText(cropped_img, '-30000', (10, max(10, y_minus_30k - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (64, 64, 64), 1)
 
-        
-        # ゼロラインから±30000ラインまでの距離を計算
-        distance_to_plus_30k = zero_line_in_crop - y_30k
-        distance_to_minus_30k = y_minus_30k - zero_line_in_crop
-        
         # 0ライン
         y_0 = int(zero_line_in_crop)  # 調整なし
         if 0 < y_0 < crop_height:
             cv2.line(cropped_img, (0, y_0), (cropped_img.shape[1], y_0), (255, 0, 0), 2)
             cv2.putText(cropped_img, '0', (10, y_0 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 1)
-        
+
         # 元画像にもグリッドラインを追加
         img_with_grid = img_array.copy()
-        
+
         # 元画像での座標に変換（切り抜き前の座標系）
         # +30000ライン（元画像座標）
         y_30k_orig = int(top + y_30k)
         if 0 <= y_30k_orig < height:
             cv2.line(img_with_grid, (0, y_30k_orig), (width, y_30k_orig), (128, 128, 128), 2)
             cv2.putText(img_with_grid, '+30000', (10, max(20, y_30k_orig + 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (64, 64, 64), 2)
-        
+
         # -30000ライン（元画像座標）
         y_minus_30k_orig = int(top + y_minus_30k)
         if 0 <= y_minus_30k_orig < height:
             cv2.line(img_with_grid, (0, y_minus_30k_orig), (width, y_minus_30k_orig), (128, 128, 128), 2)
             cv2.putText(img_with_grid, '-30000', (10, max(10, y_minus_30k_orig - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (64, 64, 64), 2)
-        
+
         # 0ライン（元画像座標）
         if 0 <= zero_line_y < height:
             cv2.line(img_with_grid, (0, zero_line_y), (width, zero_line_y), (255, 0, 0), 2)
             cv2.putText(img_with_grid, '0', (10, zero_line_y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-        
+
         # 切り抜き範囲を示す枠線を追加（オプション）
         cv2.rectangle(img_with_grid, (int(left), int(top)), (int(right), int(bottom)), (0, 255, 0), 2)
 
-        # 解析を自動実行
-        detail_text.text(f'📊 {uploaded_file.name} のグラフデータを解析中...')
-        
         # アナライザーを初期化
         analyzer = WebCompatibleAnalyzer()
-        
+        analyzer.extraction_mode = extraction_mode
+        analyzer.smoothing = smoothing
+
         # グリッドラインなしの画像を使用
         analysis_img = img_array[int(top):int(bottom), int(left):int(right)].copy()
-        
+
         # 0ラインの位置を設定
         analyzer.zero_y = zero_line_in_crop
         # 調整されたグリッドライン位置に基づいてスケールを計算
         crop_height = analysis_img.shape[0]
-        
+
         # 調整された±30,000ライン位置
         y_30k_adjusted = 0 + settings.get('grid_30k_offset', 0)
         y_minus_30k_adjusted = crop_height - 1 + settings.get('grid_minus_30k_offset', 0)
-        
+
         # ゼロラインから調整された±30,000ラインまでの距離
         distance_to_plus_30k_adjusted = zero_line_in_crop - y_30k_adjusted
         distance_to_minus_30k_adjusted = y_minus_30k_adjusted - zero_line_in_crop
-        
+
         # 通常の線形スケール計算
         if distance_to_plus_30k_adjusted > 0 and distance_to_minus_30k_adjusted > 0:
             # 上下の平均距離を使用
@@ -1087,311 +1306,460 @@ if uploaded_files and st.session_state.get('start_analysis', False):
             distance_to_bottom = crop_height - zero_line_in_crop
             avg_distance = (distance_to_top + distance_to_bottom) / 2
             analyzer.scale = 30000 / avg_distance
-        
-        # グラフデータを抽出
-        graph_data_points, dominant_color, _ = analyzer.extract_graph_data(analysis_img)
-        
-        # デバッグ情報を無効化（必要に応じて有効化可能）
-        # if uploaded_file.name in ["IMG_0165.PNG", "IMG_0174.PNG", "IMG_0177.PNG"]:
-        #     st.write(f"🔍 デバッグ情報 - {uploaded_file.name}")
-        #     st.write(f"- ゼロライン位置（切り抜き内）: {zero_line_in_crop}px")
-        #     st.write(f"- 切り抜き画像の高さ: {crop_height}px")
-        #     st.write(f"- 調整された+30000ライン位置: {y_30k_adjusted}px (オフセット: {settings.get('grid_30k_offset', 0)})")
-        #     st.write(f"- 調整された-30000ライン位置: {y_minus_30k_adjusted}px (オフセット: {settings.get('grid_minus_30k_offset', 0)})")
-        #     st.write(f"- ゼロから+30000までの距離: {distance_to_plus_30k_adjusted}px")
-        #     st.write(f"- ゼロから-30000までの距離: {distance_to_minus_30k_adjusted}px")
-        #     st.write(f"- スケール: {analyzer.scale:.2f} 玉/ピクセル")
-        #     st.write(f"- 検出された色: {dominant_color}")
-        #     st.write(f"- データポイント数: {len(graph_data_points) if graph_data_points else 0}")
-        #     if graph_data_points:
-        #         sample_points = graph_data_points[::100][:10]  # 10点をサンプル表示
-        #         st.write("- サンプルデータ (x, 値):")
-        #         for x, val in sample_points:
-        #             y_pixel = zero_line_in_crop - (val / analyzer.scale)
-        #             st.write(f"  X={int(x)}, 値={int(val)}玉, Y座標={int(y_pixel)}px")
-
-        if graph_data_points:
-            # データポイントから値のみを抽出
-            graph_values = [value for x, value in graph_data_points]
-            # 補正前の値を保存
-            graph_values_original = graph_values.copy()
-
-            # 統計情報を計算
-            max_val_original = max(graph_values)
-            min_val_original = min(graph_values)
-            current_val_original = graph_values[-1] if graph_values else 0
-            
-            # インデックスを保存
-            max_idx = graph_values.index(max_val_original)
-            min_idx = graph_values.index(min_val_original)
-            
-            # 補正係数の計算
-            correction_factor = settings.get('correction_factor', 1.0)
-            
-            # 補正を適用
-            if correction_factor != 1.0:
-                max_val = max_val_original * correction_factor
-                min_val = min_val_original * correction_factor
-                current_val = current_val_original * correction_factor
-                # グラフ値も更新（初当たり検出用）
-                graph_values = [v * correction_factor for v in graph_values]
-            else:
-                max_val = max_val_original
-                min_val = min_val_original
-                current_val = current_val_original
-
-            # 最大値が30,000を超える場合は30,000にクリップ
-            if max_val > 30000:
-                max_val = 30000
-            
-            # 最小値が-30,000を下回る場合は-30,000にクリップ
-            if min_val < -30000:
-                min_val = -30000
 
-            # MAXがマイナスの場合は0を表示
-            if max_val < 0:
-                max_val = 0
+        # 差分抽出の対象（台番号と撮影日で前回の解析結果を探す。台番号はOCRの結果を待って使う）
+        machine_key = None
+        incremental_info = None
+        if incremental:
+            item.wait('ocr')
+            machine_number = (data['ocr_data'] or {}).get('machine_number') or extract_machine_number_from_orange_bar(img_array)
+            if machine_number:
+                machine_key = (machine_number, graph_date_text)
+        previous_series = None
+        if machine_key:
+            try:
+                previous_series = machine_series_store.load(*machine_key)
+            except Exception as e:
+                print(f"前回の解析結果の読み込みエラー: {e}")
 
-            # 初当たり値を探す（production版と同じロジック）
+        # グラフデータを抽出
+        series_summary = None
+        incremental_result = None
+        if previous_series:
+            incremental_result = analyzer.extract_graph_data_incremental(analysis_img, previous_series['extraction'])
+        if incremental_result:
+            graph_data_points, dominant_color, _, incremental_info = incremental_result
+        elif multi_series:
+            # 1回の色分類から全系列を抽出し、先頭（主系列）を通常の結果として使う
+            all_series, _ = analyzer.extract_all_series(analysis_img)
+            if all_series:
+                graph_data_points = all_series[0]['data_points']
+                dominant_color = all_series[0]['color']
+            else:
+                graph_data_points, dominant_color = [], "なし"
+            series_factor = settings.get('correction_factor', 1.0)
+            series_summary = [
+                {
+                    'color': series['color'],
+                    'coverage': series['coverage'],
+                    'max_val': max(0, int(min(30000, series['analysis']['max_value'] * series_factor))),
+                    'min_val': max(-30000, int(series['analysis']['min_value'] * series_factor)),
+                    'current_val': int(series['analysis']['final_value'] * series_factor),
+                }
+                for series in all_series
+            ]
+        elif analyzer.extraction_mode == 'cascade':
+            # OCRの最高出玉があれば最大値の妥当性の確認に使う（OCRの結果を待つ）
+            item.wait('ocr')
+            ocr_data = data['ocr_data']
+            ocr_max_payout = int(ocr_data['max_payout']) if ocr_data and ocr_data.get('max_payout') else None
+            graph_data_points, dominant_color, _, _ = analyzer.extract_graph_data_cascade(
+                analysis_img, ocr_max_payout=ocr_max_payout)
+        else:
+            graph_data_points, dominant_color, _ = analyzer.extract_graph_data(analysis_img)
+
+        data.update({
+            'img_array': img_array,
+            'scale_factor': scale_factor,
+            'source_size': (source_width, source_height),
+            'layout': layout,
+            'layout_hit': layout_hit,
+            'zero_line_in_crop': zero_line_in_crop,
+            'graph_width': right - left,  # グラフの実効幅（左右マージンを除外）
+            'img_with_grid': img_with_grid,
+            'cropped_img': cropped_img,
+            'analyzer': analyzer,
+            'graph_data_points': graph_data_points,
+            'dominant_color': dominant_color,
+            'series_summary': series_summary,
+            'incremental_info': incremental_info,
+        })
+        if not graph_data_points:
+            return
+
+        # データポイントから値のみを抽出
+        graph_values = [value for x, value in graph_data_points]
+
+        # 補正係数の計算
+        correction_factor = settings.get('correction_factor', 1.0)
+
+        # 補正を適用（初当たり・大当りの検出も補正後の値で行う）
+        if correction_factor != 1.0:
+            graph_values = [v * correction_factor for v in graph_values]
+
+        # 統計情報を計算（差分抽出の場合は前回の途中状態から追加部分だけを走査）
+        stats_state = None
+        if (incremental_info and previous_series.get('stats') and not analyzer.smoothing
+                and previous_series.get('correction_factor') == correction_factor
+                and previous_series['stats'].get('n') == incremental_info['reused_points']):
+            stats_state = previous_series['stats']
+        running_stats = analyzer.update_running_stats(graph_values, stats_state)
+        max_val = running_stats['max_value']
+        min_val = running_stats['min_value']
+
+        # 最大値が30,000を超える場合は30,000にクリップ
+        if max_val > 30000:
+            max_val = 30000
+
+        # 最小値が-30,000を下回る場合は-30,000にクリップ
+        if min_val < -30000:
+            min_val = -30000
+
+        # MAXがマイナスの場合は0を表示
+        if max_val < 0:
+            max_val = 0
+
+        # 初当たり値（100玉以上の急増、または減少傾向からの急上昇。production版と同じロジック）
+        first_hit_x = running_stats['first_hit_index'] if running_stats['first_hit_index'] >= 0 else None
+        first_hit_val = running_stats['first_hit_value']
+
+        # 初当たり値がプラスの場合は0を表示
+        if first_hit_val > 0:
             first_hit_val = 0
-            first_hit_x = None
-            min_payout = 100  # 最低払い出し玉数
-
-            # 方法1: 100玉以上の急激な増加を検出
-            for i in range(1, min(len(graph_values)-2, 150)):  # 最大150点まで探索
-                current_increase = graph_values[i+1] - graph_values[i]
-
-                # 100玉以上の増加を検出
-                if current_increase > min_payout:
-                    # 次の点も上昇または維持していることを確認（ノイズ除外）
-                    if graph_values[i+2] >= graph_values[i+1] - 50:
-                        # 初当たりは必ずマイナス値から
-                        if graph_values[i] < 0:
-                            first_hit_val = graph_values[i]
-                            first_hit_x = i
-                            break
-
-            # 方法2: 減少傾向からの急上昇を検出
-            if first_hit_x is None:
-                window_size = 5
-                for i in range(window_size, len(graph_values)-1):
-                    # 過去の傾向を計算
-                    past_window = graph_values[max(0, i-window_size):i]
-                    if len(past_window) >= 2:
-                        avg_slope = (past_window[-1] - past_window[0]) / len(past_window)
-
-                        # 現在の変化
-                        current_change = graph_values[i+1] - graph_values[i]
-
-                        # 減少傾向からの急上昇
-                        if avg_slope <= 0 and current_change > min_payout:
-                            if i + 2 < len(graph_values) and graph_values[i+2] > graph_values[i+1] - 50:
-                                # 初当たりは必ずマイナス値
-                                if graph_values[i] < 0:
-                                    first_hit_val = graph_values[i]
-                                    first_hit_x = i
-                                    break
-
-            # 初当たり値がプラスの場合は0を表示
-            if first_hit_val > 0:
-                first_hit_val = 0
-
-            # 総獲得球数の計算（大当り時の増加分の合計）
-            # 補正後の値（graph_values）を使用
-            total_jackpot_balls = 0
-            increase_threshold = 100  # 100玉以上の増加を大当りとみなす
-            
-            i = 0
-            while i < len(graph_values) - 1:
-                # 急激な増加を検出
-                increase = graph_values[i+1] - graph_values[i]
-                if increase >= increase_threshold:
-                    # 大当りの開始点
-                    start_val = graph_values[i]
-                    # 大当りの終了点を探す（最大値まで継続）
-                    j = i + 1
-                    max_val_in_jackpot = graph_values[j]
-                    
-                    while j < len(graph_values) - 1:
-                        if graph_values[j+1] > max_val_in_jackpot:
-                            max_val_in_jackpot = graph_values[j+1]
-                            j += 1
-                        elif graph_values[j+1] < graph_values[j] - 50:  # 50玉以上の下降で大当り終了
-                            break
-                        else:
-                            j += 1
-                    
-                    # この大当りでの獲得球数（開始点から最大値まで）
-                    jackpot_balls = max_val_in_jackpot - start_val
-                    if jackpot_balls > 0:
-                        total_jackpot_balls += jackpot_balls
-                    
-                    # 次の検出開始点を更新
-                    i = j
-                else:
-                    i += 1
-
-            # オーバーレイ画像を作成
-            overlay_img = cropped_img.copy()
 
-            # 検出されたグラフラインを描画
-            prev_x = None
-            prev_y = None
-
-            # 緑色で統一（見やすさ重視）
-            draw_color = (0, 255, 0)  # 緑色固定
-
-            # グラフポイントを描画
-            for x, value in graph_data_points:
-                # Y座標を計算（線形スケール）
-                y = int(zero_line_in_crop - (value / analyzer.scale))
-
-                # 画像範囲内かチェック
-                if y is not None and 0 <= y < overlay_img.shape[0] and 0 <= x < overlay_img.shape[1]:
-                    # 点を描画（より見やすくするため）
-                    cv2.circle(overlay_img, (int(x), y), 2, draw_color, -1)
-
-                    # 線で接続
-                    if prev_x is not None and prev_y is not None:
-                        cv2.line(overlay_img, (int(prev_x), int(prev_y)), (int(x), y), draw_color, 2)
-
-                    prev_x = x
-                    prev_y = y
-
-            # 最高値、最低値、初当たりの位置を見つける
-            # インデックスは既に上で取得済み
+        # 次回の差分抽出のために抽出結果と統計の途中状態を保存
+        if machine_key and analyzer.last_extraction:
+            try:
+                machine_series_store.save(*machine_key, analyzer.last_extraction,
+                                          running_stats['resume'] if not analyzer.smoothing else None,
+                                          correction_factor)
+            except Exception as e:
+                print(f"前回の解析結果の保存エラー: {e}")
+
+        data.update({
+            'correction_factor': correction_factor,
+            'max_val': max_val,
+            'min_val': min_val,
+            'current_val': running_stats['final_value'],
+            'max_idx': running_stats['max_index'],
+            'min_idx': running_stats['min_index'],
+            'first_hit_x': first_hit_x,
+            'first_hit_val': first_hit_val,
+            'total_jackpot_balls': running_stats['total_jackpot_balls'],  # 総獲得球数（大当り時の増加分の合計）
+        })
+
+    def run_render(item):
+        """オーバーレイ画像の描画"""
+        data = item.data
+        graph_data_points = data['graph_data_points']
+        if not graph_data_points:
+            data['overlay_img'] = data['cropped_img']  # 解析失敗時は切り抜き画像を使用
+            return
+        zero_line_in_crop = data['zero_line_in_crop']
+        scale = data['analyzer'].scale
+        max_val, min_val, current_val = data['max_val'], data['min_val'], data['current_val']
+        first_hit_x, first_hit_val = data['first_hit_x'], data['first_hit_val']
 
-            # Y座標計算用の関数（線形スケール）
-            def calculate_y_from_value(val):
-                return int(zero_line_in_crop - (val / analyzer.scale))
-            
-            # 横線を描画（最低値、最高値、現在値、初当たり値）
-            # 最高値ライン（端から端まで）
-            max_y = calculate_y_from_value(max_val)
-            if 0 <= max_y < overlay_img.shape[0]:
+        # オーバーレイ画像を作成
+        overlay_img = data['cropped_img'].copy()
+
+        # 検出されたグラフラインを描画
+        prev_x = None
+        prev_y = None
+
+        # 緑色で統一（見やすさ重視）
+        draw_color = (0, 255, 0)  # 緑色固定
+
+        # グラフポイントを描画
+        for x, value in graph_data_points:
+            # Y座標を計算（線形スケール）
+            y = int(zero_line_in_crop - (value / scale))
+
+            # 画像範囲内かチェック
+            if y is not None and 0 <= y < overlay_img.shape[0] and 0 <= x < overlay_img.shape[1]:
+                # 点を描画（より見やすくするため）
+                cv2.circle(overlay_img, (int(x), y), 2, draw_color, -1)
+
+                # 線で接続
+                if prev_x is not None and prev_y is not None:
+                    cv2.line(overlay_img, (int(prev_x), int(prev_y)), (int(x), y), draw_color, 2)
+
+                prev_x = x
+                prev_y = y
+
+        # Y座標計算用の関数（線形スケール）
+        def calculate_y_from_value(val):
+            return int(zero_line_in_crop - (val / scale))
+
+        # 横線を描画（最低値、最高値、現在値、初当たり値）
+        # 最高値ライン（端から端まで）
+        max_y = calculate_y_from_value(max_val)
+        if 0 <= max_y < overlay_img.shape[0]:
+            # 端から端まで線を引く
+            cv2.line(overlay_img, (0, max_y), (overlay_img.shape[1], max_y), (0, 255, 255), 2)
+            # 最高値の点に大きめの円を描画
+            max_x = graph_data_points[data['max_idx']][0]
+            cv2.circle(overlay_img, (int(max_x), max_y), 8, (0, 255, 255), -1)
+            cv2.circle(overlay_img, (int(max_x), max_y), 10, (0, 200, 200), 2)
+            # 背景付きテキスト（白背景、濃い黄色文字）右端に表示
+            text = f'MAX: {int(max_val):,}'
+            text_width = 140
+            text_y = max_y if max_y > 20 else max_y + 20  # 上端で見切れないように調整
+            cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15),
+                         (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
+            cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 150, 150), 1, cv2.LINE_AA)
+
+        # 最低値ライン（端から端まで）
+        min_y = calculate_y_from_value(min_val)
+        if 0 <= min_y < overlay_img.shape[0]:
+            # 端から端まで線を引く
+            cv2.line(overlay_img, (0, min_y), (overlay_img.shape[1], min_y), (255, 0, 255), 2)
+            # 最低値の点に大きめの円を描画
+            min_x = graph_data_points[data['min_idx']][0]
+            cv2.circle(overlay_img, (int(min_x), min_y), 8, (255, 0, 255), -1)
+            cv2.circle(overlay_img, (int(min_x), min_y), 10, (200, 0, 200), 2)
+            # 背景付きテキスト（白背景、濃いマゼンタ文字）右端に表示
+            text = f'MIN: {int(min_val):,}'
+            text_width = 140
+            text_y = min_y if (min_y > 20 and min_y < overlay_img.shape[0] - 20) else (20 if min_y <= 20 else overlay_img.shape[0] - 20)
+            cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15),
+                         (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
+            cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 0, 150), 1, cv2.LINE_AA)
+
+        # 現在値ライン（端から端まで）
+        current_y = calculate_y_from_value(current_val)
+        if 0 <= current_y < overlay_img.shape[0]:
+            cv2.line(overlay_img, (0, current_y), (overlay_img.shape[1], current_y), (255, 255, 0), 2)
+            # 背景付きテキスト（白背景、濃いシアン文字）右端に表示
+            text = f'CURRENT: {int(current_val):,}'
+            text_width = 160
+            text_y = current_y - 10 if current_y > 30 else current_y + 15
+            cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15),
+                         (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
+            cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 0), 1, cv2.LINE_AA)
+
+        # 初当たり値ライン（端から端まで）
+        if first_hit_x is not None and first_hit_val != 0:  # 初当たりがある場合
+            first_hit_y = calculate_y_from_value(first_hit_val)
+            if 0 <= first_hit_y < overlay_img.shape[0]:
                 # 端から端まで線を引く
-                cv2.line(overlay_img, (0, max_y), (overlay_img.shape[1], max_y), (0, 255, 255), 2)
-                # 最高値の点に大きめの円を描画
-                max_x = graph_data_points[max_idx][0]
-                cv2.circle(overlay_img, (int(max_x), max_y), 8, (0, 255, 255), -1)
-                cv2.circle(overlay_img, (int(max_x), max_y), 10, (0, 200, 200), 2)
-                # 背景付きテキスト（白背景、濃い黄色文字）右端に表示
-                text = f'MAX: {int(max_val):,}'
-                text_width = 140
-                text_y = max_y if max_y > 20 else max_y + 20  # 上端で見切れないように調整
-                cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15), 
+                cv2.line(overlay_img, (0, first_hit_y), (overlay_img.shape[1], first_hit_y), (155, 48, 255), 2)
+                # 初当たりの点に大きめの円を描画
+                first_hit_graph_x = graph_data_points[first_hit_x][0]
+                cv2.circle(overlay_img, (int(first_hit_graph_x), first_hit_y), 8, (155, 48, 255), -1)
+                cv2.circle(overlay_img, (int(first_hit_graph_x), first_hit_y), 10, (120, 30, 200), 2)
+                # 背景付きテキスト（白背景、紫文字）右端に表示
+                text = f'FIRST HIT: {int(first_hit_val):,}'
+                text_width = 150
+                text_y = first_hit_y if (first_hit_y > 20 and first_hit_y < overlay_img.shape[0] - 20) else (20 if first_hit_y <= 20 else overlay_img.shape[0] - 20)
+                cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15),
                              (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
-                cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 150, 150), 1, cv2.LINE_AA)
+                cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (100, 0, 150), 1, cv2.LINE_AA)
+
+        data['overlay_img'] = overlay_img
+
+    def run_metrics(item):
+        """回転率計算（OCRの累計スタートとグラフの統計の両方が揃ってから）"""
+        data = item.data
+        data['rotation_metrics'] = None
+        ocr_data = data['ocr_data']
+        if not data['graph_data_points'] or not (ocr_data and ocr_data.get('total_start')) or skip_ocr:
+            return
+        first_hit_x = data['first_hit_x']
+        # analyze_values形式のデータを作成
+        analysis_data = {
+            'max_value': int(data['max_val']),
+            'max_index': data['max_idx'],
+            'min_value': int(data['min_val']),
+            'min_index': data['min_idx'],
+            'first_hit_index': first_hit_x if first_hit_x is not None else -1,
+            'first_hit_value': int(data['first_hit_val']) if first_hit_x is not None else 0,
+            'final_value': int(data['current_val'])
+        }
+        data['rotation_metrics'] = data['analyzer'].calculate_rotation_metrics(
+            data['graph_data_points'],
+            analysis_data,
+            ocr_data['total_start'],
+            data['graph_width']
+        )
 
-            # 最低値ライン（端から端まで）
-            min_y = calculate_y_from_value(min_val)
-            if 0 <= min_y < overlay_img.shape[0]:
-                # 端から端まで線を引く
-                cv2.line(overlay_img, (0, min_y), (overlay_img.shape[1], min_y), (255, 0, 255), 2)
-                # 最低値の点に大きめの円を描画
-                min_x = graph_data_points[min_idx][0]
-                cv2.circle(overlay_img, (int(min_x), min_y), 8, (255, 0, 255), -1)
-                cv2.circle(overlay_img, (int(min_x), min_y), 10, (200, 0, 200), 2)
-                # 背景付きテキスト（白背景、濃いマゼンタ文字）右端に表示
-                text = f'MIN: {int(min_val):,}'
-                text_width = 140
-                text_y = min_y if (min_y > 20 and min_y < overlay_img.shape[0] - 20) else (20 if min_y <= 20 else overlay_img.shape[0] - 20)
-                cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15), 
-                             (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
-                cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 0, 150), 1, cv2.LINE_AA)
-
-            # 現在値ライン（端から端まで）
-            current_y = calculate_y_from_value(current_val)
-            if 0 <= current_y < overlay_img.shape[0]:
-                cv2.line(overlay_img, (0, current_y), (overlay_img.shape[1], current_y), (255, 255, 0), 2)
-                # 背景付きテキスト（白背景、濃いシアン文字）右端に表示
-                text = f'CURRENT: {int(current_val):,}'
-                text_width = 160
-                text_y = current_y - 10 if current_y > 30 else current_y + 15
-                cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15), 
-                             (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
-                cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 0), 1, cv2.LINE_AA)
-
-            # 初当たり値ライン（端から端まで）
-            if first_hit_x is not None and first_hit_val != 0:  # 初当たりがある場合
-                first_hit_y = calculate_y_from_value(first_hit_val)
-                if 0 <= first_hit_y < overlay_img.shape[0]:
-                    # 端から端まで線を引く
-                    cv2.line(overlay_img, (0, first_hit_y), (overlay_img.shape[1], first_hit_y), (155, 48, 255), 2)
-                    # 初当たりの点に大きめの円を描画
-                    first_hit_graph_x = graph_data_points[first_hit_x][0]
-                    cv2.circle(overlay_img, (int(first_hit_graph_x), first_hit_y), 8, (155, 48, 255), -1)
-                    cv2.circle(overlay_img, (int(first_hit_graph_x), first_hit_y), 10, (120, 30, 200), 2)
-                    # 背景付きテキスト（白背景、紫文字）右端に表示
-                    text = f'FIRST HIT: {int(first_hit_val):,}'
-                    text_width = 150
-                    text_y = first_hit_y if (first_hit_y > 20 and first_hit_y < overlay_img.shape[0] - 20) else (20 if first_hit_y <= 20 else overlay_img.shape[0] - 20)
-                    cv2.rectangle(overlay_img, (overlay_img.shape[1] - text_width - 15, text_y - 15), 
-                                 (overlay_img.shape[1] - 10, text_y + 5), (255, 255, 255), -1)
-                    cv2.putText(overlay_img, text, (overlay_img.shape[1] - text_width - 10, text_y), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (100, 0, 150), 1, cv2.LINE_AA)
-
-            # 結果を保存
-            # 回転率計算（OCRデータがある場合のみ）
-            rotation_metrics = None
-            if ocr_data and ocr_data.get('total_start') and not st.session_state.get('skip_ocr', False):
-                # グラフの実効幅（左右マージンを除外）
-                graph_width = right - left
-                # analyze_values形式のデータを作成
-                analysis_data = {
-                    'max_value': int(max_val),
-                    'max_index': max_idx,
-                    'min_value': int(min_val),
-                    'min_index': min_idx,
-                    'first_hit_index': first_hit_x if first_hit_x is not None else -1,
-                    'first_hit_value': int(first_hit_val) if first_hit_x is not None else 0,
-                    'final_value': int(current_val)
-                }
-                rotation_metrics = analyzer.calculate_rotation_metrics(
-                    graph_data_points, 
-                    analysis_data, 
-                    ocr_data['total_start'],
-                    graph_width
-                )
-            
-            analysis_results.append({
-                'name': uploaded_file.name,
-                'original_image': img_with_grid,  # グリッド付き元画像を保存
-                'cropped_image': cropped_img,  # 切り抜き画像
-                'overlay_image': overlay_img,  # オーバーレイ画像
-                'success': True,
-                'max_val': int(max_val),
-                'min_val': int(min_val),
-                'current_val': int(current_val),
-                'first_hit_val': int(first_hit_val) if first_hit_x is not None else None,
-                'total_jackpot_balls': int(total_jackpot_balls),  # 総獲得球数を追加
-                'dominant_color': dominant_color,
-                'ocr_data': ocr_data,  # OCRデータを追加
-                'ocr_text': ocr_data.get('ocr_text') if ocr_data else None,  # OCRテキストを追加
-                'correction_factor': correction_factor,  # 補正係数を追加
-                'rotation_metrics': rotation_metrics  # 回転率データを追加
-            })
-        else:
-            # 解析失敗時
+    # 読み込み → (OCR ∥ 検出・抽出) → (描画 ∥ 回転率) の段階に分け、OCRの待ち時間を他の画像の抽出の裏に隠す
+    # 差分抽出は同じ台の前の画像の保存結果を読むため、抽出をアップロード順に1枚ずつ行う
+    pipeline = StagedPipeline(thread_hook=add_script_run_ctx)
+    pipeline.add_stage('ocr', run_ocr, workers=UPLOAD_PIPELINE_WORKERS['ocr'],
+                       queue_size=UPLOAD_PIPELINE_QUEUE_SIZE)
+    pipeline.add_stage('extract', run_extract, workers=1 if incremental else UPLOAD_PIPELINE_WORKERS['extract'],
+                       queue_size=UPLOAD_PIPELINE_QUEUE_SIZE)
+    pipeline.add_stage('render', run_render, workers=UPLOAD_PIPELINE_WORKERS['render'],
+                       queue_size=UPLOAD_PIPELINE_QUEUE_SIZE, after=('extract',))
+    pipeline.add_stage('metrics', run_metrics, workers=UPLOAD_PIPELINE_WORKERS['metrics'],
+                       queue_size=UPLOAD_PIPELINE_QUEUE_SIZE, after=('ocr', 'extract'))
+
+    # 事前チェックで除外した画像と重複した画像は段階を通さない
+    def is_passthrough(data):
+        return data['preflight']['status'] != 'graph' or data.get('duplicate_kind') == 'duplicate'
+
+    # 今回の解析でのOCRキャッシュのヒット率を出すため、開始時点の件数を控える
+    ocr_cache_before = ocr_cache.stats()
+
+    # 処理を終えた画像をアップロード順に結果にまとめる
+    for item in pipeline.run(decode_uploads(), passthrough=is_passthrough):
+        data = item.data
+        name = data['name']
+        if data['preflight']['status'] != 'graph':
+            detail_text.text(f"⏭️ {name} をスキップ: {data['preflight']['reason']}")
+            thumbnail = encode_result_image(data['img_array'], RESULT_THUMBNAIL_WIDTH)
             analysis_results.append({
-                'name': uploaded_file.name,
-                'original_image': img_with_grid,  # グリッド付き元画像を保存
-                'cropped_image': cropped_img,
-                'overlay_image': cropped_img,  # 解析失敗時は切り抜き画像を使用
+                'name': name,
+                'original_image': thumbnail,
+                'overlay_image': thumbnail,
                 'success': False,
-                'ocr_data': ocr_data  # OCRデータを追加
+                'ocr_data': None,
+                'preflight': data['preflight'],
+                'error': data['preflight']['reason']
             })
-        
+        elif data['duplicate_kind'] == 'duplicate':
+            representative = results_by_idx.get(data['duplicate_idx'])
+            if representative is None:
+                # 代表の画像の結果がない場合（解析中のエラーなど）は複製せず失敗として扱う
+                detail_text.text(f"⚠️ {name} の重複元 {data['duplicate_name']} の結果がありません")
+                thumbnail = encode_result_image(data['img_array'], RESULT_THUMBNAIL_WIDTH)
+                analysis_results.append({
+                    'name': name,
+                    'original_image': thumbnail,
+                    'overlay_image': thumbnail,
+                    'success': False,
+                    'ocr_data': None,
+                    'preflight': data['preflight'],
+                    'error': f"重複元（{data['duplicate_name']}）の解析結果がありません"
+                })
+            else:
+                detail_text.text(f"♻️ {name} は {data['duplicate_name']} と同じ画像のため結果を複製")
+                duplicate_result = dict(representative)
+                duplicate_result['name'] = name
+                duplicate_result['duplicate_of'] = data['duplicate_name']
+                analysis_results.append(duplicate_result)
+        else:
+            ocr_data = data['ocr_data']
+            analyzer = data['analyzer']
+            if data['incremental_info']:
+                detail_text.text(f"♻️ {name} は前回の解析結果を再利用（追加 {data['incremental_info']['new_points']}点）")
+            elif data.get('ocr_seconds') is not None:
+                detail_text.text(f"✅ {name} の解析完了（OCR {data['ocr_seconds']:.1f}秒）")
+            else:
+                detail_text.text(f'✅ {name} の解析完了')
+
+            # 表示用の画像はJPEGにして保持（解析中の配列は次の画像に進むと解放される）
+            original_image = encode_result_image(data['img_with_grid'], RESULT_THUMBNAIL_WIDTH)
+            overlay_image = encode_result_image(data['overlay_img'])
+
+            if data['graph_data_points']:
+                first_hit_x = data['first_hit_x']
+                analysis_results.append({
+                    'name': name,
+                    'original_image': original_image,  # グリッド付き元画像（縮小したJPEG）
+                    'overlay_image': overlay_image,  # オーバーレイ画像（JPEG）
+                    'success': True,
+                    'max_val': int(data['max_val']),
+                    'min_val': int(data['min_val']),
+                    'current_val': int(data['current_val']),
+                    'first_hit_val': int(data['first_hit_val']) if first_hit_x is not None else None,
+                    'total_jackpot_balls': int(data['total_jackpot_balls']),  # 総獲得球数を追加
+                    'dominant_color': data['dominant_color'],
+                    'series': data['series_summary'],  # 複数系列抽出時の各系列の要約
+                    'data_points': data['graph_data_points'],  # 抽出した系列（解析結果データベースに保存）
+                    'extraction_mode': analyzer.extraction_mode,
+                    'image_digest': data['image_digest'],
+                    'confidence': analyzer.last_confidence,  # 自動モードの抽出信頼度
+                    'incremental': data['incremental_info'],  # 差分抽出の場合は再利用した点数など
+                    'ocr_data': ocr_data,  # OCRデータを追加
+                    'ocr_text': ocr_data.get('ocr_text') if ocr_data else None,  # OCRテキストを追加
+                    'correction_factor': data['correction_factor'],  # 補正係数を追加
+                    'rotation_metrics': data['rotation_metrics'],  # 回転率データを追加
+                    'scale_factor': data['scale_factor'],  # 基準幅への変換倍率
+                    'source_size': data['source_size'],
+                    'crop_rect_source': tuple(layout_to_source(data['layout'], data['scale_factor'])[k]
+                                              for k in ('top', 'bottom', 'left', 'right')),
+                    'overlay_geometry': {'zero_y': float(data['zero_line_in_crop']),
+                                         'scale': float(analyzer.scale)}  # オーバーレイの再描画用
+                })
+            else:
+                # 解析失敗時
+                analysis_results.append({
+                    'name': name,
+                    'original_image': original_image,  # グリッド付き元画像（縮小したJPEG）
+                    'overlay_image': overlay_image,  # 解析失敗時は切り抜き画像を使用
+                    'success': False,
+                    'ocr_data': ocr_data,  # OCRデータを追加
+                    'extraction_mode': analyzer.extraction_mode,
+                    'image_digest': data['image_digest'],
+                    'scale_factor': data['scale_factor'],  # 基準幅への変換倍率
+                    'source_size': data['source_size']
+                })
+
+            # 同じ台の撮影時刻違い（右側だけが伸びたグラフ）を記録
+            if data['duplicate_kind'] == 'revision':
+                analysis_results[-1]['revision_of'] = {
+                    'name': data['duplicate_name'],
+                    'newer': data['duplicate_detail'].get('newer') == 'a'
+                }
+
+        results_by_idx[data['idx']] = analysis_results[-1]
+
         # 各画像の処理完了時に進捗を更新
-        progress_end = (idx + 1) / len(uploaded_files)
-        progress_bar.progress(progress_end)
+        progress_bar.progress(min(1.0, (data['idx'] + 1) / total_uploads))
+
+    # 段階ごとの稼働率（ボトルネックの確認用）
+    st.session_state.pipeline_stats = {'wall_seconds': pipeline.wall_seconds, 'stages': pipeline.stats(),
+                                       'bottleneck': pipeline.bottleneck()}
+    ocr_cache_after = ocr_cache.stats()
+    ocr_lookups = ocr_cache_after['lookups'] - ocr_cache_before['lookups']
+    ocr_hits = (ocr_cache_after['hits'] + ocr_cache_after['disk_hits']
+                - ocr_cache_before['hits'] - ocr_cache_before['disk_hits'])
+    st.session_state.pipeline_stats['ocr_cache'] = {
+        'lookups': ocr_lookups,
+        'hits': ocr_hits,
+        'hit_rate': ocr_hits / ocr_lookups if ocr_lookups else 0.0,
+    }
+    
+    # 解析結果データベースにまとめて保存（事前チェックで除外した画像と重複した画像は記録しない）
+    history_records = []
+    for result in analysis_results:
+        if result.get('duplicate_of') or (result.get('preflight') or {}).get('status', 'graph') != 'graph':
+            continue
+        ocr = result.get('ocr_data') or {}
+        source_width, source_height = result.get('source_size', (None, None))
+        history_records.append({
+            'file_name': result['name'],
+            'image_digest': result.get('image_digest'),
+            'width': source_width,
+            'height': source_height,
+            'machine_number': ocr.get('machine_number') or machine_number_from_file_name(result['name']),
+            'hall': st.session_state.get('hall_name') or None,
+            'graph_date': graph_date_text,
+            'source': 'streamlit_app_full',
+            'success': result['success'],
+            'error': None if result['success'] else 'グラフデータを検出できませんでした',
+            'extraction_mode': result.get('extraction_mode'),
+            'color': result.get('dominant_color'),
+            'max_value': result.get('max_val'),
+            'min_value': result.get('min_val'),
+            'final_value': result.get('current_val'),
+            'first_hit_value': result.get('first_hit_val'),
+            'total_jackpot_balls': result.get('total_jackpot_balls'),
+            'correction_factor': result.get('correction_factor'),
+            'rotation_rate': (result.get('rotation_metrics') or {}).get('rotation_rate_2'),
+            'ocr': {key: value for key, value in ocr.items() if key != 'ocr_text'},
+            'data_points': result.get('data_points'),
+            'overlay': {**(result.get('overlay_geometry') or {}),
+                        'crop_rect_source': result.get('crop_rect_source'),
+                        'scale_factor': result.get('scale_factor')},
+        })
+    try:
+        results_store.record_batch(history_records)
+    except Exception as e:
+        print(f"解析結果データベースへの保存エラー: {e}")
     
     # プログレスバーを完了
     progress_bar.progress(1.0)
-    status_text.text('✅ 全ての画像の処理が完了しました！')
+    status_text.text('✅ 全ての画像の処理が完了しました！' +
+                     (f'（読み込めないファイル{len(unreadable_files)}件をスキップ）' if unreadable_files else ''))
+    if unreadable_files:
+        print(f"Warning: 読み込めないファイルをスキップ: {', '.join(unreadable_files)}")
     detail_text.empty()
     time.sleep(1.0)  # 完了メッセージを表示する時間
     
@@ -1480,6 +1848,29 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
     # 結果をグリッド表示
     st.markdown("### 📊 解析結果一覧")
 
+    # 解析の段階ごとの稼働率（最も高い段階がボトルネック）
+    pipeline_stats = st.session_state.get('pipeline_stats')
+    if pipeline_stats:
+        with st.expander(f"⏱️ 処理時間 {pipeline_stats['wall_seconds']:.1f}秒（ボトルネック: {pipeline_stats['bottleneck']}）"):
+            st.dataframe(pd.DataFrame([
+                {
+                    '段階': row['name'],
+                    'ワーカー数': row['workers'],
+                    '件数': row['items'],
+                    '稼働率': f"{row['occupancy']:.0%}",
+                    '平均処理時間(秒)': round(row['avg_seconds'], 3),
+                    'キュー待ち(秒)': round(row['queue_seconds'], 2),
+                    '他段階の待ち(秒)': round(row['wait_seconds'], 2),
+                    '後段の詰まり(秒)': round(row['blocked_seconds'], 2),
+                    '最大キュー長': row['max_queue'],
+                }
+                for row in pipeline_stats['stages']
+            ]), hide_index=True)
+            ocr_cache_stats = pipeline_stats.get('ocr_cache')
+            if ocr_cache_stats and ocr_cache_stats['lookups']:
+                st.caption(f"OCRキャッシュ: ヒット率 {ocr_cache_stats['hit_rate']:.0%}"
+                           f"（{ocr_cache_stats['hits']}/{ocr_cache_stats['lookups']}回はTesseractを呼ばずに取得）")
+
     # 解析結果を2列で表示
     cols = st.columns(2)
 
@@ -1504,6 +1895,12 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
                     else:
                         display_name = filename
             st.markdown(f"#### {idx + 1}. {display_name}")
+            if result.get('duplicate_of'):
+                st.caption(f"♻️ {result['duplicate_of']} と同じ画像のため、解析結果を共有しています")
+            if result.get('revision_of'):
+                revision = result['revision_of']
+                order = 'より新しい' if revision['newer'] else 'より古い'
+                st.caption(f"🔄 {revision['name']} と同じ台の{order}スクリーンショットです")
 
             # 解析結果画像
             st.image(result['overlay_image'], use_column_width=True)
@@ -1564,6 +1961,19 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
                 first_hit_text = f"{result['first_hit_val']:,}玉" if result['first_hit_val'] is not None else "なし"
                 first_hit_class = get_value_class(result['first_hit_val']) if result['first_hit_val'] is not None else ""
 
+                # 自動モードの信頼度の表示を準備
+                confidence_info = ""
+                if result.get('confidence'):
+                    confidence = result['confidence']
+                    rerun_text = "（高精度で再解析）" if confidence['mode'] != 'fast' else ""
+                    confidence_info = f'<div class="stat-item" style="font-size: 0.8em;"><span style="color: #666;">抽出信頼度: {confidence["score"]:.2f}{rerun_text}</span></div>'
+                
+                # 差分抽出の表示を準備
+                reuse_info = ""
+                if result.get('incremental'):
+                    incremental = result['incremental']
+                    reuse_info = f'<div class="stat-item" style="font-size: 0.8em;"><span style="color: #666;">前回の解析結果を再利用: {incremental["reused_points"]}点 + 新規 {incremental["new_points"]}点</span></div>'
+                
                 # 補正係数の表示を準備
                 correction_info = ""
                 if 'correction_factor' in result and result['correction_factor'] != 1.0:
@@ -1601,10 +2011,27 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
                         <span class="stat-value positive">{result.get('total_jackpot_balls', 0):,}玉</span>
                     </div>
                     {rotation_html}
+                    {confidence_info}
+                    {reuse_info}
                     {correction_info}
                 </div>
                 """, unsafe_allow_html=True)
 
+                # 複数系列を抽出した場合は各系列の値を表示
+                if result.get('series') and len(result['series']) > 1:
+                    st.caption(f"🌈 {len(result['series'])}系列を検出")
+                    series_df = pd.DataFrame([
+                        {
+                            '色': series['color'],
+                            'カバー率': f"{series['coverage'] * 100:.0f}%",
+                            '最高値': series['max_val'],
+                            '最低値': series['min_val'],
+                            '現在値': series['current_val'],
+                        }
+                        for series in result['series']
+                    ])
+                    st.dataframe(series_df, use_container_width=True, hide_index=True)
+
                 # OCRデータがある場合は表示（すべてNoneでも構造は表示）
                 if result.get('ocr_data') is not None:
                     ocr = result['ocr_data']
@@ -1680,7 +2107,11 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
                             st.text_area("OCR結果", result['ocr_text'], height=200, disabled=True)
 
             else:
-                st.warning("⚠️ グラフデータを検出できませんでした")
+                if result.get('preflight') and result['preflight']['status'] != 'graph':
+                    status_label = 'グラフ画面ではありません' if result['preflight']['status'] == 'non_graph' else '画像の品質が不足しています'
+                    st.warning(f"⚠️ {status_label}: {result['preflight']['reason']}")
+                else:
+                    st.warning("⚠️ グラフデータを検出できませんでした")
 
             # 区切り線（各列内で）
             if idx < len(analysis_results) - 2:
@@ -1692,6 +2123,22 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
     success_count = sum(1 for r in analysis_results if r['success'])
     st.info(f"📈 総画像数: {len(analysis_results)}枚 | ✅ 成功: {success_count}枚 | ⚠️ 失敗: {len(analysis_results) - success_count}枚")
 
+    # 同じ日・店舗でこれまでに保存した結果を含む累計（集計テーブルの1行だけを読む）
+    summary_date_text = st.session_state.get('graph_date', datetime.now().date()).strftime('%Y-%m-%d')
+    try:
+        day_totals = results_store.hall_summary(start_date=summary_date_text, end_date=summary_date_text,
+                                                hall=st.session_state.get('hall_name') or '')
+    except Exception as e:
+        print(f"集計テーブルの読み込みエラー: {e}")
+        day_totals = []
+    if day_totals:
+        day_total = day_totals[0]
+        avg_rotation = day_total['avg_rotation_rate']
+        st.caption(f"📚 {summary_date_text} の累計（{day_total['hall'] or '店舗未入力'}）: "
+                   f"{day_total['machines']}台 | 合計現在値 {day_total['final_sum']:+,}玉 | "
+                   f"合計獲得球数 {day_total['jackpot_sum']:,}玉"
+                   + (f" | 平均回転率 {avg_rotation:.1f}回/千円" if avg_rotation else ""))
+
 
     # 結果を表形式で表示
     st.markdown("### 📊 解析結果（表形式）")
@@ -1781,11 +2228,11 @@ if 'analysis_results' in st.session_state and st.session_state.analysis_results:
                     })
                 df_data.append(row)
             else:
-                # 解析失敗時も台番号の決定方法を統一
+                # 解析失敗時も台番号の決定方法を統一（事前チェックで除外した画像はOCRデータなし）
                 if st.session_state.get('skip_ocr', False):
                     machine_number = result['name']
                 else:
-                    machine_number = result.get('ocr_data', {}).get('machine_number', result['name'])
+                    machine_number = (result.get('ocr_data') or {}).get('machine_number', result['name'])
                     
                 df_data.append({
                     '台番号': machine_number,
@@ -2028,31 +2475,14 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
     
     # 設定値の初期化
     if test_image:
-        # 画像を読み込み
-        img_array = np.array(Image.open(test_image).convert('RGB'))
+        # 画像を読み込み（検出の中間結果はキャッシュから取得）
+        img_array, orange_bottom, row_scores, scale_factor = load_detection_base_for(test_image)
         height, width = img_array.shape[:2]
         
-        # オレンジバーを検出
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
-        orange_mask = cv2.inRange(hsv, np.array([10, 100, 100]), np.array([30, 255, 255]))
-        orange_bottom = 0
-        
-        for y in range(height//2):
-            if np.sum(orange_mask[y, :]) > width * 0.3 * 255:
-                orange_bottom = y
-        
-        if orange_bottom > 0:
-            for y in range(orange_bottom, min(orange_bottom + 100, height)):
-                if np.sum(orange_mask[y, :]) < width * 0.1 * 255:
-                    orange_bottom = y
-                    break
+        if scale_factor != 1.0:
+            st.info(f"画像サイズ: {int(round(width / scale_factor))}x{int(round(height / scale_factor))}px → 基準幅に変換: {width}x{height}px（x{scale_factor:.3f}）")
         else:
-            orange_bottom = 150
-        
-        # グレースケール変換
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-        
-        st.info(f"画像サイズ: {width}x{height}px")
+            st.info(f"画像サイズ: {width}x{height}px")
         
         # レイアウト用のメインカラム（画像を読み込んだ後）
         main_col1, main_col2 = st.columns([3, 2])
@@ -2138,10 +2568,6 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
                 st.markdown("### 🎯 STEP 4: 実際の最大値を入力して自動調整")
                 st.caption(f"アップロードされた{len(test_images)}枚の画像から最適な設定を自動計算します")
                 
-                # 複数画像の解析結果を保存
-                all_detections = []
-                all_max_positions = []
-                
                 # 現在の設定を取得（入力フィールドの値を使用）
                 current_settings_align = {
                     'search_start_offset': search_start_offset,
@@ -2154,100 +2580,20 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
                     'grid_minus_30k_offset': grid_minus_30k_offset
                 }
                 
-                # 各画像を解析
-                for img_idx, test_img in enumerate(test_images):
-                    # 画像を読み込み
-                    img_array_tmp = np.array(Image.open(test_img).convert('RGB'))
-                    height_tmp, width_tmp = img_array_tmp.shape[:2]
-                    
-                    # オレンジバーを検出
-                    hsv_tmp = cv2.cvtColor(img_array_tmp, cv2.COLOR_RGB2HSV)
-                    orange_mask_tmp = cv2.inRange(hsv_tmp, np.array([10, 100, 100]), np.array([30, 255, 255]))
-                    orange_bottom_tmp = 0
-                    
-                    for y in range(height_tmp//2):
-                        if np.sum(orange_mask_tmp[y, :]) > width_tmp * 0.3 * 255:
-                            orange_bottom_tmp = y
-                    
-                    if orange_bottom_tmp > 0:
-                        for y in range(orange_bottom_tmp, min(orange_bottom_tmp + 100, height_tmp)):
-                            if np.sum(orange_mask_tmp[y, :]) < width_tmp * 0.1 * 255:
-                                orange_bottom_tmp = y
-                                break
-                    else:
-                        orange_bottom_tmp = 150
-                    
-                    # グレースケール変換
-                    gray_tmp = cv2.cvtColor(img_array_tmp, cv2.COLOR_RGB2GRAY)
-                    
-                    # 現在の画像で解析を実行
-                    analyzer_align = WebCompatibleAnalyzer()
-                    
-                    # ゼロライン検出（最大値アライメント用）
-                    align_search_start = orange_bottom_tmp + search_start_offset
-                    align_search_end = min(height_tmp - 100, orange_bottom_tmp + search_end_offset)
-                    
-                    # ゼロライン検出
-                    align_best_score = 0
-                    align_zero_line_y = (align_search_start + align_search_end) // 2
-                    
-                    for y in range(align_search_start, align_search_end):
-                        row = gray_tmp[y, 100:width_tmp-100]
-                        darkness = 1.0 - (np.mean(row) / 255.0)
-                        uniformity = 1.0 - (np.std(row) / 128.0)
-                        score = darkness * 0.5 + uniformity * 0.5
-                        
-                        if score > align_best_score:
-                            align_best_score = score
-                            align_zero_line_y = y
-                    
-                    # 切り抜き
-                    align_top = max(0, align_zero_line_y - crop_top)
-                    align_bottom = min(height_tmp, align_zero_line_y + crop_bottom)
-                    align_left = left_margin
-                    align_right = width_tmp - right_margin
-                    
-                    # グリッドライン調整値も適用（現在の入力値を使用）
-                    align_zero_in_crop = align_zero_line_y - align_top
-                    align_distance_to_plus_30k = align_zero_in_crop - grid_30k_offset
-                    align_distance_to_minus_30k = (align_bottom - align_top - 1 + grid_minus_30k_offset) - align_zero_in_crop
-                    
-                    # カスタム設定で解析
-                    analyzer_align.zero_y = align_zero_in_crop
-                    analyzer_align.scale = 30000 / align_distance_to_plus_30k if align_distance_to_plus_30k > 0 else 122
-                    
-                    # 切り抜き画像で解析
-                    cropped_for_align = img_array_tmp[int(align_top):int(align_bottom), int(align_left):int(align_right)]
-                    # BGRに変換（OpenCVの標準形式）
-                    cropped_bgr_align = cv2.cvtColor(cropped_for_align, cv2.COLOR_RGB2BGR)
-                    
-                    # 解析実行（画像データを直接渡す）
-                    data_points_align, color_align, detected_zero_align = analyzer_align.extract_graph_data(cropped_bgr_align)
-                    
-                    if data_points_align:
-                        analysis_align = analyzer_align.analyze_values(data_points_align)
-                        detected_max_align = analysis_align['max_value']
-                        
-                        # 最大値の位置を取得
-                        max_index = analysis_align['max_index']
-                        if max_index < len(data_points_align):
-                            max_x, max_y_value = data_points_align[max_index]
-                            # 画像座標系での最大値のY座標
-                            max_y_pixel = int(align_zero_in_crop - (max_y_value / analyzer_align.scale))
-                            
-                            all_detections.append({
-                                'detected_max': detected_max_align,
-                                'max_y_pixel': max_y_pixel,
-                                'zero_in_crop': align_zero_in_crop,
-                                'crop_height': cropped_for_align.shape[0],
-                                'image_name': test_img.name
-                            })
-                            
-                            all_max_positions.append({
-                                'x': int(max_x),
-                                'y': max_y_pixel,
-                                'value': max_y_value
-                            })
+                # 各画像を計測（グリッド調整値に依存しないため、調整値の変更では再計測しない）
+                all_detections = []
+                for test_img in test_images:
+                    img_bytes = test_img.getvalue()
+                    sample = measure_calibration_sample_cached(
+                        hashlib.md5(img_bytes).hexdigest(), img_bytes, test_img.name,
+                        detection_settings_key(current_settings_align),
+                        st.session_state.settings.get('reference_width')
+                    )
+                    if sample is not None:
+                        detection = dict(sample)
+                        # 現在の調整値で解析した場合の最大値
+                        detection['detected_max'] = predict_max(sample, grid_30k_offset, grid_minus_30k_offset)
+                        all_detections.append(detection)
                 
                 if all_detections:
                     # 統計情報を計算
@@ -2331,59 +2677,52 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
                         visual_max_values.append(visual_max)
                     
                     if any(v > 0 for v in visual_max_values):
-                        # 各画像での補正率を計算
-                        corrections = []
-                        for i, (detection, visual_max) in enumerate(zip(all_detections, visual_max_values)):
-                            if detection['detected_max'] > 0 and visual_max > 0:
-                                correction_factor = visual_max / detection['detected_max']
-                                actual_distance = detection['zero_in_crop'] - detection['max_y_pixel']
-                                if actual_distance > 0:
-                                    new_scale = visual_max / actual_distance
-                                    
-                                    # 新しい+30000ラインの位置を計算
-                                    new_30k_distance = 30000 / new_scale
-                                    current_30k_distance = detection['zero_in_crop'] - current_settings_align['grid_30k_offset']
-                                    adjustment_30k = int(current_30k_distance - new_30k_distance)
-                                    
-                                    # 新しい-30000ラインの位置を計算
-                                    new_minus_30k_distance = 30000 / new_scale
-                                    current_minus_30k_distance = (detection['crop_height'] - 1 + current_settings_align['grid_minus_30k_offset']) - detection['zero_in_crop']
-                                    adjustment_minus_30k = int(new_minus_30k_distance - current_minus_30k_distance)
-                                    
-                                    corrections.append({
-                                        'adjustment_30k': adjustment_30k,
-                                        'adjustment_minus_30k': adjustment_minus_30k,
-                                        'correction_factor': correction_factor
-                                    })
+                        # 全画像をまとめて最小二乗法で調整値と補正係数を計算
+                        solution = solve_calibration(all_detections, visual_max_values, current_settings_align)
                         
-                        if corrections:
-                            # 平均調整値を計算
-                            avg_adjustment_30k = int(np.mean([c['adjustment_30k'] for c in corrections]))
-                            avg_adjustment_minus_30k = int(np.mean([c['adjustment_minus_30k'] for c in corrections]))
-                            avg_correction_factor = np.mean([c['correction_factor'] for c in corrections])
+                        if solution:
+                            # セッションステートに保存（STEP 5でプリセットに保存される）
+                            st.session_state.avg_correction_factor = solution['correction_factor']
                             
-                            # セッションステートに保存
-                            st.session_state.avg_correction_factor = avg_correction_factor
+                            offsets_changed = (solution['grid_30k_offset'] != grid_30k_offset or
+                                               solution['grid_minus_30k_offset'] != grid_minus_30k_offset)
                             
-                            if abs(avg_correction_factor - 1.0) > 0.001:
+                            if offsets_changed or abs(solution['correction_factor'] - 1.0) > 0.001:
                                 # 推奨調整値を表示
-                                st.info(f"平均補正率: **{avg_correction_factor:.2f}x** （{len(corrections)}枚の画像から計算）")
+                                st.info(f"補正率: **{solution['correction_factor']:.2f}x** （{solution['samples_used']}枚の画像から計算 / 誤差 RMS {solution['rms_error']:,.0f}玉）")
                                 
                                 col_adj1, col_adj2 = st.columns(2)
                                 with col_adj1:
-                                    st.info(f"**+30,000ライン:** {grid_30k_offset}px → {grid_30k_offset + avg_adjustment_30k}px (調整: {avg_adjustment_30k:+d}px)")
+                                    st.info(f"**+30,000ライン:** {grid_30k_offset}px → {solution['grid_30k_offset']}px (調整: {solution['grid_30k_offset'] - grid_30k_offset:+d}px)")
                                 with col_adj2:
-                                    st.info(f"**-30,000ライン:** {grid_minus_30k_offset}px → {grid_minus_30k_offset + avg_adjustment_minus_30k}px (調整: {avg_adjustment_minus_30k:+d}px)")
+                                    st.info(f"**-30,000ライン:** {grid_minus_30k_offset}px → {solution['grid_minus_30k_offset']}px (調整: {solution['grid_minus_30k_offset'] - grid_minus_30k_offset:+d}px)")
+                                
+                                # 画像ごとの予測値
+                                if len(solution['per_image']) > 1:
+                                    with st.expander("📋 画像ごとの予測値"):
+                                        st.dataframe(pd.DataFrame([
+                                            {
+                                                '画像': row['image_name'],
+                                                '実際の値': f"{row['actual']:,}玉",
+                                                '調整後の予測': f"{row['predicted']:,}玉",
+                                                '差': f"{row['predicted'] - row['actual']:+,}玉",
+                                            }
+                                            for row in solution['per_image']
+                                        ]), use_container_width=True, hide_index=True)
                                 
                                 # 自動適用ボタン
                                 if st.button("🔧 推奨値を自動適用", type="secondary", key="apply_max_alignment"):
-                                    # セッションステートに新しい値を設定（現在の入力値に調整を加える）
-                                    st.session_state.settings['grid_30k_offset'] = grid_30k_offset + avg_adjustment_30k
-                                    st.session_state.settings['grid_minus_30k_offset'] = grid_minus_30k_offset + avg_adjustment_minus_30k
+                                    # セッションステートに新しい値を設定
+                                    st.session_state.settings['grid_30k_offset'] = solution['grid_30k_offset']
+                                    st.session_state.settings['grid_minus_30k_offset'] = solution['grid_minus_30k_offset']
                                     
                                     # 最初の画像の最大値位置を保存（非線形スケール用）
-                                    if all_max_positions:
-                                        st.session_state['max_value_position'] = all_max_positions[0]
+                                    first = all_detections[0]
+                                    st.session_state['max_value_position'] = {
+                                        'x': first['max_x'],
+                                        'y': int(first['max_y_pixel']),
+                                        'value': first['detected_max']
+                                    }
                                     
                                     st.success("✅ 推奨値を適用しました！画面が更新されます...")
                                     time.sleep(1)
@@ -2408,53 +2747,27 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
             selected_image = test_image
             selected_image_idx = 0
         
-        # 選択された画像を読み込み
-        img_array_preview = np.array(Image.open(selected_image).convert('RGB'))
-        height_preview, width_preview = img_array_preview.shape[:2]
-        
-        # オレンジバーを検出（選択された画像用）
-        hsv_preview = cv2.cvtColor(img_array_preview, cv2.COLOR_RGB2HSV)
-        orange_mask_preview = cv2.inRange(hsv_preview, np.array([10, 100, 100]), np.array([30, 255, 255]))
-        orange_bottom_preview = 0
-        
-        for y in range(height_preview//2):
-            if np.sum(orange_mask_preview[y, :]) > width_preview * 0.3 * 255:
-                orange_bottom_preview = y
-        
-        if orange_bottom_preview > 0:
-            for y in range(orange_bottom_preview, min(orange_bottom_preview + 100, height_preview)):
-                if np.sum(orange_mask_preview[y, :]) < width_preview * 0.1 * 255:
-                    orange_bottom_preview = y
-                    break
-        else:
-            orange_bottom_preview = 150
-        
-        # グレースケール変換
-        gray_preview = cv2.cvtColor(img_array_preview, cv2.COLOR_RGB2GRAY)
-        
-        # 現在の設定で切り抜き処理を実行
-        search_start = orange_bottom_preview + search_start_offset
-        search_end = min(height_preview - 100, orange_bottom_preview + search_end_offset)
-        
-        # ゼロライン検出
-        best_score = 0
-        zero_line_y = (search_start + search_end) // 2
+        # 現在の入力値（グリッド調整値は切り抜き範囲に影響しない）
+        current_settings_preview = {
+            'search_start_offset': search_start_offset,
+            'search_end_offset': search_end_offset,
+            'crop_top': crop_top,
+            'crop_bottom': crop_bottom,
+            'left_margin': left_margin,
+            'right_margin': right_margin
+        }
         
-        for y in range(search_start, search_end):
-            row = gray_preview[y, 100:width_preview-100]
-            darkness = 1.0 - (np.mean(row) / 255.0)
-            uniformity = 1.0 - (np.std(row) / 128.0)
-            score = darkness * 0.5 + uniformity * 0.5
-            
-            if score > best_score:
-                best_score = score
-                zero_line_y = y
+        # 選択された画像を読み込み（検出の中間結果はキャッシュから取得）
+        img_array_preview, orange_bottom_preview, row_scores_preview, _ = load_detection_base_for(selected_image)
+        height_preview, width_preview = img_array_preview.shape[:2]
         
-        # 切り抜き
-        top = max(0, zero_line_y - crop_top)
-        bottom = min(height_preview, zero_line_y + crop_bottom)
-        left = left_margin
-        right = width_preview - right_margin
+        # 現在の設定でゼロライン検出と切り抜き範囲の計算（キャッシュ済みの行スコアを再スライスするだけ）
+        preview_layout = detect_graph_layout(img_array_preview, current_settings_preview,
+                                             row_scores=row_scores_preview, orange_bottom=orange_bottom_preview)
+        search_start, search_end = preview_layout['search_start'], preview_layout['search_end']
+        zero_line_y, best_score = preview_layout['zero_line_y'], preview_layout['best_score']
+        top, bottom = preview_layout['top'], preview_layout['bottom']
+        left, right = preview_layout['left'], preview_layout['right']
         
         # オーバーレイ画像を作成
         overlay_img = img_array_preview.copy()
@@ -2623,7 +2936,7 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
             st.image(cropped_preview, use_column_width=True)
             
             # 情報表示
-            st.caption(f"🔍 検出情報: オレンジバー位置 Y={orange_bottom}, ゼロライン Y={zero_line_y}, 検索範囲 Y={search_start}〜{search_end}")
+            st.caption(f"🔍 検出情報: オレンジバー位置 Y={orange_bottom_preview}, ゼロライン Y={zero_line_y}, 検索範囲 Y={search_start}〜{search_end}")
             st.caption(f"✂️ 切り抜き範囲: 上{crop_top}px, 下{crop_bottom}px, 左{left_margin}px, 右{right_margin}px")
         
     # 設定の保存とプリセット削除を同じ配置で表示（順序を入れ替え）
@@ -2641,7 +2954,9 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
                 'left_margin': left_margin,
                 'right_margin': right_margin,
                 'grid_30k_offset': grid_30k_offset,
-                'grid_minus_30k_offset': grid_minus_30k_offset
+                'grid_minus_30k_offset': grid_minus_30k_offset,
+                # 調整画面で表示していた画像の基準幅（ピクセル値はこの幅に対する値）
+                'reference_width': st.session_state.settings.get('reference_width')
             }
             return settings
     else:
@@ -2802,6 +3117,110 @@ with st.expander("⚙️ 画像解析の調整設定", expanded=st.session_state
                             st.success(f"✅ プリセット '{preset_to_delete}' を削除しました")
                             st.rerun()
 
+# 解析履歴（解析結果データベースから集計）
+with st.expander("📚 解析履歴（台・日付ごとの推移）", expanded=False):
+    st.caption("これまでに解析した結果を台番号・日付・店舗ごとに集計します。過去の画像を再解析する必要はありません。")
+    history_columns = {
+        'graph_date': '日付',
+        'machine_number': '台番号',
+        'hall': '店舗',
+        'screenshots': '解析枚数',
+        'max_value': '最高値',
+        'min_value': '最低値',
+        'final_value': '現在値',
+        'first_hit_value': '初当たり',
+        'total_jackpot_balls': '総獲得球数',
+        'rotation_rate': '回転率',
+        'period': '期間',
+        'analyses': '解析枚数',
+        'successes': '成功',
+        'machines': '台数',
+        'final_sum': '合計現在値',
+        'jackpot_sum': '合計獲得球数',
+        'avg_rotation_rate': '平均回転率',
+    }
+    
+    try:
+        halls = results_store.halls()
+        hall_options = ['すべての店舗'] + halls
+        history_hall = st.selectbox("🏢 店舗", hall_options, index=0, key="history_hall")
+        history_hall = None if history_hall == 'すべての店舗' else history_hall
+        
+        history_view = st.radio("表示", ["台ごとの推移", "日ごとの一覧", "店舗の集計"], horizontal=True,
+                                key="history_view")
+        
+        if history_view == "台ごとの推移":
+            machines = results_store.machines(hall=history_hall)
+            if not machines:
+                st.info("台番号が記録された解析結果はまだありません（OCRで台番号を読み取るか、ファイル名に「○番台」を含めてください）")
+            else:
+                machine_labels = {f"{m['machine_number']}番台（{m['days']}日分、最終 {m['last_date']}）": m['machine_number']
+                                  for m in machines}
+                col_hist_a, col_hist_b = st.columns([2, 1])
+                with col_hist_a:
+                    machine_label = st.selectbox("🔢 台番号", list(machine_labels.keys()), key="history_machine")
+                with col_hist_b:
+                    history_days = st.selectbox("期間", [7, 30, 90, 365], index=0, key="history_days",
+                                                format_func=lambda days: f"直近{days}日")
+                start_date = (datetime.now() - pd.Timedelta(days=history_days - 1)).strftime('%Y-%m-%d')
+                
+                query_start = time.perf_counter()
+                trend = results_store.machine_trend(machine_labels[machine_label], start_date=start_date,
+                                                    hall=history_hall)
+                query_ms = (time.perf_counter() - query_start) * 1000
+                
+                if not trend:
+                    st.info("指定した期間の解析結果はありません")
+                else:
+                    trend_df = pd.DataFrame(trend)
+                    st.line_chart(trend_df.set_index('graph_date')[['max_value', 'final_value']].rename(
+                        columns={'max_value': '最高値', 'final_value': '現在値'}))
+                    st.dataframe(trend_df.drop(columns=['analysis_id']).rename(columns=history_columns),
+                                 use_container_width=True, hide_index=True)
+                    st.caption(f"集計時間: {query_ms:.1f}ms")
+                    
+                    # 選択した日のグラフ（保存済みの系列）
+                    series_date = st.selectbox("📈 グラフを表示する日付", [row['graph_date'] for row in reversed(trend)],
+                                               key="history_series_date")
+                    series_row = next(row for row in trend if row['graph_date'] == series_date)
+                    series_points = results_store.load_series(series_row['analysis_id'])
+                    if series_points:
+                        st.line_chart(pd.DataFrame(series_points, columns=['x', '値']).set_index('x'))
+        elif history_view == "日ごとの一覧":
+            summary_date = st.date_input("📅 日付", value=datetime.now().date(), key="history_summary_date")
+            query_start = time.perf_counter()
+            summary = results_store.daily_summary(summary_date.strftime('%Y-%m-%d'), hall=history_hall)
+            query_ms = (time.perf_counter() - query_start) * 1000
+            if not summary:
+                st.info("指定した日付の解析結果はありません")
+            else:
+                summary_df = pd.DataFrame(summary).drop(columns=['analysis_id'])
+                st.dataframe(summary_df.rename(columns=history_columns), use_container_width=True, hide_index=True)
+                st.caption(f"{len(summary)}台 | 合計現在値: {int(summary_df['final_value'].fillna(0).sum()):,}玉 | "
+                           f"集計時間: {query_ms:.1f}ms")
+        else:
+            # 店舗・日付ごとの集計テーブルから取得（画像の枚数に関係なく期間の日数分の行）
+            col_hall_a, col_hall_b = st.columns([2, 1])
+            with col_hall_a:
+                hall_days = st.selectbox("期間", [7, 30, 90, 365], index=1, key="history_hall_days",
+                                         format_func=lambda days: f"直近{days}日")
+            with col_hall_b:
+                hall_weekly = st.radio("単位", ["日", "週"], horizontal=True, key="history_hall_unit") == "週"
+            start_date = (datetime.now() - pd.Timedelta(days=hall_days - 1)).strftime('%Y-%m-%d')
+            query_start = time.perf_counter()
+            hall_rows = results_store.hall_summary(start_date=start_date, hall=history_hall, weekly=hall_weekly)
+            query_ms = (time.perf_counter() - query_start) * 1000
+            if not hall_rows:
+                st.info("指定した期間の解析結果はありません")
+            else:
+                hall_df = pd.DataFrame(hall_rows)
+                hall_df['hall'] = hall_df['hall'].fillna('（未入力）')
+                st.line_chart(hall_df.pivot_table(index='period', columns='hall', values='final_sum', aggfunc='sum'))
+                st.dataframe(hall_df.rename(columns=history_columns), use_container_width=True, hide_index=True)
+                st.caption(f"集計時間: {query_ms:.1f}ms")
+    except Exception as e:
+        st.error(f"解析履歴を読み込めませんでした: {e}")
+
 # フッター
 st.markdown("---")
 
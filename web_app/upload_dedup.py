@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+アップロード画像の重複判定
+グラフ領域と台番号（オレンジバー）の知覚ハッシュで、同じスクリーンショットの重複を見つける
+
+判定結果:
+    'duplicate' : 同じ台の同じグラフ（再圧縮・リサイズ・数ピクセルのスクロール違いを含む）
+    'revision'  : 同じ台・同じ日のグラフで、片方が後から撮影されたもの（右側にだけ差がある）
+    None        : 別の画像
+
+重複した画像は代表の1枚だけを解析し、結果を複製する。
+事前チェック（preflight_check）で求めたオレンジバーとゼロラインの位置を使うため、追加の検出処理は行わない。
+"""
+
+import cv2
+import numpy as np
+
+from graph_detection import ORANGE_LOWER, ORANGE_UPPER, CANONICAL_WIDTH
+
+# グラフ領域を縦に分割する本数（時間帯ごとの比較単位）
+DEDUP_STRIPS = 8
+
+# 1本の短冊のハッシュサイズ（幅×高さ、ビット数 = 192）
+DEDUP_STRIP_GRID = (6, 32)
+
+# 同じグラフとみなす短冊ごとの最大距離（strip_distance、1セルのずれは数えない）
+# 再圧縮（JPEG品質60以上）・リサイズ（0.8〜1.25倍）・スクロールで3以下、別のグラフは中央値29
+DEDUP_STRIP_THRESHOLD = 4
+
+# 更新版とみなすのに必要な一致した短冊の本数
+DEDUP_MIN_PREFIX_STRIPS = 2
+
+# ライン色とみなす彩度（背景・グリッド・文字は無彩色）
+# 縮小画像ではラインの彩度が下がり、LINEで転送されたJPEGでは20〜130に散らばるため低めにする
+DEDUP_LINE_SATURATION = 50
+
+# オレンジバーを探す範囲（バー下端から上方向、基準幅でのピクセル数）
+DEDUP_BAR_SEARCH_HEIGHT = 150
+
+# 台番号領域のサイズ（幅×高さ）と、同じ台とみなす最大差
+# 3x3平均した差の最大値: 同じ台は34以下（リサイズを含む）、1桁違いの台は63以上
+DEDUP_MACHINE_GRID = (160, 16)
+DEDUP_MACHINE_THRESHOLD = 48
+
+# ラインの右端が伸びたとみなす差（グラフ幅に対する割合）
+DEDUP_MIN_EXTENT_GAIN = 0.02
+
+
+def _machine_signature(img, orange_bottom, ratio, hsv_code):
+    """オレンジバー（台番号の白文字）を固定サイズに縮小した彩度画像"""
+    band_top = max(0, orange_bottom - int(DEDUP_BAR_SEARCH_HEIGHT * ratio))
+    band = cv2.cvtColor(img[band_top:orange_bottom], hsv_code)
+    if band.size == 0:
+        return None
+
+    orange = cv2.inRange(band, ORANGE_LOWER, ORANGE_UPPER)
+    rows = np.flatnonzero(orange.mean(axis=1) > 255 * 0.3)
+    if len(rows) == 0:
+        return None
+    bar = band[rows[0]:rows[-1] + 1]
+    columns = np.flatnonzero(cv2.inRange(bar, ORANGE_LOWER, ORANGE_UPPER).mean(axis=0) > 255 * 0.5)
+    if len(columns) == 0:
+        return None
+    bar = bar[:, columns[0]:columns[-1] + 1]
+
+    # 角の丸みとバーの縁を除く
+    bar_height, bar_width = bar.shape[:2]
+    bar = bar[bar_height // 8:bar_height - bar_height // 8, bar_width // 30:bar_width - bar_width // 30]
+    if bar.size == 0:
+        return None
+
+    # 白文字は彩度が低く、オレンジの背景は高いため彩度だけで文字の形が残る
+    return cv2.resize(bar[:, :, 1], DEDUP_MACHINE_GRID, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def upload_fingerprint(img, preflight, small, bgr=False, settings=None):
+    """画像の重複判定用の指紋を作成
+
+    Args:
+        img: 読み込み済みの画像
+        preflight: preflight_check の結果（status が 'graph' のもの）
+        small: preflight_check に渡した縮小画像
+        bgr: BGR画像の場合True
+        settings: 検出設定（crop_top / crop_bottom / left_margin / right_margin）
+
+    Returns:
+        dict: machine（台番号領域）、strips（短冊ごとのハッシュ）、line_extent（ラインの右端の位置 0〜1）
+              事前チェックを通過していない画像はNone
+    """
+    if not preflight or preflight.get('status') != 'graph':
+        return None
+    settings = settings or {}
+
+    img = img[..., :3]
+    height, width = img.shape[:2]
+    ratio = width / CANONICAL_WIDTH
+    reduction = height / small.shape[0]
+    hsv_code = cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV
+
+    machine = _machine_signature(img, preflight['orange_bottom'], ratio, hsv_code)
+
+    # グラフ領域のライン（有彩色のピクセル）を縮小画像で求める
+    zero_line_y = preflight['zero_line_y'] / reduction
+    scale = ratio / reduction
+    top = max(0, int(zero_line_y - settings.get('crop_top', 246) * scale))
+    bottom = int(zero_line_y + settings.get('crop_bottom', 280) * scale)
+    left = int(settings.get('left_margin', 120) * scale)
+    right = small.shape[1] - int(settings.get('right_margin', 120) * scale)
+    saturation = cv2.cvtColor(small[top:bottom, left:right, :3], hsv_code)[:, :, 1]
+    line = saturation >= DEDUP_LINE_SATURATION
+    if line.shape[0] == 0 or line.shape[1] < DEDUP_STRIPS:
+        return None
+
+    # 短冊ごとに面積平均で縮小し、1ピクセルでもラインがあるセルを1とする
+    strips = [cv2.resize(strip.astype(np.float32), DEDUP_STRIP_GRID, interpolation=cv2.INTER_AREA) > 0
+              for strip in np.array_split(line, DEDUP_STRIPS, axis=1)]
+
+    line_columns = np.flatnonzero(line.any(axis=0))
+    line_extent = (line_columns[-1] + 1) / line.shape[1] if len(line_columns) else 0.0
+
+    return {
+        'machine': machine,
+        'strips': strips,
+        'line_extent': float(line_extent),
+    }
+
+
+def strip_distance(a, b):
+    """短冊のハッシュの距離（相手の同じセルと隣のセルのどれにもラインがないセルの数）
+
+    再圧縮やリサイズでラインが隣のセルにずれても距離に数えない。
+    """
+    a_near = cv2.dilate(a.astype(np.uint8), np.ones((3, 3), np.uint8)) > 0
+    b_near = cv2.dilate(b.astype(np.uint8), np.ones((3, 3), np.uint8)) > 0
+    return int(np.count_nonzero(a & ~b_near)) + int(np.count_nonzero(b & ~a_near))
+
+
+def machine_distance(a, b):
+    """台番号領域の差（3x3平均した差の最大値、数字1文字の違いを見逃さないよう局所的な差で比較）"""
+    if a is None or b is None:
+        return None
+    diff = cv2.blur(np.abs(a - b).astype(np.float32), (3, 3))
+    return float(diff.max())
+
+
+def compare_fingerprints(a, b):
+    """2枚の画像の指紋を比較
+
+    Returns:
+        tuple: (判定, 詳細)
+            判定は 'duplicate' / 'revision' / None
+            詳細は machine_distance、strip_distances、newer（'revision' の場合に新しい方 'a' / 'b'）
+    """
+    if a is None or b is None:
+        return None, {}
+
+    distance = machine_distance(a['machine'], b['machine'])
+    strip_distances = [strip_distance(x, y) for x, y in zip(a['strips'], b['strips'])]
+    detail = {'machine_distance': distance, 'strip_distances': strip_distances}
+
+    # 台番号が読めない画像は別の台とみなす（誤って結果を複製しない）
+    if distance is None or distance > DEDUP_MACHINE_THRESHOLD:
+        return None, detail
+
+    # ラインの右端が同じ位置で、すべての短冊が一致すれば同じ画像
+    gain = a['line_extent'] - b['line_extent']
+    if abs(gain) < DEDUP_MIN_EXTENT_GAIN:
+        if all(d <= DEDUP_STRIP_THRESHOLD for d in strip_distances):
+            return 'duplicate', detail
+        return None, detail
+
+    # 古い方のラインの終わりより前の短冊がすべて一致し、新しい方だけ右に伸びていれば更新版
+    older = b if gain > 0 else a
+    complete_strips = int(older['line_extent'] * DEDUP_STRIPS)
+    if complete_strips < DEDUP_MIN_PREFIX_STRIPS:
+        return None, detail
+    if all(d <= DEDUP_STRIP_THRESHOLD for d in strip_distances[:complete_strips]):
+        detail['newer'] = 'a' if gain > 0 else 'b'
+        return 'revision', detail
+
+    return None, detail
+
+
+def find_duplicate(fingerprint, known):
+    """解析済みの画像から重複・更新版を探す
+
+    Args:
+        fingerprint: 新しい画像の指紋
+        known: [(キー, 指紋), ...]（解析済みの画像、キーは名前やアップロード順の番号など）
+
+    Returns:
+        tuple: (判定, キー, 詳細)（見つからない場合は (None, None, {})）
+    """
+    revision = (None, None, {})
+    for key, other in known:
+        kind, detail = compare_fingerprints(fingerprint, other)
+        if kind == 'duplicate':
+            return kind, key, detail
+        if kind == 'revision' and revision[0] is None:
+            revision = (kind, key, detail)
+    return revision
@@ -24,6 +24,12 @@ import re
 import matplotlib.font_manager as fm
 import platform
 
+from color_lut import load_color_lut, classify_pixels, class_mask, column_class_stats, classes_by_columns
+from graph_detection import (normalize_resolution, reduce_image,
+                             detect_orange_bottom_multires, find_zero_line_multires)
+from preflight import preflight_check
+from paged_report import write_paged_report
+
 # 日本語フォント設定
 if platform.system() == 'Darwin':  # macOS
     plt.rcParams['font.family'] = 'Hiragino Sans GB'
@@ -34,6 +40,10 @@ else:
 # 日本語が正しく表示されるようにfallbackも設定
 plt.rcParams['font.sans-serif'] = ['Hiragino Sans GB', 'Arial Unicode MS', 'Noto Sans CJK JP', 'DejaVu Sans']
 
+# 解析の定数（ゼロラインの探索範囲・上下250ピクセルの切り抜き・左右の余白・120玉/ピクセル）を合わせた画像の幅
+# （LINEで転送されたJPEGの幅）。Streamlit版の基準幅（CANONICAL_WIDTH）とは別で、これに合わせて拡大縮小する
+ANALYZER_REFERENCE_WIDTH = 869
+
 class WebCompatibleAnalyzer:
     """Web環境対応の解析クラス"""
     
@@ -65,7 +75,52 @@ class WebCompatibleAnalyzer:
         # 非線形スケール用の設定
         self.use_nonlinear_scale = False
         self.scale_points = None  # [(y_position, value), ...]
-    
+
+        # 抽出モード
+        # 'fast': 2ピクセルステップ・マスク行の平均（従来のproduction版）
+        # 'subpixel': 全カラム・サブピクセル重心＋極値付近のガウシアン補正
+        # 'trace': 全カラム・直前の位置付近の帯だけを探索するライン追跡
+        # 'cascade': 高速モードで抽出し、信頼度が低い画像だけ高精度モードで再抽出
+        self.extraction_mode = 'fast'
+
+        # 信頼度カスケードの設定（再抽出するしきい値と再抽出に使うモード）
+        self.cascade_threshold = 0.95
+        self.cascade_precise_mode = 'subpixel'
+        self.last_confidence = None
+
+        # ライン追跡の設定（探索帯の幅、ジャンプ1ピクセルあたりのコスト、一致の強さの重み）
+        self.trace_band = 12
+        self.trace_jump_cost = 2.0
+        self.trace_match_weight = 3.0
+
+        # 抽出後の平滑化（None / 'hampel' / 'median' / 'adaptive'）
+        self.smoothing = None
+
+        # 複数系列抽出で系列とみなすカラムの割合（文字やマーカーの色を除外）
+        self.series_min_coverage = 0.2
+        # 採用済みの系列とピクセルを共有する割合がこれを超える色は、同じラインとして除外（色範囲の重なり）
+        self.series_max_shared = 0.5
+
+        # 差分抽出の設定（前回の系列と照合するカラム数、一致とみなす差のピクセル数、
+        # 横方向の位置合わせの範囲、前回の系列を再利用するのに必要な一致率）
+        self.incremental_probes = 16
+        self.incremental_tolerance = 3
+        self.incremental_max_shift = 4
+        self.incremental_min_match = 0.9
+        # 前回の系列の末尾で、全て一致する必要があるカラム数と一致とみなす差のピクセル数
+        self.incremental_tail_columns = 4
+        self.incremental_tail_tolerance = 1
+        # 直近の抽出の状態（平滑化前の系列、差分抽出の前回の状態として保存する）
+        self.last_extraction = None
+
+        # Y座標→値の変換テーブル（build_value_lutでキャッシュ）
+        self._value_lut_key = None
+        self._value_lut = None
+
+        # 入力画像を拡大縮小する基準幅（Noneの場合は元のサイズのまま）と直近の変換倍率
+        self.reference_width = ANALYZER_REFERENCE_WIDTH
+        self.scale_factor = 1.0
+
     def set_nonlinear_scale(self, scale_points):
         """非線形スケールを設定
         scale_points: [(y_position, value), ...] の形式で、各グリッドラインの位置と値のペア
@@ -109,7 +164,57 @@ class WebCompatibleAnalyzer:
         
         # フォールバック
         return (self.zero_y - y_pixel) * self.scale
-    
+
+    def _nonlinear_values(self, rows):
+        """非線形スケールの区間補間・外挿を行単位でまとめて計算"""
+        points = [p for p in self.scale_points if p is not None]
+        ys = np.array([p[0] for p in points], dtype=np.float64)
+        vals = np.array([p[1] for p in points], dtype=np.float64)
+
+        values = np.interp(rows, ys, vals)
+
+        # 範囲外は最も近い区間の傾きで外挿
+        if ys[1] != ys[0]:
+            above = rows < ys[0]
+            values[above] = vals[0] + (rows[above] - ys[0]) * (vals[1] - vals[0]) / (ys[1] - ys[0])
+        if ys[-1] != ys[-2]:
+            below = rows > ys[-1]
+            values[below] = vals[-1] + (rows[below] - ys[-1]) * (vals[-1] - vals[-2]) / (ys[-1] - ys[-2])
+        return values
+
+    def build_value_lut(self, height, zero_y=None):
+        """行番号→値のルックアップテーブルを構築（設定が変わらない限り再利用）
+
+        線形・非線形どちらのスケールも同じテーブル形式にコンパイルするため、
+        変換は values_from_y の一括ギャザーだけで済む。
+        """
+        zero_y = self.zero_y if zero_y is None else zero_y
+        nonlinear = bool(self.use_nonlinear_scale and self.scale_points and len(self.scale_points) >= 2)
+        key = (int(height), float(zero_y), float(self.scale), nonlinear,
+               tuple(self.scale_points) if nonlinear else None)
+        if self._value_lut_key == key:
+            return self._value_lut
+
+        # 最終行の次まで持たせて行間の補間に使う
+        rows = np.arange(int(height) + 1, dtype=np.float64)
+        if nonlinear:
+            lut = self._nonlinear_values(rows)
+        else:
+            lut = (zero_y - rows) * self.scale
+
+        self._value_lut_key = key
+        self._value_lut = lut
+        return lut
+
+    def values_from_y(self, y_coords, height, zero_y=None):
+        """Y座標の配列を値に一括変換（サブピクセルのYは行間を線形補間）"""
+        y_coords = np.asarray(y_coords, dtype=np.float64)
+        lut = self.build_value_lut(height, zero_y)
+
+        idx = np.clip(np.floor(y_coords).astype(np.int64), 0, len(lut) - 2)
+        frac = y_coords - idx
+        return lut[idx] + frac * (lut[idx + 1] - lut[idx])
+
     def setup_font(self):
         """フォント設定"""
         try:
@@ -137,53 +242,32 @@ class WebCompatibleAnalyzer:
             # フォント設定失敗時はデフォルトを使用
             pass
     
-    def crop_graph_area(self, image_path):
-        """グラフ領域の切り抜き（Pattern3: Zero Line Based）"""
-        img = cv2.imread(image_path)
+    def crop_graph_area(self, image_path, img=None):
+        """グラフ領域の切り抜き（Pattern3: Zero Line Based）
+
+        読み込み済みの画像（BGR）がある場合は img に渡すと再読み込みしない
+        """
+        if img is None:
+            img = cv2.imread(image_path)
         if img is None:
             print(f"Error: Could not read image {image_path}")
             return None
+        
+        # 基準幅に正規化（以降の座標は基準幅の画像に対する値）
+        img, self.scale_factor = normalize_resolution(img, self.reference_width)
             
         height, width = img.shape[:2]
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        
+        # 検出は縮小画像で行い、フル解像度は候補付近の行だけ参照する
+        small = reduce_image(img)
         
         # 1. オレンジバーを検出
-        orange_mask = cv2.inRange(hsv, np.array([10, 100, 100]), np.array([30, 255, 255]))
-        orange_bottom = 0
-        
-        # オレンジバーの最下端を検出
-        for y in range(height//2):
-            if np.sum(orange_mask[y, :]) > width * 0.3 * 255:
-                orange_bottom = y
-        
-        # オレンジバーの下端を正確に見つける
-        if orange_bottom > 0:
-            for y in range(orange_bottom, min(orange_bottom + 100, height)):
-                if np.sum(orange_mask[y, :]) < width * 0.1 * 255:
-                    orange_bottom = y
-                    break
-        else:
-            # デフォルト値を使用
-            orange_bottom = 150
+        orange_bottom = detect_orange_bottom_multires(img, small, bgr=True)
         
         # 2. ゼロライン検出（Pattern3の核心部分）
         search_start = orange_bottom + 50
         search_end = min(height - 100, orange_bottom + 400)
-        
-        best_score = 0
-        zero_line_y = (search_start + search_end) // 2
-        
-        for y in range(search_start, search_end):
-            row = gray[y, 100:width-100]
-            # 暗い水平線を探す
-            darkness = 1.0 - (np.mean(row) / 255.0)
-            uniformity = 1.0 - (np.std(row) / 128.0)
-            score = darkness * 0.5 + uniformity * 0.5
-            
-            if score > best_score:
-                best_score = score
-                zero_line_y = y
+        zero_line_y, best_score = find_zero_line_multires(img, small, search_start, search_end, bgr=True)
         
         # 3. ゼロラインから上下に拡張（Pattern3のアプローチ）
         graph_top = max(orange_bottom + 20, zero_line_y - 250)
@@ -246,7 +330,11 @@ class WebCompatibleAnalyzer:
             return self.zero_y
     
     def detect_graph_color(self, img, x):
-        """グラフの色を検出"""
+        """x付近（5カラム）のグラフの色を検出
+
+        色の優先順位は extract_graph_data と同じ（classes_by_columns）。
+        採用した色のピクセルが10以下の場合は 'unknown'。
+        """
         # 画像の有効性チェック
         if img is None or img.size == 0:
             return 'unknown', None
@@ -261,49 +349,60 @@ class WebCompatibleAnalyzer:
         if x < 2 or x >= width - 2:
             return 'unknown', None
             
-        try:
-            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        except Exception as e:
-            print(f"Error converting to HSV: {e}")
-            return 'unknown', None
-        
         # 安全な範囲でカラムを取得
         start_x = max(0, x - 2)
         end_x = min(width, x + 3)
-        column_hsv = hsv[:, start_x:end_x, :]
+        column = img[:, start_x:end_x, :]
         
         # カラムが空でないことを確認
-        if column_hsv.size == 0:
+        if column.size == 0:
             return 'unknown', None
         
-        for color_name, color_range in self.color_ranges.items():
-            try:
-                mask = cv2.inRange(column_hsv, color_range['lower'], color_range['upper'])
-                if cv2.countNonZero(mask) > 10:
-                    return color_name, mask
-            except Exception as e:
-                print(f"Error in color detection for {color_name}: {e}")
-                continue
+        try:
+            labels = self.classify_colors(column)
+        except Exception as e:
+            print(f"Error in color classification: {e}")
+            return 'unknown', None
+        
+        # 抽出と同じく、最もカラム数の多い色（同数の場合は先に定義された色）
+        counts, _ = column_class_stats(labels, len(self.color_ranges))
+        class_ids, _ = classes_by_columns(counts)
+        if class_ids:
+            mask = class_mask(labels, class_ids[0])
+            if np.count_nonzero(mask) > 10:
+                return list(self.color_ranges)[class_ids[0] - 1], np.where(mask, 255, 0).astype(np.uint8)
         
         return 'unknown', None
+
+    def classify_colors(self, img):
+        """BGR画像の全ピクセルを、該当する色のビット（色番号 = color_rangesの順番 + 1）に分類
+
+        色ごとの cv2.inRange と同じ判定（色範囲が重なるピクセルは両方の色に該当する）。
+        """
+        lut = load_color_lut(self.color_ranges)
+        return classify_pixels(img, lut, self.color_ranges)
     
-    def extract_graph_data(self, img):
-        """グラフデータの抽出（production版と同じロジック）"""
+    def _prepare_extraction(self, img):
+        """抽出の前処理（画像の確認・0ライン検出・色分類・カラム統計）
+
+        Returns:
+            (img, labels, counts, row_sums, step, detected_zero)。抽出できない場合は labels 以降がNone
+        """
         # 文字列（ファイルパス）が渡された場合は画像を読み込む
         if isinstance(img, str):
             img = cv2.imread(img)
             if img is None:
-                return [], "なし", self.zero_y
+                return None, None, None, None, None, self.zero_y
         
         # numpy配列でない場合やサイズが0の場合
         if img is None or not hasattr(img, 'shape') or img.size == 0:
-            return [], "なし", self.zero_y
+            return None, None, None, None, None, self.zero_y
             
         height, width = img.shape[:2]
         
         # サイズチェック
         if width < 10 or height < 10:
-            return [], "なし", self.zero_y
+            return None, None, None, None, None, self.zero_y
         
         # 0ライン検出
         detected_zero = self.detect_zero_line(img)
@@ -311,45 +410,730 @@ class WebCompatibleAnalyzer:
             self.zero_y = detected_zero
             self.scale = 30000 / max(1, (self.zero_y - self.target_30k_y))
         
-        # HSV変換
+        # 色分類テーブルで全ピクセルを1回で分類
+        try:
+            labels = self.classify_colors(img)
+        except:
+            return img, None, None, None, None, detected_zero
+
+        # 全色のカラム統計を1回で集計（高速モードはproduction版と同じ2ピクセルステップ）
+        step = 1 if self.extraction_mode in ('subpixel', 'trace') else 2
+        counts, row_sums = column_class_stats(labels[:, ::step], len(self.color_ranges))
+        return img, labels, counts, row_sums, step, detected_zero
+
+    def _extract_series(self, img, labels, counts, row_sums, class_id, step, detected_zero):
+        """色番号 class_id の1系列を抽出モードに従って [(x, value), ...] に変換"""
+        height, width = img.shape[:2]
         try:
-            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            if self.extraction_mode == 'subpixel':
+                # 全カラム・彩度重み付きのサブピクセル重心
+                mask = np.where(class_mask(labels, class_id), 255, 0).astype(np.uint8)
+                saturation = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)[:, :, 1]
+                x_coords, y_coords = self._subpixel_column_centroids(mask, saturation)
+            elif self.extraction_mode == 'trace':
+                # 直前のカラムの位置付近だけを探索してラインを追跡
+                x_coords, y_coords = self._trace_line(class_mask(labels, class_id), counts[class_id])
+            else:
+                valid = counts[class_id] > 0
+                x_coords = np.arange(0, width, step)[valid]
+                y_coords = row_sums[class_id][valid] / counts[class_id][valid]
+
+            # 線形・非線形とも事前構築したテーブルで一括変換
+            values = self.values_from_y(y_coords, height, zero_y=detected_zero)
+            # 値を±30,000の範囲にクリップ
+            values = np.clip(values, -30000, 30000)
+            return list(zip(x_coords.tolist(), values.tolist()))
         except:
+            return []
+
+    def extract_graph_data(self, img):
+        """グラフデータの抽出（production版と同じロジック）"""
+        if self.extraction_mode == 'cascade':
+            data_points, color, detected_zero, _ = self.extract_graph_data_cascade(img)
+            return data_points, color, detected_zero
+
+        expected_zero, expected_scale = self.zero_y, self.scale
+        img, labels, counts, row_sums, step, detected_zero = self._prepare_extraction(img)
+        if labels is None:
             return [], "なし", detected_zero
         
         best_result = []
         best_color = "なし"
-        max_points = 0
-        
-        # 各色でデータ抽出を試みる
-        for color_name, color_range in self.color_ranges.items():
-            try:
-                mask = cv2.inRange(hsv, color_range['lower'], color_range['upper'])
-                
-                data_points = []
-                for x in range(0, width, 2):  # production版と同じ2ピクセルステップ
-                    col_mask = mask[:, x]
-                    colored_pixels = np.where(col_mask > 0)[0]
-                    
-                    if len(colored_pixels) > 0:
-                        avg_y = np.mean(colored_pixels)
-                        # 非線形スケールを使用する場合
-                        if self.use_nonlinear_scale:
-                            value = self.calculate_value_nonlinear(avg_y)
-                        else:
-                            value = (detected_zero - avg_y) * self.scale
-                        # 値を±30,000の範囲にクリップ
-                        value = max(-30000, min(30000, value))
-                        data_points.append((x, value))
-                
-                if len(data_points) > max_points:
-                    max_points = len(data_points)
-                    best_result = data_points
-                    best_color = color_name
-            except:
-                continue
-        
+
+        # 最もカラム数の多い色を採用（同数の場合は先に定義された色）
+        class_ids, _ = classes_by_columns(counts)
+        if class_ids:
+            best_class = class_ids[0]
+            best_result = self._extract_series(img, labels, counts, row_sums, best_class, step, detected_zero)
+            if best_result:
+                best_color = list(self.color_ranges)[best_class - 1]
+                self.last_extraction = {
+                    'mode': self.extraction_mode,
+                    'step': step,
+                    'class_id': best_class,
+                    'color': best_color,
+                    'crop_shape': [int(v) for v in img.shape[:2]],
+                    'expected_zero': float(expected_zero),
+                    'expected_scale': float(expected_scale),
+                    'detected_zero': float(detected_zero),
+                    'scale': float(self.scale),
+                    'points': [[float(x), float(v)] for x, v in best_result],
+                }
+
+        # オプションの平滑化パス
+        if self.smoothing and best_result:
+            best_result = self.smooth_series(best_result, self.smoothing)
+
         return best_result, best_color, detected_zero
+
+    def extract_graph_data_incremental(self, img, previous):
+        """前回の抽出結果（同じ台の前のスクリーンショット）を再利用し、右側に増えたカラムだけを抽出
+
+        前回の系列から間引いたカラムだけを色分類して現在の画像と照合し（横方向に数ピクセルの
+        位置合わせを含む）、一致した場合は前回の系列の後ろに新しいカラムの抽出結果を追加する。
+
+        Args:
+            img: BGR画像（切り抜き済み、analyzer.zero_y / scale は通常の抽出と同じく設定済み）
+            previous: 前回の last_extraction
+
+        Returns:
+            (data_points, color, detected_zero, info): info は reused_points（再利用した点数）、
+            new_points（追加した点数）、shift（位置合わせのずれ）、match（照合の一致率）。
+            前回の結果を使えない場合は None（通常の抽出を行う）
+        """
+        if not previous or previous.get('mode') != self.extraction_mode or self.extraction_mode not in ('fast', 'subpixel'):
+            return None
+        if self.use_nonlinear_scale or img is None or not hasattr(img, 'shape') or img.size == 0:
+            return None
+
+        # 切り抜きの形・ゼロライン・スケールが前回と同じ場合だけ（画面レイアウトや設定が変わったら通常の抽出）
+        height, width = img.shape[:2]
+        if (list(previous['crop_shape']) != [height, width] or
+                abs(previous['expected_zero'] - self.zero_y) > 1e-6 or
+                abs(previous['expected_scale'] - self.scale) > 1e-6):
+            return None
+
+        points = np.asarray(previous['points'], dtype=np.float64)
+        if len(points) < self.incremental_probes:
+            return None
+        class_id, step = previous['class_id'], previous['step']
+        detected_zero = previous['detected_zero']
+        expected_zero, expected_scale = self.zero_y, self.scale
+        self.zero_y = detected_zero
+        self.scale = previous['scale']
+
+        def reject():
+            # 通常の抽出に戻すため、ゼロライン・スケールを呼び出し前の値に戻す
+            self.zero_y, self.scale = expected_zero, expected_scale
+            return None
+
+        # 前回の系列から等間隔に選んだカラムを照合（色分類するのは数十カラムだけ）
+        lut = load_color_lut(self.color_ranges)
+        rows = np.arange(height, dtype=np.float64)
+        probes = np.unique(np.linspace(0, len(points) - 1, self.incremental_probes).astype(int))
+        probe_x = points[probes, 0].astype(int)
+        probe_values = points[probes, 1]
+        tolerance = self.incremental_tolerance * self.scale
+
+        def match_rates(shifts):
+            # 全てのずれのカラムをまとめて1回で色分類（ずれ × 照合カラム）
+            columns = probe_x[np.newaxis, :] + shifts[:, np.newaxis]
+            inside = (columns >= 0) & (columns < width)
+            mask = class_mask(classify_pixels(img[:, np.clip(columns, 0, width - 1).ravel()], lut, self.color_ranges),
+                              class_id)
+            counts = mask.sum(axis=0)
+            y_coords = rows @ mask.astype(np.float64) / np.maximum(counts, 1)
+            values = self.values_from_y(y_coords, height, zero_y=detected_zero).reshape(columns.shape)
+            matched = inside & (counts.reshape(columns.shape) > 0) & (np.abs(values - probe_values) <= tolerance)
+            return matched.sum(axis=1) / len(probes)
+
+        # 通常はずれがないため、一致しない場合だけ前後数ピクセルで位置合わせ
+        best_shift, best_match = 0, float(match_rates(np.array([0]))[0])
+        if best_match < self.incremental_min_match:
+            shifts = np.arange(-self.incremental_max_shift, self.incremental_max_shift + 1)
+            rates = match_rates(shifts)
+            # 一致率が最も高いずれ（同じ一致率ならずれの小さい方）
+            best = np.lexsort((np.abs(shifts), -rates))[0]
+            best_shift, best_match = int(shifts[best]), float(rates[best])
+
+        if best_match < self.incremental_min_match:
+            return reject()
+
+        points[:, 0] += best_shift
+        points = points[points[:, 0] < width]
+        if len(points) == 0:
+            return reject()
+
+        # 前回の最後の数カラムから右を抽出（サブピクセルモードは極値判定のため少し手前から）
+        tail_count = min(len(points), self.incremental_tail_columns)
+        tail_start = int(points[-tail_count, 0])
+        margin = 8 if self.extraction_mode == 'subpixel' else 0
+        offset = max(0, tail_start - margin)
+        tail = img[:, offset:]
+        if self.extraction_mode == 'subpixel':
+            labels = classify_pixels(tail, lut, self.color_ranges)
+            sampled = labels[:, ::step]
+        else:
+            # 高速モードは間引いたカラムの統計しか使わないため、分類も間引いたカラムだけ
+            labels = sampled = classify_pixels(tail[:, ::step], lut, self.color_ranges)
+        counts, row_sums = column_class_stats(sampled, len(self.color_ranges))
+        current = {int(x) + offset: v
+                   for x, v in self._extract_series(tail, labels, counts, row_sums, class_id, step, detected_zero)}
+
+        # 前回の最後のカラムは全て現在の画像と一致し、現在の系列が前回の最後のカラムまで届いていること
+        # （照合の一致率だけでは、同じ台の古い・短いスクリーンショットに前回の長い系列を使ってしまう）
+        tail_tolerance = self.incremental_tail_tolerance * self.scale
+        for x, value in points[-tail_count:]:
+            if int(x) not in current or abs(current[int(x)] - value) > tail_tolerance:
+                return reject()
+        if max(current) < int(points[-1, 0]):
+            return reject()
+
+        merged = [(int(x), float(v)) for x, v in points]
+        start = int(points[-1, 0]) + step
+        new_points = [(x, v) for x, v in sorted(current.items()) if x >= start]
+        merged.extend(new_points)
+
+        self.last_extraction = dict(previous)
+        self.last_extraction['points'] = [[float(x), float(v)] for x, v in merged]
+
+        data_points = merged
+        if self.smoothing:
+            data_points = self.smooth_series(data_points, self.smoothing)
+
+        info = {
+            'reused_points': len(points),
+            'new_points': len(new_points),
+            'shift': best_shift,
+            'match': best_match,
+        }
+        return data_points, previous['color'], detected_zero, info
+
+    def update_running_stats(self, values, state=None):
+        """最大値・最小値・初当たり・大当りの合計を、前回の状態から再開して計算
+
+        初当たりと大当りの判定はWeb版の解析（streamlit_app_full.py）と同じ。
+        前回の状態を作った系列の後ろに値を追加した系列であれば、追加した部分だけを走査して
+        先頭から計算した場合と同じ結果になる。
+
+        Args:
+            values: 補正後の値の全系列
+            state: 前回の戻り値の 'resume'（Noneの場合は先頭から計算）
+
+        Returns:
+            dict: max_value / max_index / min_value / min_index / first_hit_index（なしは-1）/
+                  first_hit_value / final_value / total_jackpot_balls と、次回の再開用の resume
+        """
+        n = len(values)
+        min_payout = 100  # 最低払い出し玉数
+        if not state or state.get('n', 0) > n:
+            state = {
+                'n': 0,
+                'max_value': None, 'max_index': 0, 'min_value': None, 'min_index': 0,
+                'm1_next': 1, 'm1_hit': -1, 'm2_next': 5, 'm2_hit': -1,
+                'jackpot_next': 0, 'jackpot_total': 0,
+            }
+        state = dict(state)
+
+        # 最大値・最小値（同じ値は最初の位置）
+        for i in range(state['n'], n):
+            if state['max_value'] is None or values[i] > state['max_value']:
+                state['max_value'], state['max_index'] = values[i], i
+            if state['min_value'] is None or values[i] < state['min_value']:
+                state['min_value'], state['min_index'] = values[i], i
+
+        # 初当たり 方法1: 100玉以上の急激な増加（最大150点まで、次の点も上昇または維持、マイナス値から）
+        if state['m1_hit'] < 0:
+            stop = min(n - 2, 150)
+            for i in range(state['m1_next'], stop):
+                if (values[i + 1] - values[i] > min_payout and values[i + 2] >= values[i + 1] - 50
+                        and values[i] < 0):
+                    state['m1_hit'] = i
+                    break
+            else:
+                state['m1_next'] = max(state['m1_next'], stop)
+
+        # 初当たり 方法2: 減少傾向からの急上昇（方法1で見つからない場合）
+        if state['m1_hit'] < 0 and state['m2_hit'] < 0:
+            window_size = 5
+            for i in range(state['m2_next'], n - 2):
+                past_window = values[i - window_size:i]
+                avg_slope = (past_window[-1] - past_window[0]) / len(past_window)
+                if (avg_slope <= 0 and values[i + 1] - values[i] > min_payout
+                        and values[i + 2] > values[i + 1] - 50 and values[i] < 0):
+                    state['m2_hit'] = i
+                    break
+            else:
+                state['m2_next'] = max(state['m2_next'], n - 2)
+
+        first_hit_index = state['m1_hit'] if state['m1_hit'] >= 0 else state['m2_hit']
+
+        # 大当り: 100玉以上の増加から、50玉以上下降するまでの最大値までを獲得球数とする
+        # 系列の最後まで続いている大当りは確定させず、次回はその開始点から走査する
+        increase_threshold = 100
+        pending = 0
+        i = state['jackpot_next']
+        while i < n - 1:
+            if values[i + 1] - values[i] >= increase_threshold:
+                start_val = values[i]
+                j = i + 1
+                max_val_in_jackpot = values[j]
+                ended = False
+                while j < n - 1:
+                    if values[j + 1] > max_val_in_jackpot:
+                        max_val_in_jackpot = values[j + 1]
+                        j += 1
+                    elif values[j + 1] < values[j] - 50:
+                        ended = True
+                        break
+                    else:
+                        j += 1
+                jackpot_balls = max(0, max_val_in_jackpot - start_val)
+                if not ended:
+                    pending = jackpot_balls
+                    break
+                state['jackpot_total'] += jackpot_balls
+                i = j
+            else:
+                i += 1
+        state['jackpot_next'] = i
+        state['n'] = n
+
+        return {
+            'max_value': state['max_value'] if n else 0,
+            'max_index': state['max_index'],
+            'min_value': state['min_value'] if n else 0,
+            'min_index': state['min_index'],
+            'first_hit_index': first_hit_index,
+            'first_hit_value': values[first_hit_index] if first_hit_index >= 0 else 0,
+            'final_value': values[-1] if n else 0,
+            'total_jackpot_balls': state['jackpot_total'] + pending,
+            'resume': state,
+        }
+
+    def extract_graph_data_cascade(self, img, ocr_max_payout=None):
+        """信頼度カスケード: 高速モードで抽出し、信頼度がしきい値未満の場合だけ高精度モードで再抽出
+
+        Args:
+            img: BGR画像（切り抜き済み）またはファイルパス
+            ocr_max_payout: OCRで読み取った最高出玉（最大値の妥当性の確認に使用、省略可）
+
+        Returns:
+            (data_points, color, detected_zero, confidence): confidence は extraction_confidence の結果に
+            'mode'（採用した抽出モード）と 'fast_score'（高速モードの信頼度）を加えた辞書
+        """
+        if isinstance(img, str):
+            img = cv2.imread(img)
+            if img is None:
+                return [], "なし", self.zero_y, None
+
+        expected_zero = self.zero_y
+        mode = self.extraction_mode
+        try:
+            self.extraction_mode = 'fast'
+            data_points, color, detected_zero = self.extract_graph_data(img)
+            confidence = self.extraction_confidence(data_points, 2, detected_zero, expected_zero, ocr_max_payout)
+            confidence['mode'] = 'fast'
+            confidence['fast_score'] = confidence['score']
+
+            if data_points and confidence['score'] < self.cascade_threshold:
+                self.extraction_mode = self.cascade_precise_mode
+                precise_points, precise_color, precise_zero = self.extract_graph_data(img)
+                if precise_points:
+                    fast_score = confidence['score']
+                    data_points, color, detected_zero = precise_points, precise_color, precise_zero
+                    confidence = self.extraction_confidence(data_points, 1, detected_zero, expected_zero,
+                                                            ocr_max_payout)
+                    confidence['mode'] = self.cascade_precise_mode
+                    confidence['fast_score'] = fast_score
+        finally:
+            self.extraction_mode = mode
+
+        self.last_confidence = confidence
+        return data_points, color, detected_zero, confidence
+
+    def extraction_confidence(self, data_points, step, detected_zero, expected_zero, ocr_max_payout=None):
+        """抽出結果の信頼度（0〜1）
+
+        - coverage: 最初と最後のカラムの間で値が得られたカラムの割合（ラインの途切れ）
+        - continuity: 前後と逆方向に大きく跳ねる孤立した点（文字・マーカー）の少なさ
+        - zero_agreement: 抽出時に再検出したゼロラインと切り抜き時のゼロラインの一致度
+        - max_plausibility: 最大の上昇幅とOCRの最高出玉の比（OCRがない場合は評価しない）
+        """
+        if not data_points:
+            return {'score': 0.0, 'coverage': 0.0, 'continuity': 0.0, 'zero_agreement': 0.0,
+                    'max_plausibility': None}
+
+        x_coords = np.array([p[0] for p in data_points], dtype=np.float64)
+        values = np.array([p[1] for p in data_points], dtype=np.float64)
+
+        expected_points = (x_coords[-1] - x_coords[0]) / step + 1
+        coverage = min(1.0, len(data_points) / expected_points)
+
+        # 6ピクセル以上跳ねて次の点で逆方向に戻る点を孤立した外れ値とみなす
+        jumps = np.diff(values) / max(self.scale, 1e-6)
+        large = np.abs(jumps) > 6
+        spikes = int(np.sum(large[:-1] & large[1:] & (np.sign(jumps[:-1]) != np.sign(jumps[1:]))))
+        continuity = max(0.0, 1.0 - 10.0 * spikes / max(1, len(jumps)))
+
+        zero_agreement = max(0.0, 1.0 - abs(detected_zero - expected_zero) / 10.0)
+
+        max_plausibility = None
+        if ocr_max_payout:
+            # 50玉以上下がるまでを1回の上昇とみなした最大の上昇幅
+            largest_rise = 0.0
+            low = peak = values[0]
+            for value in values[1:]:
+                if value < peak - 50 or value < low:
+                    low = peak = value
+                else:
+                    peak = max(peak, value)
+                    largest_rise = max(largest_rise, peak - low)
+            ocr_max_payout = float(ocr_max_payout)
+            max_plausibility = min(largest_rise, ocr_max_payout) / max(largest_rise, ocr_max_payout)
+
+        # 重み付き平均（OCRがない場合は最大値の妥当性を除く）
+        weights = {'coverage': 0.4, 'continuity': 0.3, 'zero_agreement': 0.3}
+        scores = {'coverage': coverage, 'continuity': continuity, 'zero_agreement': zero_agreement}
+        if max_plausibility is not None:
+            weights = {'coverage': 0.3, 'continuity': 0.2, 'zero_agreement': 0.2, 'max_plausibility': 0.3}
+            scores['max_plausibility'] = max_plausibility
+        score = sum(weights[k] * scores[k] for k in weights)
+
+        return {
+            'score': float(score),
+            'coverage': float(coverage),
+            'continuity': float(continuity),
+            'zero_agreement': float(zero_agreement),
+            'max_plausibility': None if max_plausibility is None else float(max_plausibility),
+        }
+
+    def extract_all_series(self, img, min_coverage=None):
+        """カバー率がしきい値以上のすべての色の系列を1回の色分類から抽出（比較スクリーンショット用）
+
+        Args:
+            img: BGR画像（切り抜き済み）またはファイルパス
+            min_coverage: 系列とみなすカラムの割合（省略時は self.series_min_coverage）
+
+        アンチエイリアスによるラインの縁（黄色に対するオレンジなど）はカバー率が低いため、しきい値で除外する。
+
+        Returns:
+            (series, detected_zero): series はカラム数の多い順の
+            {'color', 'coverage', 'data_points', 'analysis'} のリスト（先頭は主系列）
+        """
+        if min_coverage is None:
+            min_coverage = self.series_min_coverage
+
+        img, labels, counts, row_sums, step, detected_zero = self._prepare_extraction(img)
+        if labels is None:
+            return [], detected_zero
+
+        color_names = list(self.color_ranges)
+        class_ids, columns_per_class = classes_by_columns(counts)
+        coverage = columns_per_class / max(1, counts.shape[1])
+
+        series = []
+        accepted_bits = np.uint16(0)
+        # カラム数の多い順（同数の場合は先に定義された色）
+        # 先頭は extract_graph_data と同じ主系列のため、カバー率に関係なく含める
+        for rank, class_id in enumerate(class_ids):
+            index = class_id - 1
+            if rank > 0 and coverage[index] < min_coverage:
+                continue
+            # 色範囲が重なる色（ピンクとマゼンタなど）は同じラインに該当するため、
+            # ピクセルの大半が採用済みの系列と共通の色は別の系列としない
+            mask = class_mask(labels, class_id)
+            if accepted_bits and np.count_nonzero(mask & ((labels & accepted_bits) > 0)) > \
+                    self.series_max_shared * np.count_nonzero(mask):
+                continue
+            data_points = self._extract_series(img, labels, counts, row_sums, class_id, step, detected_zero)
+            if not data_points:
+                continue
+            accepted_bits |= np.uint16(1 << index)
+            if self.smoothing:
+                data_points = self.smooth_series(data_points, self.smoothing)
+            series.append({
+                'color': color_names[index],
+                'coverage': float(coverage[index]),
+                'data_points': data_points,
+                'analysis': self.analyze_values(data_points),
+            })
+
+        return series, detected_zero
+
+    def _subpixel_column_centroids(self, mask, saturation):
+        """全カラムのサブピクセル重心を一括計算し、極値付近のみガウシアン補正する
+
+        アンチエイリアスされたラインの縁は彩度が低いため、彩度を重みとした
+        重心でサブピクセル位置を求める。ジャックポットのスパイクなど縦に伸びた
+        カラムでは重心が線分の中央に寄り最大値を過小評価するため、
+        山では上端、谷では下端をライン太さ分の帯で補正する。
+        """
+        height = mask.shape[0]
+        weights = np.where(mask > 0, saturation.astype(np.float64) + 1.0, 0.0)
+        totals = weights.sum(axis=0)
+        valid = totals > 0
+        if not np.any(valid):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        rows = np.arange(height, dtype=np.float64)
+        centroids = (rows @ weights)[valid] / totals[valid]
+
+        binary = mask[:, valid] > 0
+        tops = np.argmax(binary, axis=0)
+        bottoms = height - 1 - np.argmax(binary[::-1], axis=0)
+        # ライン太さは全カラムのピクセル数の中央値で推定
+        thickness = max(1, int(np.median(binary.sum(axis=0))))
+
+        x_coords = np.flatnonzero(valid)
+        y_coords = centroids.copy()
+        extent = bottoms - tops + 1
+
+        peaks, troughs = self._detect_extrema(centroids)
+        # 縦に伸びたカラムのみが補正対象（水平なラインでは重心で十分）
+        stretched = extent > thickness + 1
+        for idx in np.flatnonzero(peaks & stretched):
+            y_coords[idx] = self._gaussian_subpixel_peak(
+                weights[:, x_coords[idx]], tops[idx], tops[idx] + thickness)
+        for idx in np.flatnonzero(troughs & stretched):
+            y_coords[idx] = self._gaussian_subpixel_peak(
+                weights[:, x_coords[idx]], bottoms[idx] - thickness + 1, bottoms[idx] + 1)
+
+        return x_coords, y_coords
+
+    def _column_runs(self, column, start, stop):
+        """カラムの[start, stop)の範囲にある連続した一致ピクセルの区間 (top, bottom) を返す（bottomは含まない）"""
+        segment = column[start:stop].astype(np.int8)
+        edges = np.diff(np.concatenate(([0], segment, [0])))
+        tops = np.flatnonzero(edges == 1) + start
+        bottoms = np.flatnonzero(edges == -1) + start
+        return tops, bottoms
+
+    def _extend_run(self, column, top, bottom):
+        """探索帯の端に接している区間をカラム内で途切れるまで延長（スパイクなどの縦方向のジャンプ）"""
+        if top > 0 and column[top - 1]:
+            above = column[:top][::-1]
+            gap = np.flatnonzero(~above)
+            top -= int(gap[0]) if len(gap) else top
+        if bottom < len(column) and column[bottom]:
+            below = column[bottom:]
+            gap = np.flatnonzero(~below)
+            bottom += int(gap[0]) if len(gap) else len(below)
+        return top, bottom
+
+    def _trace_line(self, match, column_counts):
+        """一致マスクからラインを追跡してカラムごとのY座標を求める
+
+        最初に確実なカラム（区間が1つで太さが妥当）を起点に、左右へ直前のカラムの区間付近の帯だけを探索する。
+        帯の中に複数の区間がある場合は、一致の強さと縦方向のジャンプをコストとした
+        動的計画法（Viterbi）で経路を選ぶ。帯の中に区間がない場合だけ帯を広げる。
+        """
+        height, width = match.shape
+        present = np.flatnonzero(column_counts > 0)
+        if len(present) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        # ライン太さは全カラムのピクセル数の中央値で推定
+        thickness = max(1, int(np.median(column_counts[present])))
+
+        # 起点: 区間が1つで太さが妥当な最初のカラム（なければ最初のカラム）
+        seed_x = int(present[0])
+        for x in present:
+            tops, bottoms = self._column_runs(match[:, x], 0, height)
+            if len(tops) == 1 and bottoms[0] - tops[0] <= 3 * thickness:
+                seed_x = int(x)
+                break
+        seed_tops, seed_bottoms = self._column_runs(match[:, seed_x], 0, height)
+        if len(seed_tops) > 1:
+            # 起点に複数の区間がある場合は最も太さに近い区間
+            best = int(np.argmin(np.abs((seed_bottoms - seed_tops) - thickness)))
+            seed_tops, seed_bottoms = seed_tops[best:best + 1], seed_bottoms[best:best + 1]
+
+        right = self._trace_direction(match, column_counts, seed_x, seed_tops[0], seed_bottoms[0], 1, thickness)
+        left = self._trace_direction(match, column_counts, seed_x, seed_tops[0], seed_bottoms[0], -1, thickness)
+
+        seed_y = (seed_tops[0] + seed_bottoms[0] - 1) / 2.0
+        points = left[::-1] + [(seed_x, seed_y)] + right
+        x_coords = np.array([x for x, _ in points], dtype=np.int64)
+        y_coords = np.array([y for _, y in points], dtype=np.float64)
+        return x_coords, y_coords
+
+    def _trace_direction(self, match, column_counts, seed_x, seed_top, seed_bottom, direction, thickness):
+        """起点から一方向にラインを追跡（Viterbi）
+
+        Returns:
+            list: 起点を除く [(x, y), ...]（起点に近い順）
+        """
+        height, width = match.shape
+        max_strength = thickness + 1
+
+        # 各カラムの候補区間・累積コスト・直前カラムの候補番号
+        history = []
+        prev_tops = np.array([seed_top])
+        prev_bottoms = np.array([seed_bottom])
+        prev_costs = np.array([0.0])
+
+        x = seed_x + direction
+        while 0 <= x < width:
+            if column_counts[x] == 0:
+                # このカラムには一致ピクセルがない（マーカー等で隠れている）
+                x += direction
+                continue
+
+            column = match[:, x]
+            band = self.trace_band
+            while True:
+                start = max(0, int(prev_tops.min()) - band)
+                stop = min(height, int(prev_bottoms.max()) + band)
+                tops, bottoms = self._column_runs(column, start, stop)
+                if len(tops) > 0 or (start == 0 and stop == height):
+                    break
+                # 帯の中に区間がない場合だけ帯を広げる
+                band *= 2
+
+            if len(tops) == 0:
+                x += direction
+                continue
+
+            # 帯の端に接する区間は縦方向に延長（ジャックポットのスパイク）
+            for i in range(len(tops)):
+                if tops[i] == start or bottoms[i] == stop:
+                    tops[i], bottoms[i] = self._extend_run(column, int(tops[i]), int(bottoms[i]))
+
+            # 区間同士の縦方向の距離（重なっていれば0）
+            gaps = np.maximum(0, np.maximum(tops[:, None] - prev_bottoms[None, :],
+                                            prev_tops[None, :] - bottoms[:, None]))
+            transition = prev_costs[None, :] + self.trace_jump_cost * gaps
+            back = np.argmin(transition, axis=1)
+            strength = np.minimum(bottoms - tops, max_strength)
+            costs = transition[np.arange(len(tops)), back] - self.trace_match_weight * strength
+
+            history.append((x, tops, bottoms, back))
+            prev_tops, prev_bottoms, prev_costs = tops, bottoms, costs
+            x += direction
+
+        if not history:
+            return []
+
+        # 最小コストの経路を逆にたどる
+        points = []
+        index = int(np.argmin(prev_costs))
+        for x, tops, bottoms, back in reversed(history):
+            points.append((x, (tops[index] + bottoms[index] - 1) / 2.0))
+            index = int(back[index])
+        points.reverse()
+        return points
+
+    def _detect_extrema(self, y_coords, radius=3):
+        """Y座標列の局所的な山（Y最小）と谷（Y最大）を検出"""
+        n = len(y_coords)
+        if n < 3:
+            return np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)
+
+        window = min(2 * radius + 1, n if n % 2 == 1 else n - 1)
+        padded = np.pad(y_coords, window // 2, mode='edge')
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+        peaks = y_coords <= windows.min(axis=1)
+        troughs = y_coords >= windows.max(axis=1)
+        return peaks, troughs
+
+    def _gaussian_subpixel_peak(self, column_weights, start, stop, sigma=1.0):
+        """ガウシアン重み付き重心による帯内のサブピクセル位置推定"""
+        start = max(0, int(start) - 1)
+        stop = min(len(column_weights), int(stop) + 1)
+        y_range = np.arange(start, stop, dtype=np.float64)
+        values = column_weights[start:stop]
+
+        if values.sum() == 0:
+            return float((start + stop - 1) / 2)
+
+        center = np.average(y_range, weights=values)
+        gaussian = np.exp(-0.5 * ((y_range - center) / sigma) ** 2)
+        return float(np.average(y_range, weights=values * gaussian))
+
+    def smooth_series(self, data_points, method='adaptive'):
+        """抽出済みデータ [(x, value), ...] に平滑化を適用"""
+        if method not in ('hampel', 'median', 'adaptive'):
+            print(f"Warning: Unknown smoothing method '{method}'")
+            return data_points
+        if len(data_points) < 5:
+            return data_points
+
+        x_coords = [p[0] for p in data_points]
+        values = np.array([p[1] for p in data_points], dtype=np.float64)
+
+        if method == 'hampel':
+            smoothed = self.hampel_filter(values)
+        elif method == 'median':
+            smoothed = self.median_filter(values)
+        else:
+            smoothed = self.adaptive_smoothing(values)
+
+        smoothed = np.clip(smoothed, -30000, 30000)
+        return list(zip(x_coords, smoothed.tolist()))
+
+    def _sliding_windows(self, values, window_size):
+        """端をNaNで埋めたスライディングウィンドウ（端では窓が短くなる）"""
+        half = window_size // 2
+        padded = np.pad(values.astype(np.float64), half, mode='constant', constant_values=np.nan)
+        return np.lib.stride_tricks.sliding_window_view(padded, window_size)
+
+    def hampel_filter(self, values, window_size=7, n_sigmas=3.0):
+        """Hampelフィルタによる外れ値除去（ベクトル化版）"""
+        if window_size % 2 == 0:
+            window_size += 1
+        if len(values) < window_size:
+            return values.copy()
+
+        windows = self._sliding_windows(values, window_size)
+        median = np.nanmedian(windows, axis=1)
+        mad = np.nanmedian(np.abs(windows - median[:, None]), axis=1)
+
+        outliers = (mad > 0) & (np.abs(values - median) > n_sigmas * 1.4826 * mad)
+        return np.where(outliers, median, values)
+
+    def median_filter(self, values, kernel_size=5):
+        """メディアンフィルタ（ベクトル化版）"""
+        if kernel_size % 2 == 0:
+            kernel_size += 1
+        if len(values) < kernel_size:
+            return values.copy()
+
+        return np.nanmedian(self._sliding_windows(values, kernel_size), axis=1)
+
+    def _savgol_coefficients(self, window_size, polyorder):
+        """Savitzky-Golayフィルタの畳み込み係数（中央点の多項式フィット）"""
+        half = window_size // 2
+        offsets = np.arange(-half, half + 1, dtype=np.float64)
+        vander = np.vander(offsets, polyorder + 1, increasing=True)
+        return np.linalg.pinv(vander)[0]
+
+    def adaptive_smoothing(self, values, window_size=11, edge_ratio=0.15):
+        """エッジ保護付きの適応的スムージング
+
+        Hampel → メディアン → Savitzky-Golayの順に処理し、
+        系列の両端は元データとブレンドして終端値の歪みを防ぐ。
+        """
+        n = len(values)
+        window_size = min(window_size, n // 5)
+        if window_size % 2 == 0:
+            window_size += 1
+        if window_size < 5:
+            return self.median_filter(values, kernel_size=3) if n > 3 else values.copy()
+
+        cleaned = self.median_filter(self.hampel_filter(values), kernel_size=3)
+
+        half = window_size // 2
+        padded = np.pad(cleaned, half, mode='edge')
+        smoothed = np.convolve(padded, self._savgol_coefficients(window_size, 2)[::-1], mode='valid')
+
+        # 両端は二次関数で元データへ滑らかに遷移
+        edge_size = max(5, int(n * edge_ratio))
+        ramp = (np.arange(edge_size) / edge_size) ** 2
+        weights = np.ones(n)
+        weights[:edge_size] = ramp[:n]
+        weights[-edge_size:] = np.minimum(weights[-edge_size:], ramp[::-1][-n:])
+        return values * (1 - weights) + smoothed * weights
     
     def analyze_values(self, data_points):
         """値の分析（data_pointsは(x, value)のタプルリスト）"""
@@ -585,7 +1369,10 @@ class WebCompatibleAnalyzer:
             }
     
     def create_analysis_image(self, cropped_img, data_points, detected_color, detected_zero, analysis, output_path):
-        """解析結果の可視化画像作成（production版と同じオーバーレイ形式）"""
+        """解析結果の可視化画像作成（production版と同じオーバーレイ形式）
+
+        output_path が None の場合は保存せず、画像の配列（BGR）を返す
+        """
         if not data_points:
             return
             
@@ -683,16 +1470,53 @@ class WebCompatibleAnalyzer:
         
         # 余白を最小化
         plt.tight_layout()
+        if output_path is None:
+            image = self._figure_to_array(fig, dpi=150)
+            plt.close()
+            return image
         plt.savefig(output_path, dpi=150, bbox_inches='tight', facecolor='white')
         plt.close()
+
+    def _figure_to_array(self, fig, dpi):
+        """図を描画して配列（BGR）にする（savefig の bbox_inches='tight' と同じく余白を切り詰める）"""
+        fig.set_dpi(dpi)
+        fig.canvas.draw()
+        rgba = np.asarray(fig.canvas.buffer_rgba())
+        height, width = rgba.shape[:2]
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(matplotlib.rcParams['savefig.pad_inches'])
+        x0 = max(0, int(np.floor(bbox.x0 * dpi)))
+        x1 = min(width, int(np.ceil(bbox.x1 * dpi)))
+        y0 = max(0, int(np.floor(height - bbox.y1 * dpi)))
+        y1 = min(height, int(np.ceil(height - bbox.y0 * dpi)))
+        return cv2.cvtColor(np.ascontiguousarray(rgba[y0:y1, x0:x1]), cv2.COLOR_RGBA2BGR)
     
-    def process_single_image(self, image_path, output_dir):
-        """単一画像の処理"""
+    def process_single_image(self, image_path, output_dir, img=None, images=None):
+        """単一画像の処理
+
+        読み込み済みの画像（BGR）がある場合は img に渡すと再読み込みしない。
+        images に辞書を渡すと、切り抜き画像と可視化画像をファイルに保存せず
+        配列（BGR）として images['cropped'] / images['overlay'] に入れる（結果のファイル名は同じ）。
+        """
         try:
             print(f"Processing: {image_path}")
             
+            # 事前チェック（グラフ画面でない・品質が低い画像は切り抜きと抽出の前に打ち切る）
+            if img is None:
+                img = cv2.imread(image_path)
+            preflight = preflight_check(img, self.color_ranges, bgr=True)
+            if preflight['status'] != 'graph':
+                print(f"Warning: Preflight rejected {image_path}: {preflight['reason']}")
+                return {
+                    'filename': os.path.basename(image_path),
+                    'error': f"事前チェックで除外: {preflight['reason']}",
+                    'preflight': preflight,
+                    'analysis': self.analyze_values([]),
+                    'data_points': 0,
+                    'visualization': None
+                }
+            
             # グラフ領域の切り抜き
-            cropped = self.crop_graph_area(image_path)
+            cropped = self.crop_graph_area(image_path, img=img)
             if cropped is None:
                 print(f"Warning: Could not crop graph area from {image_path}")
                 # エラー情報を含む結果を返す
@@ -717,9 +1541,12 @@ class WebCompatibleAnalyzer:
             
             # 切り抜いた画像を保存（デバッグ用）
             base_name = Path(image_path).stem
-            cropped_path = os.path.join(output_dir, f"cropped_{base_name}.png")
-            cv2.imwrite(cropped_path, cropped)
-            print(f"Saved cropped image to: {cropped_path}")
+            cropped_path = os.path.join(output_dir or '', f"cropped_{base_name}.png")
+            if images is None:
+                cv2.imwrite(cropped_path, cropped)
+                print(f"Saved cropped image to: {cropped_path}")
+            else:
+                images['cropped'] = cropped
             
             # データ抽出（production版形式）
             data_points, detected_color, detected_zero = self.extract_graph_data(cropped)
@@ -733,7 +1560,8 @@ class WebCompatibleAnalyzer:
                     'analysis': self.analyze_values(data_points),
                     'data_points': len(data_points),
                     'visualization': None,
-                    'detected_color': detected_color
+                    'detected_color': detected_color,
+                    'scale_factor': self.scale_factor
                 }
                 return error_result
             
@@ -741,8 +1569,12 @@ class WebCompatibleAnalyzer:
             analysis = self.analyze_values(data_points)
             
             # 結果画像作成（production版と同じファイル名）
-            vis_path = os.path.join(output_dir, f"professional_analysis_{base_name}.png")
-            self.create_analysis_image(cropped, data_points, detected_color, detected_zero, analysis, vis_path)
+            vis_path = os.path.join(output_dir or '', f"professional_analysis_{base_name}.png")
+            if images is None:
+                self.create_analysis_image(cropped, data_points, detected_color, detected_zero, analysis, vis_path)
+            else:
+                images['overlay'] = self.create_analysis_image(cropped, data_points, detected_color,
+                                                               detected_zero, analysis, None)
             
             # 結果を保存
             result = {
@@ -752,7 +1584,11 @@ class WebCompatibleAnalyzer:
                 'visualization': os.path.basename(vis_path),
                 'detected_color': detected_color,
                 'error': None,
-                'cropped_image': os.path.basename(cropped_path)
+                'cropped_image': os.path.basename(cropped_path),
+                'scale_factor': self.scale_factor,
+                'preflight': preflight,
+                'confidence': self.last_confidence if self.extraction_mode == 'cascade' else None,
+                'series': data_points
             }
             
             self.results.append(result)
@@ -1066,4 +1902,61 @@ class WebCompatibleAnalyzer:
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(html_content)
         
-        return output_path
\ No newline at end of file
+        return output_path
+
+    def report_summary(self):
+        """レポートの集計（処理画像数・全体の最高値/最低値・初当たり検出数など）"""
+        analyses = [r['analysis'] for r in self.results if not r.get('error') and r.get('analysis')]
+        summary = [('処理画像数', f"{len(self.results)}", '')]
+        if analyses:
+            overall_max = max(a['max_value'] for a in analyses)
+            overall_min = min(a['min_value'] for a in analyses)
+            average_final = sum(a['final_value'] for a in analyses) / len(analyses)
+            summary += [
+                ('全体最高値', f"+{overall_max:,}", 'positive'),
+                ('全体最低値', f"{overall_min:,}", 'negative'),
+                ('平均最終値', f"{average_final:+,.0f}", 'positive' if average_final >= 0 else 'negative'),
+                ('初当たり検出数', f"{sum(1 for a in analyses if a['first_hit_index'] >= 0)}", ''),
+            ]
+        error_count = len(self.results) - len(analyses)
+        if error_count:
+            summary.append(('エラー', f"{error_count}", 'negative'))
+        return summary
+
+    def generate_paged_report(self, output_path, image_dir='images'):
+        """ページ分割のHTMLレポート生成（枚数が多い場合向け）
+
+        結果は <名前>_data.js に、画像は thumbs/ のサムネイルにして、ブラウザで1ページ分ずつ描画する。
+        image_dir は結果画像のディレクトリ（HTMLからの相対パス）。
+
+        Returns:
+            list: 書き出したファイル（HTMLの場所からの相対パス）
+        """
+        timestamp = datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')
+        cards = []
+        for result in self.results:
+            analysis = result.get('analysis') or {}
+            card = {
+                'title': result['filename'],
+                'image': f"{image_dir}/{result['visualization']}" if result.get('visualization') else None,
+                'error': result.get('error'),
+                'fields': [],
+                'sort': {},
+            }
+            if not result.get('error') and analysis:
+                card['fields'] = [
+                    ('最高値', f"{analysis['max_value']:,}玉", 'positive' if analysis['max_value'] > 0 else ''),
+                    ('最低値', f"{analysis['min_value']:,}玉", 'negative'),
+                    ('最終値', f"{analysis['final_value']:,}玉", ''),
+                    ('初当たり', '検出' if analysis['first_hit_index'] >= 0 else '未検出', ''),
+                    ('検出色', result.get('detected_color') or 'なし', ''),
+                ]
+                card['sort'] = {key: analysis[key] for key in ('max_value', 'min_value', 'final_value')}
+            cards.append(card)
+
+        return write_paged_report(
+            output_path, cards, self.report_summary(),
+            title='パチンコグラフ解析レポート',
+            subtitle=f'処理日時: {timestamp}',
+            footer=f'Version {__version__} (Build {__build__})',
+        )